@@ -0,0 +1,39 @@
+import pytest
+
+from ircproto.connection import IRCClientConnection, IRCServerConnection
+from ircproto.constants import RPL_TOPIC, RPL_WELCOME, ERR_NOSUCHNICK, RPL_WHOREPLY
+from ircproto.replay import chunked, privmsg_storm
+from ircproto.states import IRCServer
+
+traffic = b''.join(privmsg_storm(1000))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 64, 512, 4096, len(traffic)])
+def test_feed_data(benchmark, chunk_size):
+    chunks = list(chunked(traffic, chunk_size))
+
+    def feed():
+        conn = IRCClientConnection()
+        for chunk in chunks:
+            conn.feed_data(chunk)
+
+    benchmark(feed)
+
+
+@pytest.mark.parametrize('code, templatevars', [
+    (RPL_WELCOME, {'nickname': 'nick', 'username': '~user', 'host': 'host.example.org'}),
+    (RPL_TOPIC, {'channel': '#channel', 'topic': 'the topic of the channel'}),
+    (RPL_WHOREPLY, {'channel': '#channel', 'user': '~user', 'host': 'host.example.org',
+                    'server': 'irc.example.org', 'nick': 'nick', 'flags': 'H@', 'hop_count': 0,
+                    'real_name': 'Real Name'}),
+    (ERR_NOSUCHNICK, {'nickname': 'nobody'})
+], ids=['welcome', 'topic', 'whoreply', 'nosuchnick'])
+def test_send_reply(benchmark, code, templatevars):
+    conn = IRCServerConnection('host.example.org', IRCServer('irc.example.org'))
+    conn.nickname = 'nick'
+
+    def send_reply():
+        conn.send_reply(code, **templatevars)
+        conn.data_to_send()
+
+    benchmark(send_reply)
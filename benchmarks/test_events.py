@@ -0,0 +1,84 @@
+import pytest
+
+from ircproto.events import commands, decode_event, decode_raw_event
+
+command_args = {
+    'PASS': ('secret',),
+    'NICK': ('newnick',),
+    'USER': ('guest', '0', 'Real Name'),
+    'OPER': ('admin', 'secret'),
+    'MODE': ('#channel', '+ov', 'nick1', 'nick2'),
+    'SERVICE': ('dict', '*.fr', '0', 'French dictionary'),
+    'QUIT': ('Gone to lunch',),
+    'SQUIT': ('tolsun.oulu.fi', 'Bad Link ?'),
+    'JOIN': ('#channel',),
+    'PART': ('#channel', 'bye now'),
+    'TOPIC': ('#channel', 'new topic here'),
+    'NAMES': (),
+    'LIST': (),
+    'INVITE': ('nick', '#channel'),
+    'KICK': ('#channel', 'nick', 'no reason'),
+    'PRIVMSG': ('#channel', 'hello there everyone, how are you all doing today?'),
+    'NOTICE': ('nick', 'hello there'),
+    'MOTD': (),
+    'LUSERS': (),
+    'VERSION': ('*.fi',),
+    'STATS': ('m',),
+    'LINKS': ('*.au',),
+    'TIME': ('tolsun.oulu.fi',),
+    'CONNECT': ('tolsun.oulu.fi', '6667'),
+    'TRACE': ('*.oulu.fi',),
+    'ADMIN': ('tolsun.oulu.fi',),
+    'INFO': ('csd.bu.edu',),
+    'KILL': ('nick', 'spamming'),
+    'PING': ('irc.example.org',),
+    'PONG': ('irc.example.org',),
+    'ERROR': ('Closing link',),
+    'AWAY': ('gone fishing',),
+    'REHASH': (),
+    'DIE': (),
+    'RESTART': (),
+    'SUMMON': ('jto',),
+    'USERS': ('eff.org',),
+    'WALLOPS': ('wall message here',),
+    'USERHOST': ('nick1', 'nick2'),
+    'ISON': ('nick1', 'nick2', 'nick3'),
+    'CAP': ('REQ', 'multi-prefix sasl', '*'),
+    'AUTHENTICATE': ('PLAIN',),
+    'BATCH': ('+yXNAbvnRHTRBv', 'netsplit', 'irc.hub', 'other.host'),
+    'SJOIN': ('1234567890', '#channel', '+ntk', 'secret', '@nick1 +nick2 nick3 nick4')
+}
+command_words = sorted(commands)
+sender = 'nick!~user@host.example.org'
+
+
+@pytest.mark.parametrize('command', command_words)
+def test_encode(benchmark, command):
+    event = commands[command](sender, *command_args[command])
+    benchmark(event.encode)
+
+
+@pytest.mark.parametrize('command', command_words)
+def test_decode(benchmark, command):
+    line = commands[command](sender, *command_args[command]).encode().encode('utf-8')
+    benchmark(lambda: decode_event(bytearray(line)))
+
+
+@pytest.mark.parametrize('line', [
+    b':irc.example.org 001 nick :Welcome to the Internet Relay Network nick!~user@host\r\n',
+    b':irc.example.org 353 nick = #channel :@op +voice nick1 nick2 nick3 nick4 nick5\r\n',
+    b':irc.example.org 433 * nick :Nickname is already in use\r\n'
+], ids=['welcome', 'namreply', 'error'])
+def test_decode_reply(benchmark, line):
+    benchmark(lambda: decode_event(bytearray(line)))
+
+
+def test_decode_tagged(benchmark):
+    line = (b'@time=2017-01-01T12:00:00.000Z;msgid=63E1033A051D4B41B1AB1FA3CF4B243E '
+            b':nick!~user@host.example.org PRIVMSG #channel :hello there\r\n')
+    benchmark(lambda: decode_event(bytearray(line)))
+
+
+def test_decode_raw(benchmark):
+    line = b':nick!~user@host.example.org PRIVMSG #channel :hello there everyone\r\n'
+    benchmark(lambda: decode_raw_event(bytearray(line)).params)
@@ -0,0 +1,56 @@
+import pytest
+
+from ircproto.connection import IRCServerConnection
+from ircproto.events import Join
+from ircproto.link import ServerLink
+from ircproto.states import IRCServer
+
+
+def make_client(server, nickname):
+    connection = IRCServerConnection('%s.example.org' % nickname, server)
+    connection.nickname = nickname
+    connection.username = '~' + nickname
+    server.add_client_connection(connection)
+    return connection
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = IRCServer('irc1.example.org')
+    clients = [make_client(server, 'user%d' % i) for i in range(1000)]
+    for i in range(100):
+        for client in clients[i * 10:i * 10 + 50]:
+            server.handle_join(client, Join(None, '#channel%d' % i))
+
+    for client in clients:
+        client.data_to_send()
+
+    return server
+
+
+@pytest.mark.parametrize('compress', [False, True], ids=['plain', 'zlib'])
+def test_burst(benchmark, server, compress):
+    def burst():
+        link = ServerLink(server, 'irc2.example.org', compress)
+        link.attach(IRCServerConnection('irc2.example.org', server))
+        link.burst()
+        link.data_to_send()
+        link.detach()
+
+    benchmark(burst)
+
+
+def test_apply_burst(benchmark, server):
+    link = ServerLink(server, 'irc2.example.org')
+    link.attach(IRCServerConnection('irc2.example.org', server))
+    link.burst()
+    data = link.data_to_send()
+    link.detach()
+
+    def apply(data):
+        remote = IRCServer('irc2.example.org')
+        remote_link = ServerLink(remote, 'irc1.example.org')
+        remote_link.attach(IRCServerConnection('irc1.example.org', remote))
+        remote_link.feed_data(data)
+
+    benchmark(apply, data)
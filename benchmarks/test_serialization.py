@@ -0,0 +1,14 @@
+from ircproto.events import decode_event
+from ircproto.serialization import deserialize_events, serialize_events
+
+lines = [b':nick%d!~user@host.example.org PRIVMSG #channel :hello there everyone\r\n' % (i % 20)
+         for i in range(100)]
+events = [decode_event(bytearray(line)) for line in lines]
+
+
+def test_serialize(benchmark):
+    benchmark(serialize_events, events)
+
+
+def test_deserialize(benchmark):
+    benchmark(deserialize_events, serialize_events(events))
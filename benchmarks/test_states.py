@@ -0,0 +1,36 @@
+import pytest
+
+from ircproto.connection import IRCServerConnection
+from ircproto.events import Join
+from ircproto.states import IRCServer
+
+
+def make_client(server, nickname):
+    connection = IRCServerConnection('%s.example.org' % nickname, server)
+    connection.nickname = nickname
+    connection.username = '~' + nickname
+    server.add_client_connection(connection)
+    return connection
+
+
+@pytest.mark.parametrize('members', [10, 1000, 10000])
+def test_handle_join(benchmark, members):
+    server = IRCServer('irc.example.org')
+    for i in range(members):
+        server.handle_join(make_client(server, 'user%d' % i), Join(None, '#channel'))
+
+    channel = server.channels['#channel']
+    channel.bans = ['*!*@banned%d.example.org' % i for i in range(20)]
+    joiner = make_client(server, 'joiner')
+    event = Join(None, '#channel')
+
+    def setup():
+        if channel.users[-1] is joiner:
+            channel.users.pop()
+
+        for conn in channel.users:
+            conn.data_to_send()
+
+        return (joiner, event), {}
+
+    benchmark.pedantic(server.handle_join, setup=setup, rounds=20)
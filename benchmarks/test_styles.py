@@ -0,0 +1,40 @@
+import pytest
+
+from ircproto.styles import (
+    IRCTextColor, IRCTextStyle, compile_style, strip_styles, styled, styles_to_ansi,
+    styles_to_html)
+
+plain_text = 'just plain text without any formatting whatsoever'
+styled_text = ('\x02bold\x02 and \x0304,12coloured\x03 text with \x1ditalics\x1d and '
+               '\x1funderline\x0f')
+
+
+@pytest.mark.parametrize('text', [plain_text, styled_text], ids=['plain', 'styled'])
+def test_strip_styles(benchmark, text):
+    benchmark(strip_styles, text)
+
+
+@pytest.mark.parametrize('text', [plain_text, styled_text], ids=['plain', 'styled'])
+def test_styles_to_html(benchmark, text):
+    benchmark(styles_to_html, text)
+
+
+@pytest.mark.parametrize('text', [plain_text, styled_text], ids=['plain', 'styled'])
+def test_styles_to_ansi(benchmark, text):
+    benchmark(styles_to_ansi, text)
+
+
+@pytest.mark.parametrize('args', [
+    (IRCTextColor.red, None, None),
+    (IRCTextColor.red, IRCTextColor.black, None),
+    (None, None, IRCTextStyle.bold),
+    (IRCTextColor.red, IRCTextColor.black, [IRCTextStyle.bold, IRCTextStyle.underline])
+], ids=['foreground', 'both_colors', 'style', 'colors_styles'])
+def test_styled(benchmark, args):
+    benchmark(styled, 'status: all systems operational', *args)
+
+
+def test_compiled_style(benchmark):
+    template = compile_style(IRCTextColor.red, IRCTextColor.black,
+                             [IRCTextStyle.bold, IRCTextStyle.underline])
+    benchmark(template, 'status: all systems operational')
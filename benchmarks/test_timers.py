@@ -0,0 +1,39 @@
+from ircproto.timers import TimerWheel
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def noop():
+    pass
+
+
+def test_schedule_cancel(benchmark):
+    wheel = TimerWheel(clock=FakeClock())
+    for i in range(100000):
+        wheel.call_later(i % 300, noop)
+
+    def schedule_cancel():
+        wheel.call_later(120, noop).cancel()
+
+    benchmark(schedule_cancel)
+
+
+def test_advance(benchmark):
+    # 100000 pending timers, about 333 of which expire on each tick
+    clock = FakeClock()
+    wheel = TimerWheel(clock=clock)
+
+    def setup():
+        while len(wheel) < 100000:
+            wheel.call_later(1 + len(wheel) % 300, noop)
+
+        clock.now += 1
+        return (), {}
+
+    benchmark.pedantic(wheel.advance, setup=setup, rounds=200)
@@ -0,0 +1,13 @@
+import pytest
+
+from ircproto.utils import match_hostmask
+
+
+@pytest.mark.parametrize('prefix, mask', [
+    (b'nick!~user@host.example.org', b'nick!~user@host.example.org'),
+    (b'nick!~user@host.example.org', b'*!*@*.example.org'),
+    (b'nick!~user@host.example.org', b'n?ck!*@host.*'),
+    (b'nick!~user@host.example.org', b'other!*@*')
+], ids=['literal', 'wildcard_host', 'mixed', 'mismatch'])
+def test_match_hostmask(benchmark, prefix, mask):
+    benchmark(match_hostmask, prefix, mask)
@@ -3,7 +3,6 @@ from __future__ import print_function, unicode_literals
 from argparse import ArgumentParser
 
 from ircproto.connection import IRCClientConnection
-from ircproto.constants import RPL_MYINFO
 from ircproto.events import Reply, Error, Join
 
 try:
@@ -22,8 +21,8 @@ class MessageSendProtocol(Protocol):
 
     def connection_made(self, transport):
         self.transport = transport
-        self.conn.send_command('NICK', self.nickname)
-        self.conn.send_command('USER', 'ircproto', '0', 'ircproto example client')
+        self.conn.register(self.nickname, 'ircproto', 'ircproto example client')
+        self.conn.join(self.channel)
         self.send_outgoing_data()
 
     def connection_lost(self, exc):
@@ -33,12 +32,9 @@ class MessageSendProtocol(Protocol):
         close_connection = False
         for event in self.conn.feed_data(data):
             print('<<< ' + event.encode().rstrip())
-            if isinstance(event, Reply):
-                if event.is_error:
-                    self.transport.abort()
-                    return
-                elif event.code == RPL_MYINFO:
-                    self.conn.send_command('JOIN', self.channel)
+            if isinstance(event, Reply) and event.is_error and self.conn.registered:
+                self.transport.abort()
+                return
             elif isinstance(event, Join):
                 self.conn.send_command('PRIVMSG', self.channel, self.message)
                 self.conn.send_command('QUIT')
@@ -3,7 +3,6 @@ from argparse import ArgumentParser
 import curio
 
 from ircproto.connection import IRCClientConnection
-from ircproto.constants import RPL_MYINFO
 from ircproto.events import Reply, Error, Join
 
 
@@ -19,18 +18,15 @@ async def send_message_to_channel(host, port, nickname, channel, message):
     sock = await curio.open_connection(host, port)
     async with sock:
         conn = IRCClientConnection()
-        conn.send_command('NICK', nickname)
-        conn.send_command('USER', 'ircproto', '0', 'ircproto example client')
+        conn.register(nickname, 'ircproto', 'ircproto example client')
+        conn.join(channel)
         await send_outgoing_data()
         while True:
             data = await sock.recv(10000)
             for event in conn.feed_data(data):
                 print('<<< ' + event.encode().rstrip())
-                if isinstance(event, Reply):
-                    if event.is_error:
-                        return
-                    elif event.code == RPL_MYINFO:
-                        conn.send_command('JOIN', channel)
+                if isinstance(event, Reply) and event.is_error and conn.registered:
+                    return
                 elif isinstance(event, Join):
                     conn.send_command('PRIVMSG', channel, message)
                     conn.send_command('QUIT')
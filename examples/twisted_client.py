@@ -3,62 +3,51 @@ from __future__ import print_function, unicode_literals
 from argparse import ArgumentParser
 
 from twisted.internet import reactor
-from twisted.internet.protocol import Protocol, connectionDone, ClientFactory
+from twisted.internet.protocol import connectionDone, ClientFactory
 
-from ircproto.connection import IRCClientConnection
-from ircproto.constants import RPL_MYINFO
 from ircproto.events import Reply, Error, Join
+from ircproto.twisted import IRCClientProtocol
 
 
-class IRCProtocol(Protocol):
+class MessageSendProtocol(IRCClientProtocol):
     def __init__(self, nickname, channel, message):
+        super(MessageSendProtocol, self).__init__()
         self.nickname = nickname
         self.channel = channel
         self.message = message
-        self.conn = IRCClientConnection()
 
     def connectionMade(self):
-        self.conn.send_command('NICK', self.nickname)
-        self.conn.send_command('USER', 'ircproto', '0', 'ircproto example client')
-        self.send_outgoing_data()
+        self.conn.register(self.nickname, 'ircproto', 'ircproto example client')
+        self.conn.join(self.channel)
+        super(MessageSendProtocol, self).connectionMade()
 
     def connectionLost(self, reason=connectionDone):
+        super(MessageSendProtocol, self).connectionLost(reason)
         reactor.stop()
 
-    def dataReceived(self, data):
-        close_connection = False
-        for event in self.conn.feed_data(data):
-            print('<<< ' + event.encode().rstrip())
-            if isinstance(event, Reply):
-                if event.is_error:
-                    self.transport.abortConnection()
-                    return
-                elif event.code == RPL_MYINFO:
-                    self.conn.send_command('JOIN', self.channel)
-            elif isinstance(event, Join):
-                self.conn.send_command('PRIVMSG', self.channel, self.message)
-                self.conn.send_command('QUIT')
-                close_connection = True
-            elif isinstance(event, Error):
-                self.transport.abortConnection()
-                return
-
-        self.send_outgoing_data()
-        if close_connection:
+    def event_received(self, event):
+        print('<<< ' + event.encode().rstrip())
+        if isinstance(event, Reply) and event.is_error and self.conn.registered:
+            self.transport.abortConnection()
+        elif isinstance(event, Join):
+            self.conn.send_command('PRIVMSG', self.channel, self.message)
+            self.conn.send_command('QUIT')
+            self.send_pending()
             self.transport.loseConnection()
+        elif isinstance(event, Error):
+            self.transport.abortConnection()
+
+    def send_pending(self):
+        # Print all outgoing data before it is handed over to the transport
+        for line in self.conn._output_buffer.decode('utf-8').splitlines():
+            print('>>> ' + line)
 
-    def send_outgoing_data(self):
-        # This is more complicated than it should because we want to print all outgoing data here.
-        # Normally, self.transport.write(self.conn.data_to_send()) would suffice.
-        output = self.conn.data_to_send()
-        if output:
-            print('>>> ' + output.decode('utf-8').replace('\r\n', '\r\n>>> ').rstrip('> \r\n'))
-            self.transport.write(output)
+        super(MessageSendProtocol, self).send_pending()
 
 
 class IRCClientFactory(ClientFactory):
     def buildProtocol(self, addr):
-        return IRCProtocol(args.nickname, args.channel, args.message)
+        return MessageSendProtocol(args.nickname, args.channel, args.message)
 
 parser = ArgumentParser(description='A sample IRC client')
 parser.add_argument('host', help='address of irc server (foo.bar.baz or foo.bar.baz:port)')
@@ -1,27 +1,90 @@
 from __future__ import unicode_literals
 
+import base64
+import binascii
 import codecs
-
-from ircproto.events import decode_event, commands, Reply, Ping
+from itertools import count
+from timeit import default_timer
+
+from ircproto.constants import (
+    ERR_ERRONEUSNICKNAME, ERR_NICKCOLLISION, ERR_NICKLOCKED, ERR_NICKNAMEINUSE, ERR_SASLABORTED,
+    ERR_SASLALREADY, ERR_SASLFAIL, ERR_SASLTOOLONG, ERR_UNAVAILRESOURCE, RPL_ISUPPORT,
+    RPL_SASLSUCCESS, RPL_WELCOME)
+from ircproto.events import (
+    decode_event, decode_raw_event, commands, max_tags_length, Authenticate, Batch, BatchedEvents,
+    Cap, CTCPMessage, Join, Nick, OversizedMessage, Password, Reply, Ping, User)
 from ircproto.exceptions import ProtocolError
+from ircproto.isupport import ServerSupport
+from ircproto.metrics import null_metrics
+from ircproto.profiling import reply_label
 from ircproto.replies import reply_templates
 
+sasl_failure_codes = frozenset([ERR_NICKLOCKED, ERR_SASLFAIL, ERR_SASLTOOLONG, ERR_SASLABORTED,
+                                ERR_SASLALREADY])
+nickname_rejected_codes = frozenset([ERR_ERRONEUSNICKNAME, ERR_NICKNAMEINUSE, ERR_NICKCOLLISION,
+                                     ERR_UNAVAILRESOURCE])
 
-class BaseIRCConnection(object):
-    """Base class for IRC connection state machines."""
+#: maximum length of the channel and key lists in a single ``JOIN`` command
+max_join_length = 400
+
+
+def alternate_nicknames(nickname):
+    """
+    Generate alternatives for a nickname that was rejected during registration.
+
+    Yields ``nickname_``, ``nickname__`` and then ``nickname1``, ``nickname2`` and so on.
 
-    __slots__ = ('output_codec', 'input_decoder', 'fallback_decoder', '_input_buffer',
-                 '_output_buffer', '_closed')
+    """
+    yield nickname + '_'
+    yield nickname + '__'
+    for i in count(1):
+        yield '%s%d' % (nickname, i)
+
+
+class BaseIRCConnection(object):
+    """
+    Base class for IRC connection state machines.
+
+    :ivar tuple encodings: names of the output, input and fallback encodings
+    :ivar metrics: the metrics collector (see :mod:`ircproto.metrics`)
+    :ivar profiler: the profiler attributing CPU time to commands, or ``None``
+        (see :mod:`ircproto.profiling`)
+    :ivar ctcp_responder: the object answering incoming CTCP queries, or ``None``
+        (see :class:`~ircproto.ctcp.CTCPResponder`)
+    :ivar int max_line_length: maximum length of an incoming line (excluding message tags),
+        including the trailing CRLF
+    :ivar bool raw_events: ``True`` to return :class:`~ircproto.events.RawEvent` objects instead
+        of decoded events from :meth:`feed_data` (see :meth:`handle_raw_event`)
+    :ivar encoding_cache: the cache remembering which decoder works for each sender, or ``None``
+        (see :class:`~ircproto.encoding.EncodingCache`)
+    """
+
+    __slots__ = ('encodings', 'output_codec', 'input_decoder', 'fallback_decoder', 'metrics',
+                 'profiler', 'ctcp_responder', 'max_line_length', 'raw_events', 'encoding_cache',
+                 '_input_buffer', '_output_buffer', '_batches', '_discarded', '_closed')
 
     sender = None  # type: str
 
+    #: commands that are decoded in raw mode so that :meth:`handle_event` can react to them
+    raw_handled_commands = frozenset(['PING'])
+
     def __init__(self, output_encoding='utf-8', input_encoding='utf-8',
-                 fallback_encoding='iso-8859-1'):
+                 fallback_encoding='iso-8859-1', metrics=None, profiler=None,
+                 ctcp_responder=None, raw_events=False, encoding_cache=None):
+        self.encodings = (output_encoding, input_encoding, fallback_encoding)
         self.output_codec = codecs.getencoder(output_encoding)
         self.input_decoder = codecs.getdecoder(input_encoding)
         self.fallback_decoder = codecs.getdecoder(fallback_encoding)
+        self.metrics = metrics or null_metrics
+        self.profiler = profiler
+        self.ctcp_responder = ctcp_responder
+        self.max_line_length = 512
+        self.raw_events = raw_events
+        self.encoding_cache = encoding_cache
         self._input_buffer = bytearray()
         self._output_buffer = bytearray()
+        self._batches = None
+        self._discarded = None
         self._closed = False
 
     def feed_data(self, data):
@@ -34,21 +97,88 @@ class BaseIRCConnection(object):
         Sometimes this call generates outgoing data so it is important to call
         :meth:`.data_to_send` afterwards and write those bytes to the output.
 
+        Messages that are too long are reported as :class:`~ircproto.events.OversizedMessage`
+        events. If an unterminated line grows longer than any valid message could be, it is
+        dropped from the buffer and everything up to the next line terminator is discarded as it
+        arrives.
+
         :param bytes data: incoming data
         :raise ircproto.ProtocolError: if the protocol is violated
         :return: the list of generated events
         :rtype: list
 
         """
-        self._input_buffer.extend(data)
+        metrics = self.metrics
+        if metrics.enabled:
+            metrics.bytes_received(len(data))
+
         events = []
-        while True:
-            event = decode_event(self._input_buffer, self.input_decoder, self.fallback_decoder)
-            if event is None:
+        if self._discarded is not None:
+            # Skip the rest of an oversized line without buffering any of it
+            end_index = data.find(b'\n')
+            if end_index == -1:
+                self._discarded += len(data)
                 return events
-            else:
-                self.handle_event(event)
+
+            events.append(OversizedMessage(self._discarded + end_index + 1))
+            self._discarded = None
+            data = data[end_index + 1:]
+
+        self._input_buffer.extend(data)
+
+        profiler = self.profiler
+        if profiler is not None:
+            previous_tag = profiler.tag_decoding(self)
+
+        raw_events = self.raw_events
+        handle_event = self.handle_raw_event if raw_events else self.handle_event
+        try:
+            while True:
+                if metrics.enabled:
+                    start = default_timer()
+
+                try:
+                    if raw_events:
+                        event = decode_raw_event(self._input_buffer, self.max_line_length)
+                    else:
+                        event = decode_event(self._input_buffer, self.input_decoder,
+                                             self.fallback_decoder, self.max_line_length,
+                                             self.encoding_cache)
+                except ProtocolError as exc:
+                    metrics.protocol_error(exc)
+                    raise
+
+                if event is None:
+                    if len(self._input_buffer) > max_tags_length + self.max_line_length:
+                        # No valid message can be this long, so stop buffering it
+                        self._discarded = len(self._input_buffer)
+                        del self._input_buffer[:]
+
+                    return events
+
+                if metrics.enabled:
+                    metrics.event_decoded(event, default_timer() - start)
+
+                if event.__class__ is OversizedMessage:
+                    events.append(event)
+                    continue
+
+                if profiler is not None:
+                    profiler.decoded(self, event)
+                    handle_event(event)
+                    profiler.tag_decoding(self)
+                else:
+                    handle_event(event)
+
+                if self._batches is not None and not raw_events:
+                    event = self._aggregate_batch(event)
+                    if event is None:
+                        continue
+
                 events.append(event)
+        finally:
+            if profiler is not None:
+                profiler.restore(previous_tag)
 
     def data_to_send(self):
         """
@@ -61,10 +191,70 @@ class BaseIRCConnection(object):
         del self._output_buffer[:]
         return data
 
+    @property
+    def output_buffer_size(self):
+        """Return the number of bytes waiting in the output buffer."""
+        return len(self._output_buffer)
+
+    def _aggregate_batch(self, event):
+        # Events belonging to an open batch are held back until the batch ends, at which point a
+        # single BatchedEvents is returned in their place
+        batches = self._batches
+        if isinstance(event, Batch):
+            reference = event.reference[1:]
+            if event.reference.startswith('+'):
+                batch = BatchedEvents(event.sender, reference, event.type, event.params)
+                batch._tags = event._tags
+                batches[reference] = batch
+                return None
+            elif reference in batches:
+                event = batches.pop(reference)
+            else:
+                return event
+
+        if event._tags:
+            batch = batches.get(event.get_tag('batch'))
+            if batch is not None:
+                batch.events.append(event)
+                return None
+
+        return event
+
     def handle_event(self, event):
+        """
+        Update the connection state based on a received event.
+
+        This is called for every decoded event, including those that are later returned as part of
+        a :class:`~ircproto.events.BatchedEvents`.
+
+        """
         # Automatically respond to pings
         if isinstance(event, Ping):
             self.send_command('PONG', event.server1, event.server2)
+        elif isinstance(event, CTCPMessage) and self.ctcp_responder is not None:
+            self.ctcp_responder.respond(self, event)
+
+    def handle_raw_event(self, event):
+        """
+        Update the connection state based on a message received in raw mode.
+
+        Only the messages the connection needs to react to (see :attr:`raw_handled_commands`) are
+        decoded and passed to :meth:`handle_event`. The decoded event is cached on the raw event.
+        Batches are not aggregated in raw mode.
+
+        :param ircproto.events.RawEvent event: the received message
+
+        """
+        if self._needs_decoding(event):
+            self.handle_event(event.decode(self.input_decoder, self.fallback_decoder))
+
+    def _needs_decoding(self, event):
+        if event.command in self.raw_handled_commands:
+            return True
+
+        # CTCP queries can only be answered after decoding them
+        return self.ctcp_responder is not None and event.command == 'PRIVMSG' and \
+            b'\x01' in event.line
 
     def send_command(self, command, *params):
         """
@@ -86,9 +276,9 @@ class BaseIRCConnection(object):
             raise ProtocolError('no such command: %s' % command)
 
         event = command_cls(None, *params)
-        self._send_event(event)
+        self.send_event(event)
 
-    def _send_event(self, event):
+    def send_event(self, event):
         """
         Send an event to the peer.
 
@@ -98,30 +288,381 @@ class BaseIRCConnection(object):
         if self._closed:
             raise ProtocolError('the connection has been closed')
 
-        encoded_event = event.encode()
-        self._output_buffer.extend(self.output_codec(encoded_event)[0])
+        if self.profiler is not None:
+            previous_tag = self.profiler.tag(self, event)
+            try:
+                self._encode_event(event)
+            finally:
+                self.profiler.restore(previous_tag)
+        else:
+            self._encode_event(event)
+
+    def _encode_event(self, event):
+        metrics = self.metrics
+        if metrics.enabled:
+            start = default_timer()
+            data = self.output_codec(event.encode())[0]
+            metrics.event_encoded(event, default_timer() - start)
+            metrics.bytes_sent(len(data))
+            self._output_buffer.extend(data)
+            metrics.output_buffered(len(self._output_buffer))
+        else:
+            self._output_buffer.extend(self.output_codec(event.encode())[0])
 
 
 class IRCClientConnection(BaseIRCConnection):
-    """An IRC client's connection to a server."""
+    """
+    An IRC client's connection to a server.
+
+    Capability negotiation is started with :meth:`negotiate_capabilities`. Once the server has
+    listed its capabilities, the wanted ones it supports are requested and negotiation is ended
+    after the server has acknowledged or rejected them. If the ``batch`` capability is enabled,
+    batched events are returned together as :class:`~ircproto.events.BatchedEvents`.
+
+    If a SASL mechanism is given, the ``sasl`` capability is requested and authentication is
+    completed before capability negotiation is ended, so that the client is logged in by the time
+    registration completes.
+
+    :meth:`register` sends all of the registration commands at once. If the server rejects the
+    nickname, the next one from the alternate nickname generator is tried right away. Channels
+    passed to :meth:`join` before the server has accepted the registration are joined as soon as
+    :data:`~ircproto.constants.RPL_WELCOME` arrives.
+
+    :param capabilities: names of the capabilities to request if the server supports them
+    :param sasl: the SASL mechanism to authenticate with (see :mod:`ircproto.sasl`)
+    :param nickname_generator: a callable that takes the rejected nickname and returns an iterator
+        of alternate nicknames (defaults to :func:`alternate_nicknames`)
+    :param tracker: a :class:`~ircproto.tracker.StateTracker` to keep up to date with the
+        received events
+    :param bool raw_events: ``True`` to return undecoded :class:`~ircproto.events.RawEvent`
+        objects from :meth:`feed_data` (numeric replies and the commands in
+        :attr:`raw_handled_commands` are still decoded for the connection's own use)
+    :param encoding_cache: an :class:`~ircproto.encoding.EncodingCache` to remember the working
+        decoder for each sender with
+    :ivar str nickname: the current (or requested) nickname
+    :ivar str realname: the real name sent during registration
+    :ivar str registration_state: ``None`` before :meth:`register`, then ``registering`` and
+        finally ``registered``
+    :ivar isupport: the limits and features advertised by the server
+        (a :class:`~ircproto.isupport.ServerSupport`)
+    :ivar set wanted_capabilities: names of the capabilities to request
+    :ivar dict available_capabilities: capabilities advertised by the server (name to value)
+    :ivar set enabled_capabilities: names of the capabilities acknowledged by the server
+    :ivar str cap_state: ``None`` before negotiation, then ``listing``, ``requesting`` and
+        finally ``done``
+    :ivar sasl_mechanism: the SASL mechanism to authenticate with, or ``None``
+    :ivar str sasl_state: ``None`` before authentication, then ``authenticating`` and finally
+        either ``success`` or ``failed``
+    """
+
+    __slots__ = ('nickname', 'realname', 'registration_state', 'nickname_generator', 'tracker',
+                 'isupport',
+                 'wanted_capabilities', 'available_capabilities', 'enabled_capabilities',
+                 'cap_state', 'sasl_mechanism', 'sasl_state', '_pending_capabilities',
+                 '_sasl_buffer', '_alternate_nicknames', '_queued_joins')
+
+    #: maximum length of a (base64 encoded) SASL challenge
+    max_sasl_challenge = 8192
+
+    raw_handled_commands = frozenset(['PING', 'CAP', 'AUTHENTICATE', 'NICK', 'JOIN', 'PART',
+                                      'KICK', 'QUIT', 'TOPIC', 'MODE'])
+
+    def __init__(self, metrics=None, profiler=None, ctcp_responder=None, capabilities=(),
+                 sasl=None, nickname_generator=alternate_nicknames, tracker=None,
+                 raw_events=False, encoding_cache=None):
+        super(IRCClientConnection, self).__init__(metrics=metrics, profiler=profiler,
+                                                  ctcp_responder=ctcp_responder,
+                                                  raw_events=raw_events,
+                                                  encoding_cache=encoding_cache)
+        self.nickname = self.realname = None
+        self.registration_state = None
+        self.nickname_generator = nickname_generator
+        self.tracker = tracker
+        self.isupport = ServerSupport()
+        self._alternate_nicknames = None
+        self._queued_joins = []
+        self.wanted_capabilities = set(capabilities)
+        self.available_capabilities = {}
+        self.enabled_capabilities = set()
+        self.cap_state = None
+        self.sasl_mechanism = sasl
+        self.sasl_state = None
+        self._pending_capabilities = set()
+        self._sasl_buffer = ''
+        if sasl is not None:
+            self.wanted_capabilities.add('sasl')
 
-    __slots__ = ('nickname', 'realname')
+    @property
+    def registered(self):
+        """``True`` if the server has accepted the registration."""
+        return self.registration_state == 'registered'
 
-    def __init__(self):
-        super(IRCClientConnection, self).__init__()
-        self.nickname = self.realname = None
+    def register(self, nickname, username, realname, password=None, mode='0'):
+        """
+        Register the connection with the server.
+
+        ``PASS`` (if a password is given), ``CAP LS`` (if any capabilities are wanted), ``NICK``
+        and ``USER`` are all added to the output buffer at once.
+
+        :param str nickname: the nickname to register with
+        :param str username: the user name (ident)
+        :param str realname: the real name
+        :param str password: the connection password
+        :param str mode: the initial user mode bit mask
+
+        """
+        if self.registration_state is not None:
+            raise ProtocolError('the connection has already been registered')
+
+        self.registration_state = 'registering'
+        self.nickname = nickname
+        self.realname = realname
+        if password:
+            self.send_event(Password(None, password))
+        if self.wanted_capabilities:
+            self.negotiate_capabilities()
+
+        self.send_event(Nick(None, nickname))
+        self.send_event(User(None, username, mode, realname))
+
+    def join(self, channel, key=None):
+        """
+        Join a channel, or queue it to be joined once the registration is complete.
+
+        :param str channel: name of the channel
+        :param str key: the channel key, if any
+
+        """
+        if self.registered:
+            self.send_event(Join(None, channel, key))
+        else:
+            self._queued_joins.append((channel, key))
+
+    def _handle_isupport(self, event):
+        # <target> <token> [<token> ...] :are supported by this server
+        isupport = self.isupport
+        isupport.update(event.params[1:-1])
+        self.max_line_length = isupport.linelen
+        if self.tracker is not None:
+            self.tracker.casemapping = isupport.casemapping
+            self.tracker.set_prefixes(isupport.prefix)
+            self.tracker.set_chanmodes(isupport.chanmodes)
+
+    def _flush_joins(self):
+        # Combine the queued channels into as few JOIN commands as possible, listing the channels
+        # with keys first as required by the protocol
+        joins = sorted(self._queued_joins, key=lambda join: join[1] is None)
+        del self._queued_joins[:]
+        channels, keys = [], []
+        length = 0
+        for channel, key in joins:
+            added_length = len(channel) + len(key or '') + 2
+            if channels and length + added_length > max_join_length:
+                self.send_event(Join(None, ','.join(channels), ','.join(keys) or None))
+                channels, keys = [], []
+                length = 0
+
+            channels.append(channel)
+            if key is not None:
+                keys.append(key)
+
+            length += added_length
+
+        if channels:
+            self.send_event(Join(None, ','.join(channels), ','.join(keys) or None))
+
+    def _handle_registration_reply(self, event):
+        if event.code == RPL_WELCOME:
+            self.registration_state = 'registered'
+            self.nickname = event.message.split(' ', 1)[0]
+            self._alternate_nicknames = None
+            self._flush_joins()
+        elif event.code in nickname_rejected_codes:
+            if self._alternate_nicknames is None:
+                self._alternate_nicknames = iter(self.nickname_generator(self.nickname))
+
+            try:
+                self.nickname = next(self._alternate_nicknames)
+            except StopIteration:
+                raise ProtocolError('ran out of alternate nicknames')
+
+            self.send_event(Nick(None, self.nickname))
+
+    def negotiate_capabilities(self):
+        """Start capability negotiation by asking the server to list its capabilities."""
+        self.cap_state = 'listing'
+        self.send_event(Cap(None, 'LS', '302'))
+
+    def end_capability_negotiation(self):
+        """End capability negotiation, allowing the server to complete the registration."""
+        self.cap_state = 'done'
+        self.send_event(Cap(None, 'END'))
+
+    def handle_event(self, event):
+        super(IRCClientConnection, self).handle_event(event)
+        if self.tracker is not None:
+            self.tracker.handle_event(event, self.nickname)
+
+        if isinstance(event, Cap):
+            self._handle_cap(event)
+        elif isinstance(event, Authenticate):
+            self._handle_authenticate(event)
+        elif isinstance(event, Reply):
+            if event.code == RPL_ISUPPORT:
+                self._handle_isupport(event)
+            elif self.registration_state == 'registering':
+                self._handle_registration_reply(event)
+
+            if self.sasl_state == 'authenticating':
+                if event.code == RPL_SASLSUCCESS:
+                    self._finish_authentication('success')
+                elif event.code in sasl_failure_codes:
+                    self._finish_authentication('failed')
+        elif isinstance(event, Nick) and self.registered and event.sender:
+            casefold = self.isupport.casefold
+            if casefold(event.sender.partition('!')[0]) == casefold(self.nickname):
+                self.nickname = event.nickname
+
+    def _needs_decoding(self, event):
+        return event.command.isdigit() or \
+            super(IRCClientConnection, self)._needs_decoding(event)
+
+    def _handle_cap(self, event):
+        subcommand = event.subcommand
+        if subcommand in ('LS', 'NEW'):
+            self.available_capabilities.update(event.capability_values)
+            if not event.more and self.cap_state in ('listing', 'done'):
+                names = [name for name in sorted(self.wanted_capabilities)
+                         if name in self.available_capabilities and
+                         name not in self.enabled_capabilities]
+                mechanisms = self.available_capabilities.get('sasl')
+                if 'sasl' in names and mechanisms and self.sasl_mechanism is not None and \
+                        self.sasl_mechanism.name not in mechanisms.split(','):
+                    names.remove('sasl')
+
+                self._request_capabilities(names)
+        elif subcommand in ('ACK', 'NAK', 'DEL'):
+            for name in (event.capabilities or '').split():
+                enabled = subcommand == 'ACK' and not name.startswith('-')
+                name = name.lstrip('-')
+                self._pending_capabilities.discard(name)
+                if enabled:
+                    self.enabled_capabilities.add(name)
+                elif subcommand != 'NAK':
+                    self.enabled_capabilities.discard(name)
+                    if subcommand == 'DEL':
+                        self.available_capabilities.pop(name, None)
+
+                if name == 'batch' and subcommand != 'NAK':
+                    self._batches = {} if enabled else None
+
+            if 'sasl' in self.enabled_capabilities and self.sasl_state is None and \
+                    self.sasl_mechanism is not None:
+                self.sasl_state = 'authenticating'
+                self.send_event(Authenticate(None, self.sasl_mechanism.name))
+
+            self._check_negotiation_done()
+
+    def _check_negotiation_done(self):
+        if self.cap_state == 'requesting' and not self._pending_capabilities and \
+                self.sasl_state != 'authenticating':
+            self.end_capability_negotiation()
+
+    def _handle_authenticate(self, event):
+        if self.sasl_state != 'authenticating':
+            return
+
+        # Challenges longer than the chunk size are split into 400 byte chunks
+        if event.data != '+':
+            self._sasl_buffer += event.data
+            if len(self._sasl_buffer) > self.max_sasl_challenge:
+                self._abort_authentication()
+                raise ProtocolError('SASL challenge too long')
+            elif len(event.data) == 400:
+                return
+
+        try:
+            challenge = base64.b64decode(self._sasl_buffer.encode('ascii'))
+        except (binascii.Error, TypeError, UnicodeEncodeError):
+            self._abort_authentication()
+            raise ProtocolError('invalid base64 in SASL challenge')
+        finally:
+            self._sasl_buffer = ''
+
+        try:
+            response = self.sasl_mechanism.respond(challenge)
+        except ProtocolError:
+            self._abort_authentication()
+            raise
+
+        # Imported here since ircproto.sasl pulls in hashlib, which is slow to import
+        from ircproto.sasl import encode_payload
+        for chunk in encode_payload(response):
+            self.send_event(Authenticate(None, chunk))
+
+    def _abort_authentication(self):
+        self.send_event(Authenticate(None, '*'))
+        self._finish_authentication('failed')
+
+    def _finish_authentication(self, state):
+        self.sasl_state = state
+        self._sasl_buffer = ''
+        self._check_negotiation_done()
+
+    def _request_capabilities(self, names):
+        if not names:
+            if self.cap_state == 'listing':
+                self.end_capability_negotiation()
+
+            return
+
+        if self.cap_state == 'listing':
+            self.cap_state = 'requesting'
+
+        # Each request must fit on a single line
+        self._pending_capabilities.update(names)
+        chunk = []
+        length = 0
+        for name in names:
+            if chunk and length + len(name) + 1 > 400:
+                self.send_event(Cap(None, 'REQ', ' '.join(chunk)))
+                chunk = []
+                length = 0
+
+            chunk.append(name)
+            length += len(name) + 1
+
+        self.send_event(Cap(None, 'REQ', ' '.join(chunk)))
 
 
 class IRCServerConnection(BaseIRCConnection):
-    """A server side connection to either an IRC client or another IRC server."""
+    """
+    A server side connection to either an IRC client or another IRC server.
+
+    :ivar str host: host name of the peer
+    :ivar str nickname: nickname of the client (``None`` until registered)
+    :ivar str username: user name of the client (``None`` until registered)
+    """
 
-    __slots__ = ('host', '_server_state')
+    __slots__ = ('host', 'nickname', 'username', '_server_state')
 
     def __init__(self, host, server_state):
-        super(IRCServerConnection, self).__init__()
+        super(IRCServerConnection, self).__init__(metrics=server_state.metrics,
+                                                  profiler=server_state.profiler)
         self.host = host
+        self.nickname = self.username = None
         self._server_state = server_state
 
+    @property
+    def registered(self):
+        """``True`` if the client has sent its nickname and user name."""
+        return self.nickname is not None and self.username is not None
+
+    @property
+    def prefix(self):
+        """Return the ``nickname!username@host`` prefix identifying this client."""
+        return '%s!%s@%s' % (self.nickname, self.username, self.host)
+
     def send_reply(self, code, **templatevars):
         """
         Send a reply for a command.
@@ -133,10 +674,18 @@ class IRCServerConnection(BaseIRCConnection):
         :param templatevars: variables required for the reply message template
 
         """
+        if self.profiler is not None:
+            with self.profiler.profile(self, command=reply_label(code),
+                                       channel=templatevars.get('channel')):
+                self._send_reply(code, templatevars)
+        else:
+            self._send_reply(code, templatevars)
+
+    def _send_reply(self, code, templatevars):
         # Format the reply message
         message = reply_templates[code].format(**templatevars)
-        event = Reply(self.sender, code, message)
-        self._send_event(event)
+        event = Reply(self.sender, code, '%s %s' % (self.nickname or '*', message))
+        self.send_event(event)
 
     @property
     def sender(self):
@@ -2,7 +2,10 @@ RPL_WELCOME = 1
 RPL_YOURHOST = 2
 RPL_CREATED = 3
 RPL_MYINFO = 4
-RPL_BOUNCE = 5
+RPL_ISUPPORT = 5
+# RFC 2812 assigned 005 to RPL_BOUNCE, but servers use it for RPL_ISUPPORT instead, so replies sent
+# with this code use the RPL_ISUPPORT template
+RPL_BOUNCE = RPL_ISUPPORT
 RPL_USERHOST = 302
 RPL_ISON = 303
 RPL_AWAY = 301
@@ -133,5 +136,14 @@ ERR_UNIQOPPRIVSNEEDED = 485
 ERR_NOOPERHOST = 491
 ERR_UMODEUNKNOWNFLAG = 501
 ERR_USERSDONTMATCH = 502
+RPL_LOGGEDIN = 900
+RPL_LOGGEDOUT = 901
+ERR_NICKLOCKED = 902
+RPL_SASLSUCCESS = 903
+ERR_SASLFAIL = 904
+ERR_SASLTOOLONG = 905
+ERR_SASLABORTED = 906
+ERR_SASLALREADY = 907
+RPL_SASLMECHS = 908
 
 reply_names = {value: key for key, value in locals().items() if isinstance(value, int)}
@@ -0,0 +1,212 @@
+"""
+Client-to-client protocol (CTCP) support.
+
+CTCP messages are ``PRIVMSG`` (queries) or ``NOTICE`` (replies) messages whose text is wrapped in
+``\\x01`` delimiters. Decoded CTCP messages are represented by
+:class:`~ircproto.events.CTCPMessage` and its subclasses. Following current practice, no
+low-level or CTCP-level quoting is applied.
+"""
+from __future__ import unicode_literals
+
+import time
+from collections import OrderedDict
+from timeit import default_timer
+
+from ircproto.exceptions import ProtocolError
+
+delimiter = '\x01'
+unsendable_chars = ('\x01', '\r', '\n', '\x00')
+
+
+def extract_ctcp(message):
+    """
+    Separate the CTCP messages embedded in a message from its plain text.
+
+    A missing delimiter at the end of the message is tolerated.
+
+    :param str message: the text of a ``PRIVMSG`` or ``NOTICE``
+    :return: a tuple of (plain text, list of ``(tag, data)`` tuples) where ``data`` is ``None`` if
+        the CTCP message had no parameters
+
+    """
+    if delimiter not in message:
+        return message, []
+
+    parts = message.split(delimiter)
+    text = ''.join(parts[::2])
+    messages = [split_tagged(payload) for payload in parts[1::2] if payload]
+    return text, messages
+
+
+def split_tagged(payload):
+    """
+    Split the payload of a CTCP message into its tag and data.
+
+    :param str payload: the text between the CTCP delimiters
+    :return: a tuple of (tag, data) where ``data`` is ``None`` if there was none
+
+    """
+    tag, _, data = payload.partition(' ')
+    return tag.upper(), data or None
+
+
+def pack_ipv4(address):
+    """
+    Convert a dotted quad IPv4 address into the integer form used by ``DCC``.
+
+    :raises ircproto.ProtocolError: if the address is not a valid IPv4 address
+
+    """
+    parts = address.split('.')
+    try:
+        octets = [int(part) for part in parts]
+    except ValueError:
+        octets = ()
+
+    if len(octets) != 4 or not all(0 <= octet <= 255 for octet in octets):
+        raise ProtocolError('invalid IPv4 address: %s' % address)
+
+    return (octets[0] << 24) | (octets[1] << 16) | (octets[2] << 8) | octets[3]
+
+
+def unpack_ipv4(value):
+    """
+    Convert the integer form of an IPv4 address back into a dotted quad.
+
+    :raises ircproto.ProtocolError: if the value is out of range for an IPv4 address
+
+    """
+    value = int(value)
+    if not 0 <= value < 1 << 32:
+        raise ProtocolError('invalid IPv4 address: %d' % value)
+
+    return '%d.%d.%d.%d' % (value >> 24 & 255, value >> 16 & 255, value >> 8 & 255, value & 255)
+
+
+def join_tagged(tag, data=None):
+    """
+    Build the delimited representation of a CTCP message.
+
+    :param str tag: the CTCP tag (``VERSION``, ``ACTION`` etc.)
+    :param str data: the parameters of the message, if any
+    :raises ircproto.ProtocolError: if the tag or data contains characters that cannot be sent
+
+    """
+    payload = tag + ' ' + data if data else tag
+    for char in unsendable_chars:
+        if char in payload:
+            raise ProtocolError('CTCP messages cannot contain %r' % char)
+
+    return delimiter + payload + delimiter
+
+
+class RateLimiter(object):
+    """
+    Token bucket rate limiter keyed by sender.
+
+    Each sender may send ``burst`` messages at once, after which one message is allowed every
+    ``interval`` seconds. Only the ``max_senders`` most recently seen senders are tracked.
+
+    :param float interval: seconds it takes to earn one token
+    :param int burst: maximum number of tokens a sender can accumulate
+    :param int max_senders: maximum number of senders to track
+    :param clock: a callable returning the current time in seconds
+    """
+
+    __slots__ = ('interval', 'burst', 'max_senders', 'clock', '_buckets')
+
+    def __init__(self, interval=5.0, burst=3, max_senders=1024, clock=default_timer):
+        self.interval = interval
+        self.burst = burst
+        self.max_senders = max_senders
+        self.clock = clock
+        self._buckets = OrderedDict()
+
+    def allow(self, key):
+        """
+        Consume a token for the given key, if one is available.
+
+        :return: ``True`` if the message is allowed, ``False`` if it should be dropped
+
+        """
+        now = self.clock()
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            tokens = self.burst
+            if len(self._buckets) >= self.max_senders:
+                self._buckets.popitem(last=False)
+        else:
+            tokens, last = bucket
+            tokens = min(self.burst, tokens + (now - last) / self.interval)
+
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+
+        self._buckets[key] = (tokens, now)
+        return allowed
+
+
+class CTCPResponder(object):
+    """
+    Automatically answers common CTCP queries.
+
+    Answers ``VERSION``, ``PING``, ``TIME`` and ``CLIENTINFO`` queries. Replies to each sender are
+    rate limited so that floods of queries cannot fill up the output buffer.
+
+    :param str version: the version string sent in reply to ``VERSION`` queries
+    :param rate_limiter: the rate limiter to use (defaults to a new :class:`RateLimiter`)
+    """
+
+    __slots__ = ('version', 'rate_limiter')
+
+    supported_tags = ('ACTION', 'CLIENTINFO', 'PING', 'TIME', 'VERSION')
+
+    def __init__(self, version='ircproto', rate_limiter=None):
+        self.version = version
+        self.rate_limiter = rate_limiter or RateLimiter()
+
+    def get_reply_data(self, event):
+        """
+        Return the data to reply to the given CTCP query with.
+
+        :return: the reply data, or ``None`` if the query should not be answered
+
+        """
+        if event.tag == 'VERSION':
+            return self.version
+        elif event.tag == 'PING':
+            return event.data or ''
+        elif event.tag == 'TIME':
+            return time.strftime('%a %b %d %H:%M:%S %Y')
+        elif event.tag == 'CLIENTINFO':
+            return ' '.join(self.supported_tags)
+
+        return None
+
+    def respond(self, connection, event):
+        """
+        Send a reply to the given CTCP event if appropriate.
+
+        :param connection: the connection the event was received on
+        :param ircproto.events.CTCPMessage event: the received CTCP message
+        :return: ``True`` if a reply was sent, ``False`` otherwise
+
+        """
+        if event.is_reply or not event.sender:
+            return False
+
+        data = self.get_reply_data(event)
+        if data is None:
+            return False
+
+        elif any(char in data for char in unsendable_chars):
+            # The data of a PING query comes from the peer and may not be safe to echo back
+            return False
+
+        nickname = event.sender.partition('!')[0]
+        if not self.rate_limiter.allow(nickname):
+            return False
+
+        connection.send_event(event.reply(data))
+        return True
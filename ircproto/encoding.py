@@ -0,0 +1,115 @@
+"""
+Remembering which codec works for each sender.
+
+Lines that are not valid in the input encoding are decoded twice: first with the input decoder,
+which fails, and then with the fallback decoder. Clients that send legacy encodings do so
+consistently, so :class:`EncodingCache` remembers per sender prefix that the fallback decoder was
+needed and goes straight to it on the next lines from the same sender. Since the fallback decoder
+may accept anything (like ``iso-8859-1``), every few lines the input decoder is tried again, so
+that a sender switching to the input encoding is decoded correctly again. Pass an instance to a
+connection to enable it.
+"""
+from __future__ import unicode_literals
+
+import re
+from collections import OrderedDict
+
+non_ascii_re = re.compile(b'[\x80-\xff]')
+ascii_probe = bytes(bytearray(range(128)))
+
+
+def is_ascii(data):
+    """Return ``True`` if the given bytes only contain ASCII characters."""
+    try:
+        return data.isascii()
+    except AttributeError:  # Python < 3.7
+        return non_ascii_re.search(data) is None
+
+
+class EncodingCache(object):
+    """
+    A bounded LRU cache of the senders whose lines needed the fallback decoder.
+
+    :param int max_size: maximum number of senders to remember
+    :param bool ascii_fast_path: ``True`` to decode pure ASCII lines directly, without consulting
+        the cache or trying the configured decoders (only done with decoders that decode ASCII as
+        ASCII)
+    :param int revalidate_interval: number of lines from a remembered sender after which the input
+        decoder is tried first again
+    :ivar int hits: number of lines decoded directly with the remembered fallback decoder
+    :ivar int misses: number of non-ASCII lines for which the input decoder was tried first
+    :ivar int ascii_lines: number of lines decoded through the ASCII fast path
+    """
+
+    __slots__ = ('max_size', 'ascii_fast_path', 'revalidate_interval', 'hits', 'misses',
+                 'ascii_lines', '_fallback', '_ascii_decoder')
+
+    def __init__(self, max_size=1024, ascii_fast_path=True, revalidate_interval=16):
+        self.max_size = max_size
+        self.ascii_fast_path = ascii_fast_path
+        self.revalidate_interval = revalidate_interval
+        self.hits = self.misses = self.ascii_lines = 0
+        self._fallback = OrderedDict()
+        self._ascii_decoder = None
+
+    def __len__(self):
+        return len(self._fallback)
+
+    @property
+    def stats(self):
+        """Return the statistics of the cache as a dictionary."""
+        return {'hits': self.hits, 'misses': self.misses, 'ascii_lines': self.ascii_lines,
+                'size': len(self._fallback)}
+
+    def decode(self, line, decoder, fallback_decoder):
+        """
+        Decode a line (without the CRLF), choosing the decoder based on the sender.
+
+        :param bytearray line: the raw line
+        :param decoder: the preferred decoder (as returned by :func:`codecs.getdecoder`)
+        :param fallback_decoder: the decoder to use if the preferred one fails
+        :rtype: str
+
+        """
+        if self.ascii_fast_path and is_ascii(line) and \
+                (decoder is self._ascii_decoder or self._check_ascii_decoder(decoder)):
+            self.ascii_lines += 1
+            return line.decode('ascii')
+
+        fallback = self._fallback
+        sender = None
+        if fallback:
+            sender = bytes(line.partition(b' ')[0])
+            lines = fallback.pop(sender, 0)
+            if 0 < lines < self.revalidate_interval:
+                self.hits += 1
+                fallback[sender] = lines + 1
+                return fallback_decoder(line, 'replace')[0]
+
+        self.misses += 1
+        try:
+            return decoder(line)[0]
+        except UnicodeDecodeError:
+            if sender is None:
+                sender = bytes(line.partition(b' ')[0])
+            elif len(fallback) >= self.max_size:
+                fallback.popitem(last=False)
+
+            fallback[sender] = 1
+            return fallback_decoder(line, 'replace')[0]
+
+    def clear(self):
+        """Forget all senders and reset the statistics."""
+        self._fallback.clear()
+        self.hits = self.misses = self.ascii_lines = 0
+
+    def _check_ascii_decoder(self, decoder):
+        try:
+            compatible = decoder(ascii_probe)[0] == ascii_probe.decode('ascii')
+        except UnicodeDecodeError:
+            compatible = False
+
+        if compatible:
+            self._ascii_decoder = decoder
+
+        return compatible
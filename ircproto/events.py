@@ -1,9 +1,72 @@
 from __future__ import unicode_literals
 
 import codecs
-
+import re
+
+from ircproto.constants import (
+    ERR_ALREADYREGISTRED, ERR_BADCHANMASK, ERR_BADCHANNELKEY, ERR_BANNEDFROMCHAN,
+    ERR_CANNOTSENDTOCHAN, ERR_CANTKILLSERVER, ERR_CHANNELISFULL, ERR_CHANOPRIVSNEEDED,
+    ERR_ERRONEUSNICKNAME, ERR_FILEERROR, ERR_INVITEONLYCHAN, ERR_NEEDMOREPARAMS, ERR_NICKCOLLISION,
+    ERR_NICKLOCKED, ERR_NICKNAMEINUSE, ERR_NOCHANMODES, ERR_NOLOGIN, ERR_NOMOTD,
+    ERR_NONICKNAMEGIVEN, ERR_NOOPERHOST, ERR_NOORIGIN, ERR_NOPRIVILEGES, ERR_NORECIPIENT,
+    ERR_NOSUCHCHANNEL, ERR_NOSUCHNICK, ERR_NOSUCHSERVER, ERR_NOTEXTTOSEND, ERR_NOTONCHANNEL,
+    ERR_NOTOPLEVEL, ERR_PASSWDMISMATCH, ERR_RESTRICTED, ERR_SASLABORTED, ERR_SASLALREADY,
+    ERR_SASLFAIL, ERR_SASLTOOLONG, ERR_SUMMONDISABLED, ERR_TOOMANYCHANNELS, ERR_TOOMANYTARGETS,
+    ERR_UMODEUNKNOWNFLAG, ERR_UNAVAILRESOURCE, ERR_USERNOTINCHANNEL, ERR_USERONCHANNEL,
+    ERR_USERSDONTMATCH, ERR_WILDTOPLEVEL, RPL_ADMINEMAIL, RPL_ADMINLOC1, RPL_ADMINLOC2,
+    RPL_ADMINME, RPL_AWAY, RPL_ENDOFINFO, RPL_ENDOFMOTD, RPL_ENDOFNAMES, RPL_ENDOFSTATS, RPL_INFO,
+    RPL_INVITING, RPL_ISON, RPL_LIST, RPL_LISTEND, RPL_LOGGEDIN, RPL_LUSERCHANNELS,
+    RPL_LUSERCLIENT, RPL_LUSERME, RPL_LUSEROP, RPL_LUSERUNKNOWN, RPL_MOTD, RPL_MOTDSTART,
+    RPL_MYINFO, RPL_NAMREPLY, RPL_NOTOPIC, RPL_NOWAWAY, RPL_REHASHING, RPL_SASLMECHS,
+    RPL_SASLSUCCESS, RPL_STATSCOMMANDS, RPL_STATSLINKINFO, RPL_STATSOLINE, RPL_STATSUPTIME,
+    RPL_SUMMONING, RPL_TIME, RPL_TOPIC, RPL_TRACECLASS, RPL_TRACECONNECTING, RPL_TRACEEND,
+    RPL_TRACEHANDSHAKE, RPL_TRACELINK, RPL_TRACELOG, RPL_TRACENEWTYPE, RPL_TRACEOPERATOR,
+    RPL_TRACESERVER, RPL_TRACESERVICE, RPL_TRACEUNKNOWN, RPL_TRACEUSER, RPL_UMODEIS, RPL_UNAWAY,
+    RPL_USERHOST, RPL_VERSION, RPL_YOUREOPER, RPL_YOURESERVICE, RPL_YOURHOST, reply_names)
+from ircproto.ctcp import delimiter, extract_ctcp, join_tagged, pack_ipv4, unpack_ipv4
 from ircproto.exceptions import ProtocolError, UnknownCommand
-from ircproto.constants import *
+from ircproto.replies import get_reply_parser
+
+
+#: maximum length of the tag section of a message, including the leading ``@`` and trailing space
+max_tags_length = 8191
+
+tag_escapes = {';': '\\:', ' ': '\\s', '\\': '\\\\', '\r': '\\r', '\n': '\\n'}
+tag_unescapes = {':': ';', 's': ' ', '\\': '\\', 'r': '\r', 'n': '\n'}
+tag_escape_re = re.compile(r'[; \\\r\n]')
+tag_unescape_re = re.compile(r'\\(.?)')
+
+
+def escape_tag_value(value):
+    """Escape a message tag value for transmission."""
+    return tag_escape_re.sub(lambda match: tag_escapes[match.group(0)], value)
+
+
+def unescape_tag_value(value):
+    """Reverse the escaping of a received message tag value."""
+    if '\\' not in value:
+        return value
+
+    return tag_unescape_re.sub(lambda match: tag_unescapes.get(match.group(1), match.group(1)),
+                               value)
+
+
+def parse_tags(raw):
+    """
+    Parse the tag section of a message (without the leading ``@``) into a dictionary.
+
+    Tags without a value are given an empty string as their value.
+
+    :rtype: dict
+
+    """
+    tags = {}
+    for item in raw.split(';'):
+        if item:
+            key, _, value = item.partition('=')
+            tags[key] = unescape_tag_value(value)
+
+    return tags
 
 
 class IRCEvent(object):
@@ -13,10 +76,77 @@ class IRCEvent(object):
     :ivar sender: either a server host name or nickname!username@host
     """
 
-    __slots__ = ('sender',)
+    __slots__ = ('sender', '_tags')
 
     def __init__(self, sender):
         self.sender = sender
+        self._tags = None
+
+    @property
+    def tags(self):
+        """
+        The IRCv3 message tags of this event, as a dictionary.
+
+        Tags received from the peer are only parsed when this property or :meth:`get_tag` is first
+        accessed. Assigning a dictionary here causes the tags to be sent along with the event.
+
+        """
+        if self._tags is None:
+            self._tags = {}
+        elif not isinstance(self._tags, dict):
+            self._tags = parse_tags(self._tags)
+
+        return self._tags
+
+    @tags.setter
+    def tags(self, tags):
+        self._tags = tags
+
+    def get_tag(self, key, default=None):
+        """
+        Return the value of a single message tag.
+
+        Unlike :attr:`tags`, this only unescapes the value of the requested tag.
+
+        :param str key: name of the tag (e.g. ``time`` or ``msgid``)
+        :param default: the value to return if the tag is not present
+
+        """
+        tags = self._tags
+        if tags is None:
+            return default
+        elif isinstance(tags, dict):
+            return tags.get(key, default)
+
+        prefix = key + '='
+        for item in tags.split(';'):
+            if item.startswith(prefix):
+                return unescape_tag_value(item[len(prefix):])
+            elif item == key:
+                return ''
+
+        return default
+
+    def encode_tags(self):
+        """
+        Encode the message tags of this event.
+
+        :return: the tag section including the leading ``@`` and trailing space, or an empty
+            string if the event has no tags
+        :raises ProtocolError: if the tag section is too long
+
+        """
+        tags = self._tags
+        if not tags:
+            return ''
+        elif isinstance(tags, dict):
+            tags = ';'.join(key + '=' + escape_tag_value(value) if value else key
+                            for key, value in tags.items())
+
+        if len(tags) + 2 > max_tags_length:
+            raise ProtocolError('the tag section is too long (%d bytes)' % (len(tags) + 2))
+
+        return '@' + tags + ' '
 
     def encode(self, *params):
         """
@@ -26,7 +156,7 @@ class IRCEvent(object):
         :raises ProtocolError: if any parameter save the last one contains spaces
 
         """
-        buffer = ''
+        buffer = self.encode_tags() if self._tags else ''
         if self.sender:
             buffer += ':' + self.sender + ' '
 
@@ -87,24 +217,72 @@ class Reply(IRCEvent):
     """
     Represents a numeric reply from a server to a client.
 
+    The fields of the reply (as named in its template in :mod:`ircproto.replies`) are only
+    parsed when first accessed through :attr:`fields` or one of the shortcut properties.
+
     :ivar int code: a numeric reply code
-    :ivar str message: the reply message
+    :ivar str message: the reply parameters, starting with the target of the reply
     """
 
-    __slots__ = ('code', 'message')
+    __slots__ = ('code', 'message', '_fields')
 
     def __init__(self, sender, code, message):
         super(Reply, self).__init__(sender)
         self.code = int(code)
         self.message = message
+        self._fields = None
 
     @property
     def is_error(self):
         """Return ``True`` if this is an error reply, ``False`` otherwise."""
         return self.code >= 400
 
+    @property
+    def params(self):
+        """Return the reply parameters as a list, starting with the target of the reply."""
+        return parse_params(self.message)
+
+    @property
+    def fields(self):
+        """
+        Return the fields of the reply as a dictionary (e.g. ``{'channel': ..., 'topic': ...}``).
+
+        The result is cached. Replies without a known template have no fields.
+
+        """
+        if self._fields is None:
+            parser = get_reply_parser(self.code)
+            self._fields = parser(self.params) if parser is not None else {}
+
+        return self._fields
+
+    @property
+    def channel(self):
+        """Return the channel name the reply concerns, or ``None`` if not applicable."""
+        return self.fields.get('channel')
+
+    @property
+    def nicks(self):
+        """
+        Return the list of nicknames in the reply (e.g. ``RPL_NAMREPLY``), or ``None``.
+
+        Any membership prefixes (like ``@``) are retained.
+
+        """
+        return self.fields.get('nicks')
+
+    @property
+    def topic(self):
+        """Return the channel topic in the reply, or ``None`` if not applicable."""
+        return self.fields.get('topic')
+
     def encode(self):
-        return super(Reply, self).encode(str(self.code), self.message)
+        # The message already contains the encoded parameters (including the target)
+        tags = self.encode_tags() if self._tags else ''
+        if self.sender:
+            return '%s:%s %03d %s\r\n' % (tags, self.sender, self.code, self.message)
+        else:
+            return '%s%03d %s\r\n' % (tags, self.code, self.message)
 
 
 # Section 3.1.1
@@ -124,18 +302,44 @@ class Password(Command):
 
 # Section 3.1.2
 class Nick(Command):
-    __slots__ = ('nickname',)
+    """
+    Changes the nickname of a client.
+
+    Between servers, the command is also used to introduce a new client
+    (:rfc:`2813#section-4.1.3`). This form has all the other fields set.
+
+    :ivar str nickname: the (new) nickname
+    :ivar str hopcount: distance of the client from its home server, in hops
+    :ivar str username: user name of the client
+    :ivar str host: host name of the client
+    :ivar str servertoken: token of the client's home server
+    :ivar str umode: the user modes of the client
+    :ivar str realname: real name of the client
+    """
+
+    __slots__ = ('nickname', 'hopcount', 'username', 'host', 'servertoken', 'umode', 'realname')
 
     command = 'NICK'
     allowed_replies = (ERR_NONICKNAMEGIVEN, ERR_ERRONEUSNICKNAME, ERR_NICKNAMEINUSE,
                        ERR_NICKCOLLISION, ERR_UNAVAILRESOURCE, ERR_RESTRICTED)
 
-    def __init__(self, sender, nickname):
+    def __init__(self, sender, nickname, hopcount=None, username=None, host=None,
+                 servertoken=None, umode=None, realname=None):
         super(Nick, self).__init__(sender)
         self.nickname = nickname
+        self.hopcount = hopcount
+        self.username = username
+        self.host = host
+        self.servertoken = servertoken
+        self.umode = umode
+        self.realname = realname
 
     def encode(self):
-        return super(Nick, self).encode(self.nickname)
+        if self.hopcount is None:
+            return super(Nick, self).encode(self.nickname)
+
+        return super(Nick, self).encode(self.nickname, self.hopcount, self.username, self.host,
+                                        self.servertoken, self.umode, self.realname)
 
 
 # Section 3.1.3
@@ -153,7 +357,10 @@ class User(Command):
 
     @classmethod
     def decode(cls, sender, *params):
-        return super(User).decode(sender, params[0], params[1], params[3])
+        if len(params) != 4:
+            raise ProtocolError('wrong number of arguments for %s' % cls.command)
+
+        return super(User, cls).decode(sender, params[0], params[1], params[3])
 
     def encode(self):
         return super(User, self).encode(self.user, self.mode, '*', self.realname)
@@ -207,6 +414,13 @@ class Service(Command):
         self.type = type_
         self.info = info
 
+    @classmethod
+    def decode(cls, sender, *params):
+        if len(params) != 6:
+            raise ProtocolError('wrong number of arguments for %s' % cls.command)
+
+        return super(Service, cls).decode(sender, params[0], params[2], params[3], params[5])
+
     def encode(self):
         return super(Service, self).encode(self.nickname, '*', self.distribution, self.type, '*',
                                            self.info)
@@ -214,7 +428,7 @@ class Service(Command):
 
 # Section 3.1.7
 class Quit(Command):
-    __slots = ('message',)
+    __slots__ = ('message',)
 
     command = 'QUIT'
 
@@ -274,7 +488,7 @@ class Part(Command):
         self.message = message
 
     def encode(self):
-        super(Part, self).encode(self.channel)
+        return super(Part, self).encode(self.channel, self.message)
 
 
 # Section 3.2.4
@@ -345,62 +559,231 @@ class Kick(Command):
         return super(Kick, self).encode(self.channel, self.nickname, self.comment)
 
 
-# Section 3.3.1
-class PrivateMessage(Command):
-    __slots__ = ('recipient', 'message')
+class TextMessage(Command):
+    """
+    Base class for :class:`PrivateMessage` and :class:`Notice`.
 
-    command = 'PRIVMSG'
-    allowed_replies = (ERR_NORECIPIENT, ERR_NOTEXTTOSEND, ERR_CANNOTSENDTOCHAN, ERR_NOTOPLEVEL,
-                       ERR_WILDTOPLEVEL, ERR_TOOMANYTARGETS, ERR_NOSUCHNICK, RPL_AWAY)
+    Messages consisting of a single CTCP message are decoded as :class:`CTCPMessage` (or one of its
+    subclasses) instead. Any CTCP messages embedded in other messages are available via
+    :attr:`ctcp_messages`.
+
+    :ivar str recipient: nickname or channel name the message was sent to
+    :ivar str message: the message text
+    """
+
+    __slots__ = ('recipient', 'message')
 
     def __init__(self, sender, recipient, message):
-        super(PrivateMessage, self).__init__(sender)
+        super(TextMessage, self).__init__(sender)
         self.recipient = recipient
         self.message = message
 
+    @classmethod
+    def decode(cls, sender, *params):
+        if len(params) == 2 and delimiter in params[1]:
+            text, messages = extract_ctcp(params[1])
+            if len(messages) == 1 and not text.strip():
+                tag, data = messages[0]
+                return CTCPMessage.create(sender, params[0], tag, data, cls is Notice)
+
+        return super(TextMessage, cls).decode(sender, *params)
+
+    @property
+    def text(self):
+        """The message text with any embedded CTCP messages removed."""
+        return extract_ctcp(self.message)[0]
+
+    @property
+    def ctcp_messages(self):
+        """A list of CTCP messages embedded in the message text."""
+        is_reply = self.command == 'NOTICE'
+        return [CTCPMessage.create(self.sender, self.recipient, tag, data, is_reply)
+                for tag, data in extract_ctcp(self.message)[1]]
+
     def encode(self):
-        return super(PrivateMessage, self).encode(self.recipient, self.message)
+        return super(TextMessage, self).encode(self.recipient, self.message)
 
 
-# Section 3.3.2
-class Notice(Command):
-    __slots__ = ('recipient', 'message')
+# Section 3.3.1
+class PrivateMessage(TextMessage):
+    __slots__ = ()
 
-    command = 'NOTICE'
+    command = 'PRIVMSG'
     allowed_replies = (ERR_NORECIPIENT, ERR_NOTEXTTOSEND, ERR_CANNOTSENDTOCHAN, ERR_NOTOPLEVEL,
-                       ERR_WILDTOPLEVEL, ERR_TOOMANYTARGETS, ERR_NOSUCHNICK)
+                       ERR_WILDTOPLEVEL, ERR_TOOMANYTARGETS, ERR_NOSUCHNICK, RPL_AWAY)
 
-    def __init__(self, sender, recipient, message):
-        super(Notice, self).__init__(sender)
-        self.recipient = recipient
-        self.message = message
 
-    @classmethod
-    def decode(cls, sender, *params):
-        recipient, message = params
-        if message.startswith('\x01'):
-            return CTCPMessage(sender, recipient, message[1:-1])
-        else:
-            return Notice(sender, *params)
+# Section 3.3.2
+class Notice(TextMessage):
+    __slots__ = ()
 
-    def encode(self):
-        return super(Notice, self).encode(self.recipient, self.message)
+    command = 'NOTICE'
+    allowed_replies = (ERR_NORECIPIENT, ERR_NOTEXTTOSEND, ERR_CANNOTSENDTOCHAN, ERR_NOTOPLEVEL,
+                       ERR_WILDTOPLEVEL, ERR_TOOMANYTARGETS, ERR_NOSUCHNICK)
 
 
 class CTCPMessage(IRCEvent):
     """
     Represents a client-to-client protocol message.
 
-    :ivar str recipient:
+    Queries are sent as ``PRIVMSG`` and replies as ``NOTICE``.
+
+    :ivar str recipient: nickname or channel name the message was sent to
+    :ivar str tag: the CTCP tag (``VERSION``, ``ACTION`` etc.)
+    :ivar str data: parameters of the message (``None`` if there were none)
+    :ivar bool is_reply: ``True`` if this is a reply to a query
     """
 
-    def __init__(self, sender, recipient, message):
+    __slots__ = ('recipient', 'tag', 'data', 'is_reply')
+
+    def __init__(self, sender, recipient, tag, data=None, is_reply=False):
         super(CTCPMessage, self).__init__(sender)
         self.recipient = recipient
-        self.message = message
+        self.tag = tag
+        self.data = data
+        self.is_reply = is_reply
+
+    @staticmethod
+    def create(sender, recipient, tag, data=None, is_reply=False):
+        """
+        Create a CTCP message of the appropriate subclass for the given tag.
+
+        :rtype: CTCPMessage
+
+        """
+        cls = ctcp_types.get(tag)
+        if cls is None:
+            return CTCPMessage(sender, recipient, tag, data, is_reply)
+
+        return cls.from_data(sender, recipient, data, is_reply)
+
+    @property
+    def command(self):
+        return 'NOTICE' if self.is_reply else 'PRIVMSG'
+
+    @property
+    def message(self):
+        """The message text between the CTCP delimiters."""
+        return self.tag + ' ' + self.data if self.data else self.tag
+
+    def reply(self, data=None):
+        """
+        Create a reply to this query, addressed to the sender.
+
+        :param str data: parameters of the reply
+        :rtype: CTCPMessage
+
+        """
+        return CTCPMessage(None, self.sender.partition('!')[0], self.tag, data, True)
 
     def encode(self):
-        return super(CTCPMessage, self).encode(self.recipient, '\x01' + self.message + '\x01')
+        return super(CTCPMessage, self).encode(self.command, self.recipient,
+                                               join_tagged(self.tag, self.data))
+
+
+class CTCPAction(CTCPMessage):
+    """A CTCP ``ACTION`` (``/me``) message. The text is available as :attr:`data`."""
+
+    __slots__ = ()
+
+    def __init__(self, sender, recipient, text, is_reply=False):
+        super(CTCPAction, self).__init__(sender, recipient, 'ACTION', text, is_reply)
+
+    @classmethod
+    def from_data(cls, sender, recipient, data, is_reply):
+        return cls(sender, recipient, data or '', is_reply)
+
+
+class CTCPVersion(CTCPMessage):
+    """A CTCP ``VERSION`` query or reply. The reply's version string is in :attr:`data`."""
+
+    __slots__ = ()
+
+    def __init__(self, sender, recipient, version=None, is_reply=False):
+        super(CTCPVersion, self).__init__(sender, recipient, 'VERSION', version, is_reply)
+
+    @classmethod
+    def from_data(cls, sender, recipient, data, is_reply):
+        return cls(sender, recipient, data, is_reply)
+
+
+class CTCPPing(CTCPMessage):
+    """A CTCP ``PING`` query or reply. The token to be echoed back is in :attr:`data`."""
+
+    __slots__ = ()
+
+    def __init__(self, sender, recipient, token=None, is_reply=False):
+        super(CTCPPing, self).__init__(sender, recipient, 'PING', token, is_reply)
+
+    @classmethod
+    def from_data(cls, sender, recipient, data, is_reply):
+        return cls(sender, recipient, data, is_reply)
+
+
+class CTCPTime(CTCPMessage):
+    """A CTCP ``TIME`` query or reply. The reply's time string is in :attr:`data`."""
+
+    __slots__ = ()
+
+    def __init__(self, sender, recipient, time=None, is_reply=False):
+        super(CTCPTime, self).__init__(sender, recipient, 'TIME', time, is_reply)
+
+    @classmethod
+    def from_data(cls, sender, recipient, data, is_reply):
+        return cls(sender, recipient, data, is_reply)
+
+
+class CTCPDCC(CTCPMessage):
+    """
+    A DCC (Direct Client-to-Client) offer such as ``DCC SEND`` or ``DCC CHAT``.
+
+    :ivar str type: the DCC type (``SEND``, ``CHAT`` etc.)
+    :ivar str argument: the file name (for ``SEND``) or protocol (for ``CHAT``)
+    :ivar str address: IP address to connect to
+    :ivar int port: port to connect to
+    :ivar int size: size of the offered file, if given
+    """
+
+    __slots__ = ('type', 'argument', 'address', 'port', 'size')
+
+    def __init__(self, sender, recipient, type_, argument, address, port, size=None,
+                 is_reply=False):
+        self.type = type_.upper()
+        self.argument = argument
+        self.address = address
+        self.port = int(port)
+        self.size = None if size is None else int(size)
+        argument = '"%s"' % argument if ' ' in argument else argument
+        if ':' not in address:
+            address = str(pack_ipv4(address))
+
+        data = '%s %s %s %d' % (self.type, argument, address, self.port)
+        if self.size is not None:
+            data += ' %d' % self.size
+
+        super(CTCPDCC, self).__init__(sender, recipient, 'DCC', data, is_reply)
+
+    @classmethod
+    def from_data(cls, sender, recipient, data, is_reply):
+        match = dcc_re.match(data or '')
+        if not match:
+            return CTCPMessage(sender, recipient, 'DCC', data, is_reply)
+
+        type_, argument, address, port, size = match.groups()
+        try:
+            if address.isdigit():
+                address = unpack_ipv4(address)
+
+            return cls(sender, recipient, type_, argument.strip('"'), address, port, size,
+                       is_reply)
+        except ProtocolError:
+            # Anyone can send these, so an invalid address must not abort decoding
+            return CTCPMessage(sender, recipient, 'DCC', data, is_reply)
+
+
+ctcp_types = {'ACTION': CTCPAction, 'VERSION': CTCPVersion, 'PING': CTCPPing, 'TIME': CTCPTime,
+              'DCC': CTCPDCC}
+dcc_re = re.compile(r'(\S+) ("[^"]*"|\S+) (\S+) (\d+)(?: (\d+))?')
 
 
 # Section 3.4.1
@@ -514,7 +897,8 @@ class Connect(Command):
         self.remote_server = remote_server
 
     def encode(self):
-        return super(Connect, self).encode(self.target_server, self.port, self.remote_server)
+        return super(Connect, self).encode(self.target_server, str(self.port),
+                                           self.remote_server)
 
 
 # Section 3.4.8
@@ -749,25 +1133,373 @@ class Ison(Command):
         return super(Ison, self).encode(*self.nicknames)
 
 
+# IRCv3 capability negotiation
+class Cap(Command):
+    """
+    A capability negotiation command.
+
+    Clients send ``CAP <subcommand> [capabilities]`` while servers send
+    ``CAP <target> <subcommand> [*] [capabilities]``, where ``*`` means that the reply continues
+    on another line.
+
+    :ivar str subcommand: ``LS``, ``LIST``, ``REQ``, ``ACK``, ``NAK``, ``NEW``, ``DEL`` or ``END``
+    :ivar str capabilities: space separated capabilities (or the protocol version for ``LS``
+        requests)
+    :ivar str target: nickname of the client (or ``*``), only set by servers
+    :ivar bool more: ``True`` if the server will send more capabilities on the next line
+    """
+
+    __slots__ = ('subcommand', 'capabilities', 'target', 'more')
+
+    command = 'CAP'
+    subcommands = frozenset(['LS', 'LIST', 'REQ', 'ACK', 'NAK', 'NEW', 'DEL', 'END'])
+
+    def __init__(self, sender, subcommand, capabilities=None, target=None, more=False):
+        super(Cap, self).__init__(sender)
+        self.subcommand = subcommand.upper()
+        self.capabilities = capabilities
+        self.target = target
+        self.more = more
+
+    @classmethod
+    def decode(cls, sender, *params):
+        if params and params[0].upper() in cls.subcommands:
+            target = None
+        elif len(params) >= 2:
+            target, params = params[0], params[1:]
+        else:
+            raise ProtocolError('wrong number of arguments for CAP')
+
+        more = len(params) > 2 and params[1] == '*'
+        if more:
+            params = params[:1] + params[2:]
+
+        if len(params) > 2:
+            raise ProtocolError('wrong number of arguments for CAP')
+
+        return cls(sender, params[0], params[1] if len(params) > 1 else None, target, more)
+
+    @property
+    def capability_values(self):
+        """
+        The capabilities as a dictionary of name to value (``None`` for capabilities without one).
+
+        """
+        values = {}
+        if self.capabilities:
+            for capability in self.capabilities.split(' '):
+                if capability:
+                    name, _, value = capability.partition('=')
+                    values[name] = value or None
+
+        return values
+
+    def encode(self):
+        return super(Cap, self).encode(self.target, self.subcommand, '*' if self.more else None,
+                                       self.capabilities)
+
+
+# IRCv3 SASL authentication
+class Authenticate(Command):
+    """
+    Carries one chunk of a SASL exchange.
+
+    :ivar str data: the mechanism name, a base64 encoded chunk, ``+`` (empty) or ``*`` (abort)
+    """
+
+    __slots__ = ('data',)
+
+    command = 'AUTHENTICATE'
+    allowed_replies = (RPL_LOGGEDIN, ERR_NICKLOCKED, RPL_SASLSUCCESS, ERR_SASLFAIL,
+                       ERR_SASLTOOLONG, ERR_SASLABORTED, ERR_SASLALREADY, RPL_SASLMECHS)
+
+    def __init__(self, sender, data):
+        super(Authenticate, self).__init__(sender)
+        self.data = data
+
+    def encode(self):
+        return super(Authenticate, self).encode(self.data)
+
+
+# IRCv3 batches
+class Batch(Command):
+    """
+    Starts or ends a batch of related events.
+
+    :ivar str reference: ``+`` followed by the reference tag to start a batch, ``-`` followed by
+        it to end one
+    :ivar str type: the type of the batch (``netsplit``, ``netjoin`` etc.), only for starting
+    :ivar tuple params: additional parameters for the batch type
+    """
+
+    __slots__ = ('reference', 'type', 'params')
+
+    command = 'BATCH'
+
+    def __init__(self, sender, reference, type_=None, *params):
+        super(Batch, self).__init__(sender)
+        self.reference = reference
+        self.type = type_
+        self.params = params
+
+    def encode(self):
+        return super(Batch, self).encode(self.reference, self.type, *self.params)
+
+
+# Server protocol channel burst (TS6)
+class SJoin(Command):
+    """
+    Introduces a channel and some or all of its members to another server.
+
+    :ivar str timestamp: creation time of the channel (as a UNIX timestamp), used to decide which
+        side's modes win when the channel exists on both servers
+    :ivar str channel: name of the channel
+    :ivar str modes: the channel modes (like ``+ntk``)
+    :ivar tuple modeparams: parameters of the channel modes
+    :ivar str members: space separated nicknames of the members, prefixed with their membership
+        prefixes (like ``@``)
+    """
+
+    __slots__ = ('timestamp', 'channel', 'modes', 'modeparams', 'members')
+
+    command = 'SJOIN'
+
+    def __init__(self, sender, timestamp, channel, modes, *args):
+        super(SJoin, self).__init__(sender)
+        if not args:
+            raise TypeError('the member list is missing')
+
+        self.timestamp = timestamp
+        self.channel = channel
+        self.modes = modes
+        self.modeparams = args[:-1]
+        self.members = args[-1]
+
+    def encode(self):
+        params = (self.timestamp, self.channel, self.modes) + tuple(self.modeparams)
+        return super(SJoin, self).encode(*(params + (self.members,)))
+
+
+class BatchedEvents(IRCEvent):
+    """
+    A completed batch, produced in place of the individual events in it.
+
+    :ivar str reference: the reference tag of the batch (without the ``+`` or ``-``)
+    :ivar str type: the type of the batch (``netsplit``, ``netjoin`` etc.)
+    :ivar tuple params: additional parameters for the batch type
+    :ivar list events: the events in the batch, including any nested :class:`BatchedEvents`
+    """
+
+    __slots__ = ('reference', 'type', 'params', 'events')
+
+    def __init__(self, sender, reference, type_, params=(), events=None):
+        super(BatchedEvents, self).__init__(sender)
+        self.reference = reference
+        self.type = type_
+        self.params = params
+        self.events = events if events is not None else []
+
+    def encode(self):
+        start = Batch(self.sender, '+' + self.reference, self.type, *self.params)
+        start._tags = self._tags
+        end = Batch(self.sender, '-' + self.reference)
+        return start.encode() + ''.join(event.encode() for event in self.events) + end.encode()
+
+
+class RawEvent(object):
+    """
+    An undecoded message, produced by connections in raw mode.
+
+    Only the command word is decoded. The rest of the message is kept as bytes, and is split into
+    parameters on first access. Use the ``decode_*`` methods to decode parts of the message on
+    demand, or :meth:`decode` to get the corresponding event object.
+
+    :ivar bytes line: the complete message, including any tags but excluding the CRLF
+    :ivar bytes raw_tags: the tag section (without the leading ``@``), or ``None``
+    :ivar bytes sender: the message prefix (without the leading ``:``), or ``None``
+    :ivar str command: the command word or the numeric reply code
+    """
+
+    __slots__ = ('line', 'raw_tags', 'sender', 'command', '_rest', '_params', '_event')
+
+    def __init__(self, line, raw_tags, sender, command, rest):
+        self.line = line
+        self.raw_tags = raw_tags
+        self.sender = sender
+        self.command = command
+        self._rest = rest
+        self._params = self._event = None
+
+    @property
+    def params(self):
+        """Return the parameters of the message as a list of bytes."""
+        if self._params is None:
+            self._params = parse_raw_params(self._rest)
+
+        return self._params
+
+    def get_tag(self, key, default=None):
+        """Return the (decoded) value of the given message tag, or ``default`` if it's missing."""
+        if self.raw_tags is None:
+            return default
+
+        return parse_tags(self.raw_tags.decode('utf-8', 'replace')).get(key, default)
+
+    def decode_sender(self, decoder=codecs.getdecoder('utf-8'),
+                      fallback_decoder=codecs.getdecoder('iso-8859-1')):
+        """Return the decoded sender, or ``None`` if the message has no prefix."""
+        if self.sender is None:
+            return None
+
+        return decode_text(self.sender, decoder, fallback_decoder)
+
+    def decode_param(self, index, decoder=codecs.getdecoder('utf-8'),
+                     fallback_decoder=codecs.getdecoder('iso-8859-1')):
+        """
+        Decode a single parameter.
+
+        :param int index: index of the parameter in :attr:`params`
+        :raises IndexError: if there is no such parameter
+
+        """
+        return decode_text(self.params[index], decoder, fallback_decoder)
+
+    def decode(self, decoder=codecs.getdecoder('utf-8'),
+               fallback_decoder=codecs.getdecoder('iso-8859-1')):
+        """
+        Decode the message into an event object.
+
+        The result is cached, so the decoders only matter on the first call.
+
+        :raises ProtocolError: if the message violates the protocol
+
+        """
+        if self._event is None:
+            self._event = decode_event(bytearray(self.line + b'\r\n'), decoder,
+                                       fallback_decoder, len(self.line) + 2)
+
+        return self._event
+
+
+class OversizedMessage(IRCEvent):
+    """
+    Takes the place of a received message that was too long to be processed.
+
+    The contents of the message are discarded. The connection can keep going after this.
+
+    :ivar int length: length of the message (or its tag section), including the line terminator
+        (if it was received)
+    :ivar bool tags_exceeded: ``True`` if the tag section was too long, ``False`` if the rest of
+        the message was
+    """
+
+    __slots__ = ('length', 'tags_exceeded')
+
+    def __init__(self, length, tags_exceeded=False):
+        super(OversizedMessage, self).__init__(None)
+        self.length = length
+        self.tags_exceeded = tags_exceeded
+
+
 commands = {cls.command: cls for cls in locals().values()  # type: ignore
-            if isinstance(cls, type) and issubclass(cls, Command)}
+            if isinstance(cls, type) and issubclass(cls, Command) and cls.command}
+
+
+def decode_text(data, decoder, fallback_decoder):
+    """Decode bytes using ``decoder``, falling back to ``fallback_decoder`` if that fails."""
+    try:
+        return decoder(data)[0]
+    except UnicodeDecodeError:
+        return fallback_decoder(data, 'replace')[0]
+
+
+def parse_params(rest):
+    """
+    Split the parameter part of a message into individual parameters.
+
+    :param str rest: everything after the command word
+    :rtype: list
+
+    """
+    params = []
+    if rest:
+        parts = rest.split(' ')
+        for i, param in enumerate(parts):
+            if param.startswith(':'):
+                param = param[1:]
+                if parts[i + 1:]:
+                    param += ' ' + ' '.join(parts[i + 1:])
+
+                params.append(param)
+                break
+            elif param:
+                params.append(param)
+
+    return params
 
 
 def decode_event(buffer, decoder=codecs.getdecoder('utf-8'),
-                 fallback_decoder=codecs.getdecoder('iso-8859-1')):
-    end_index = buffer.find(b'\r\n')
-    if end_index == -1:
-        return None
-    elif end_index > 510:
+                 fallback_decoder=codecs.getdecoder('iso-8859-1'), max_line_length=512,
+                 encoding_cache=None):
+    """
+    Decode the first complete message in the buffer and remove it from the buffer.
+
+    Messages may be terminated by either CRLF or a lone LF. Empty lines are skipped. A leading
+    IRCv3 tag section is stored on the event as is; the tags are only parsed when accessed. The
+    tag section may be up to :data:`max_tags_length` bytes long, separately from the limit on the
+    rest of the message.
+
+    A message that exceeds either limit is removed from the buffer and reported as an
+    :class:`OversizedMessage`.
+
+    :param bytearray buffer: the input buffer
+    :param int max_line_length: maximum length of the message, excluding the tags but including
+        the trailing CRLF
+    :param encoding_cache: an :class:`~ircproto.encoding.EncodingCache` for choosing the decoder
+        based on the sender, or ``None``
+    :return: the decoded event, or ``None`` if the buffer does not contain a complete message
+    :raises ProtocolError: if the message violates the protocol
+
+    """
+    while True:
+        end_index = buffer.find(b'\n')
+        if end_index == -1:
+            return None
+
+        line_end = end_index - 1 if end_index and buffer[end_index - 1] == 13 else end_index
+        if line_end:
+            break
+
+        # Empty messages are silently ignored (section 2.3.1)
+        del buffer[:end_index + 1]
+
+    tags = None
+    start_index = 0
+    if buffer[:1] == b'@':
+        start_index = buffer.find(b' ', 0, line_end) + 1
+        if start_index == 0 or start_index == line_end:
+            del buffer[:end_index + 1]
+            raise ProtocolError('received a message with only tags')
+        elif start_index > max_tags_length:
+            del buffer[:end_index + 1]
+            return OversizedMessage(start_index, True)
+
+        tags = buffer[1:start_index - 1].decode('utf-8', 'replace')
+
+    if line_end - start_index + 2 > max_line_length:
         # Section 2.3
-        raise ProtocolError('received oversized message (%d bytes)' % (end_index + 2))
+        del buffer[:end_index + 1]
+        return OversizedMessage(line_end - start_index + 2)
 
-    try:
-        message = decoder(buffer[:end_index])[0]
-    except UnicodeDecodeError:
-        message = fallback_decoder(buffer[:end_index], 'replace')[0]
+    if encoding_cache is not None:
+        message = encoding_cache.decode(buffer[start_index:line_end], decoder, fallback_decoder)
+    else:
+        try:
+            message = decoder(buffer[start_index:line_end])[0]
+        except UnicodeDecodeError:
+            message = fallback_decoder(buffer[start_index:line_end], 'replace')[0]
 
-    del buffer[:end_index + 2]
+    del buffer[:end_index + 1]
 
     if message[0] == ':':
         prefix, _, rest = message[1:].partition(' ')
@@ -777,25 +1509,97 @@ def decode_event(buffer, decoder=codecs.getdecoder('utf-8'),
         command, _, rest = message.partition(' ')
 
     if command.isdigit():
-        return Reply(prefix, command, rest)
+        event = Reply(prefix, command, rest)
+        event._tags = tags
+        return event
 
     try:
         command_class = commands[command]
     except KeyError:
         raise UnknownCommand(command)
 
+    event = command_class.decode(prefix, *parse_params(rest))
+    event._tags = tags
+    return event
+
+
+def parse_raw_params(rest):
+    """
+    Split the parameter part of an undecoded message into individual parameters.
+
+    :param bytes rest: everything after the command word
+    :return: a list of bytes
+
+    """
     params = []
     if rest:
-        parts = rest.split(' ')
+        parts = rest.split(b' ')
         for i, param in enumerate(parts):
-            if param.startswith(':'):
-                param = param[1:]
-                if parts[i + 1:]:
-                    param += ' ' + ' '.join(parts[i + 1:])
-
-                params.append(param)
+            if param[:1] == b':':
+                params.append(b' '.join([param[1:]] + parts[i + 1:]))
                 break
             elif param:
                 params.append(param)
 
-    return command_class.decode(prefix, *params)
+    return params
+
+
+def decode_raw_event(buffer, max_line_length=512):
+    """
+    Remove the first complete message from the buffer without decoding its text.
+
+    The message is framed and subject to the same length limits as with :func:`decode_event`.
+
+    :param bytearray buffer: the input buffer
+    :param int max_line_length: maximum length of the message, excluding the tags but including
+        the trailing CRLF
+    :return: a :class:`RawEvent` (or an :class:`OversizedMessage`), or ``None`` if the buffer does
+        not contain a complete message
+    :raises ProtocolError: if the message violates the protocol
+
+    """
+    while True:
+        end_index = buffer.find(b'\n')
+        if end_index == -1:
+            return None
+
+        line_end = end_index - 1 if end_index and buffer[end_index - 1] == 13 else end_index
+        if line_end:
+            break
+
+        # Empty messages are silently ignored (section 2.3.1)
+        del buffer[:end_index + 1]
+
+    line = bytes(buffer[:line_end])
+    del buffer[:end_index + 1]
+
+    start_index = 0
+    if line[:1] == b'@':
+        start_index = line.find(b' ') + 1
+        if start_index == 0 or start_index == line_end:
+            raise ProtocolError('received a message with only tags')
+        elif start_index > max_tags_length:
+            return OversizedMessage(start_index, True)
+
+    if line_end - start_index + 2 > max_line_length:
+        # Section 2.3
+        return OversizedMessage(line_end - start_index + 2)
+
+    tags = line[1:start_index - 1] if start_index else None
+    message = line[start_index:]
+    if message[:1] == b':':
+        prefix, _, rest = message[1:].partition(b' ')
+        command, _, rest = rest.partition(b' ')
+    else:
+        prefix = None
+        command, _, rest = message.partition(b' ')
+
+    try:
+        command = command.decode('ascii')
+    except UnicodeDecodeError:
+        raise UnknownCommand(command.decode('iso-8859-1'))
+
+    if not command.isdigit() and command not in commands:
+        raise UnknownCommand(command)
+
+    return RawEvent(line, tags, prefix, command, rest)
@@ -0,0 +1,199 @@
+"""
+Handing listening sockets and client connections over to a new server process.
+
+For a restart without disconnecting anyone, the old process passes its listening sockets and
+client sockets to the new process over a UNIX domain socket, as ``SCM_RIGHTS`` ancillary data.
+Along with each client socket it sends the state of the matching
+:class:`~ircproto.connection.IRCServerConnection`: the nickname, user name and host, the codec
+settings, the partially received input line and any output not yet written to the socket. A
+snapshot of the server's channels (see :mod:`ircproto.snapshot`) is sent too, so the new process
+can continue exactly where the old one stopped.
+
+The old process must stop reading from and writing to the client sockets before calling
+:func:`send_handoff`, and close its copies of the sockets afterwards. The listening sockets stay
+open throughout, so connection attempts made during the handoff wait in the listen backlog.
+
+Passing file descriptors requires Python 3 and a platform supporting
+:meth:`socket.socket.sendmsg` with ``SCM_RIGHTS`` (Linux and most other Unix systems).
+"""
+from __future__ import unicode_literals
+
+import array
+import codecs
+import os
+import socket
+import struct
+from io import BytesIO
+
+from ircproto.connection import IRCServerConnection
+from ircproto.serialization import read_value, write_value
+from ircproto.snapshot import Snapshot, write_snapshot
+
+#: version of the handoff protocol
+handoff_version = 2
+
+#: maximum number of file descriptors sent in a single message (the Linux limit is 253)
+max_fds_per_message = 250
+
+length_struct = struct.Struct('>I')
+
+
+def send_message(channel, value, fds=()):
+    """
+    Send a value and a number of file descriptors as a single message.
+
+    :param socket.socket channel: a connected UNIX domain stream socket
+    :param value: a value supported by :func:`~ircproto.serialization.write_value`
+    :param fds: file descriptors to send along with the value
+
+    """
+    payload = bytearray()
+    write_value(payload, value)
+    data = length_struct.pack(len(payload)) + bytes(payload)
+    ancdata = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))] if fds else []
+    sent = channel.sendmsg([data], ancdata)
+    if sent < len(data):
+        channel.sendall(data[sent:])
+
+
+def receive_message(channel):
+    """
+    Receive a message sent with :func:`send_message`.
+
+    :param socket.socket channel: a connected UNIX domain stream socket
+    :return: a tuple of (value, list of file descriptors)
+    :raises EOFError: if the connection was closed before a complete message was received
+    :raises ValueError: if the file descriptors could not all be received
+
+    """
+    fds = array.array('i')
+    data, ancdata, flags, _ = channel.recvmsg(
+        length_struct.size, socket.CMSG_SPACE(max_fds_per_message * fds.itemsize))
+    for level, kind, cmsg_data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cmsg_data[:len(cmsg_data) - len(cmsg_data) % fds.itemsize])
+
+    if flags & socket.MSG_CTRUNC:
+        for fd in fds:
+            os.close(fd)
+
+        raise ValueError('file descriptors were lost in the handoff')
+
+    data += receive_exactly(channel, length_struct.size - len(data))
+    length = length_struct.unpack(data)[0]
+    value = read_value(bytearray(receive_exactly(channel, length)), 0)[0]
+    return value, list(fds)
+
+
+def receive_exactly(channel, length):
+    chunks = []
+    while length > 0:
+        chunk = channel.recv(length)
+        if not chunk:
+            raise EOFError('the handoff channel was closed prematurely')
+
+        chunks.append(chunk)
+        length -= len(chunk)
+
+    return b''.join(chunks)
+
+
+def send_handoff(channel, server, listeners, connections, include_snapshot=True):
+    """
+    Hand over the listening sockets, the client connections and the server state.
+
+    :param socket.socket channel: a connected UNIX domain stream socket to the new process
+    :param ircproto.states.IRCServer server: the server whose state to hand over
+    :param listeners: the listening sockets
+    :param connections: an iterable of (socket, :class:`~ircproto.connection.IRCServerConnection`)
+        tuples
+    :param bool include_snapshot: ``False`` to only hand over the connections, without the state
+        of the channels
+
+    """
+    snapshot = None
+    if include_snapshot:
+        buffer = BytesIO()
+        write_snapshot(server, buffer)
+        snapshot = buffer.getvalue()
+
+    # The socket family and type are sent along, as only Python 3.7+ detects them from the fd
+    connections = list(connections)
+    items = [(sock, [int(sock.family), int(sock.type), sock.proto, None]) for sock in listeners]
+    for sock, conn in connections:
+        items.append((sock, [int(sock.family), int(sock.type), sock.proto,
+                             [conn.host, conn.nickname, conn.username, list(conn.encodings),
+                              conn.max_line_length, bytes(conn._input_buffer),
+                              bytes(conn._output_buffer), conn._discarded]]))
+
+    send_message(channel, [handoff_version, snapshot, len(listeners), len(connections)])
+    for i in range(0, len(items), max_fds_per_message):
+        chunk = items[i:i + max_fds_per_message]
+        send_message(channel, [record for _, record in chunk],
+                     [sock.fileno() for sock, _ in chunk])
+
+
+def receive_handoff(channel, server):
+    """
+    Receive the listening sockets, client connections and server state from the old process.
+
+    Registered clients are added to the server, and the channels are restored from the snapshot
+    (if one was sent). Connections from clients that had not finished registering are returned
+    but not added to the server.
+
+    :param socket.socket channel: a connected UNIX domain stream socket to the old process
+    :param ircproto.states.IRCServer server: the (freshly created) server to restore into
+    :return: a tuple of (list of listening sockets, list of
+        (socket, :class:`~ircproto.connection.IRCServerConnection`) tuples)
+    :raises ValueError: if the old process uses an incompatible version of the handoff protocol
+
+    """
+    header = receive_message(channel)[0]
+    if header[0] != handoff_version:
+        raise ValueError('unsupported handoff version: %s' % header[0])
+
+    snapshot, listener_count, connection_count = header[1:]
+    listeners = []
+    connections = []
+    while len(listeners) + len(connections) < listener_count + connection_count:
+        records, fds = receive_message(channel)
+        if len(fds) != len(records):
+            for fd in fds:
+                os.close(fd)
+
+            raise ValueError('expected %d file descriptors, got %d' % (len(records), len(fds)))
+
+        for (family, type_, proto, record), fd in zip(records, fds):
+            sock = socket.socket(family, type_, proto, fileno=fd)
+            if record is None:
+                listeners.append(sock)
+            else:
+                connections.append((sock, restore_connection(server, record)))
+
+    registered = [conn for _, conn in connections if conn.nickname]
+    if snapshot is not None:
+        prefixes = dict((conn.prefix, conn) for conn in registered)
+        Snapshot(snapshot).restore(server, connection_factory=prefixes.get)
+
+    for conn in registered:
+        if conn.nickname not in server.nicknames:
+            server.add_client_connection(conn)
+
+    return listeners, connections
+
+
+def restore_connection(server, record):
+    (host, nickname, username, encodings, max_line_length, input_buffer, output_buffer,
+     discarded) = record
+    conn = IRCServerConnection(host, server)
+    conn.nickname = nickname
+    conn.username = username
+    output_encoding, input_encoding, fallback_encoding = conn.encodings = tuple(encodings)
+    conn.output_codec = codecs.getencoder(output_encoding)
+    conn.input_decoder = codecs.getdecoder(input_encoding)
+    conn.fallback_decoder = codecs.getdecoder(fallback_encoding)
+    conn.max_line_length = max_line_length
+    conn._input_buffer = bytearray(input_buffer)
+    conn._output_buffer = bytearray(output_buffer)
+    conn._discarded = discarded
+    return conn
@@ -0,0 +1,185 @@
+"""
+Parsing of the ``RPL_ISUPPORT`` (005) reply, through which servers advertise their limits and
+features.
+
+:class:`ServerSupport` starts out with the :rfc:`2812` defaults and swaps in validators and lookup
+tables matching what the server advertises. The compiled validators are shared between all
+connections to servers with the same limits.
+"""
+from __future__ import unicode_literals
+
+import re
+
+from ircproto.exceptions import ProtocolError
+from ircproto.utils import casefold, casemaps
+
+try:
+    from typing import Dict, Pattern, Tuple  # noqa: F401
+except ImportError:  # Python < 3.5
+    pass
+
+nickname_chars = r'a-zA-Z\[\]\\`_^{|}'
+escape_re = re.compile(r'\\x([0-9a-fA-F]{2})')
+validator_cache = {}  # type: Dict[Tuple[int, str, int], Tuple[Pattern, Pattern]]
+
+#: the :rfc:`2812` defaults, restored when the server negates the token (``-TOKEN``)
+default_tokens = {'NICKLEN': '9', 'CHANTYPES': '#&+!', 'CHANNELLEN': '50',
+                  'CASEMAPPING': 'rfc1459', 'PREFIX': '(ov)@+', 'CHANMODES': 'beI,k,l,aimnqpsrt',
+                  'MODES': '3', 'LINELEN': '512'}
+
+
+def unescape_value(value):
+    """Decode the ``\\xHH`` escapes in an ISUPPORT token value."""
+    if '\\' not in value:
+        return value
+
+    return escape_re.sub(lambda match: '%c' % int(match.group(1), 16), value)
+
+
+def parse_limit(value, minimum=1):
+    """
+    Parse the integer value of an ISUPPORT token.
+
+    :param value: the token value
+    :param int minimum: the smallest acceptable value
+    :return: the value as an integer, or ``None`` if it is missing, not an integer or too small
+
+    """
+    if value is True:
+        return None
+
+    try:
+        value = int(value)
+    except ValueError:
+        return None
+
+    return value if value >= minimum else None
+
+
+def compile_validators(nicklen, chantypes, channellen):
+    """
+    Return compiled regular expressions for validating nicknames and channel names.
+
+    :return: a tuple of (nickname regex, channel name regex)
+
+    """
+    key = (nicklen, chantypes, channellen)
+    validators = validator_cache.get(key)
+    if validators is None:
+        nickname_re = re.compile('[%s][%s0-9-]{0,%d}$' % (nickname_chars, nickname_chars,
+                                                          nicklen - 1))
+        channel_re = re.compile('[%s][^\x00\x07\r\n ,:]{1,%d}$' % (re.escape(chantypes),
+                                                                   channellen - 1))
+        validators = validator_cache[key] = (nickname_re, channel_re)
+
+    return validators
+
+
+class ServerSupport(object):
+    """
+    Limits and features advertised by a server.
+
+    :ivar dict tokens: all received tokens (``True`` for tokens without a value)
+    :ivar int nicklen: maximum nickname length
+    :ivar str chantypes: characters that may start a channel name
+    :ivar int channellen: maximum channel name length
+    :ivar str casemapping: the case mapping used for comparing names
+    :ivar str prefix: the membership prefixes in the ``(modes)symbols`` format
+    :ivar dict prefix_modes: membership mode letters keyed by their prefix symbol
+    :ivar str chanmodes: the channel mode types in the ``A,B,C,D`` format
+    :ivar int modes: maximum number of parametrized mode changes per ``MODE`` command (``None``
+        if unlimited)
+    :ivar int linelen: maximum line length, including the trailing CRLF
+    """
+
+    __slots__ = ('tokens', 'nicklen', 'chantypes', 'channellen', 'casemapping', 'prefix',
+                 'prefix_modes', 'chanmodes', 'modes', 'linelen', '_nickname_re', '_channel_re')
+
+    def __init__(self):
+        self.tokens = {}
+        for name, value in default_tokens.items():
+            self._apply_token(name, value)
+
+        self._compile()
+
+    def update(self, params):
+        """
+        Update the settings from the tokens of an ``RPL_ISUPPORT`` reply.
+
+        Limits with invalid values (not an integer, or too small to be usable) are ignored, and
+        the previous setting is kept. Negated tokens (``-TOKEN``) restore the default setting.
+
+        :param params: the reply parameters, excluding the target and the trailing text
+
+        """
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.startswith('-'):
+                name = name[1:]
+                self.tokens.pop(name, None)
+                if name in default_tokens:
+                    self._apply_token(name, default_tokens[name])
+            else:
+                value = unescape_value(value) if value else True
+                self.tokens[name] = value
+                self._apply_token(name, value)
+
+        self._compile()
+
+    def _apply_token(self, name, value):
+        if name == 'NICKLEN':
+            self.nicklen = parse_limit(value) or self.nicklen
+        elif name == 'CHANTYPES':
+            self.chantypes = value if value is not True else ''
+        elif name == 'CHANNELLEN':
+            # A channel name needs at least one character after the channel type
+            self.channellen = parse_limit(value, 2) or self.channellen
+        elif name == 'CASEMAPPING' and value in casemaps:
+            self.casemapping = value
+        elif name == 'PREFIX':
+            self._set_prefix(value if value is not True else '')
+        elif name == 'CHANMODES' and value is not True:
+            self.chanmodes = value
+        elif name == 'MODES':
+            self.modes = None if value is True else parse_limit(value) or self.modes
+        elif name == 'LINELEN':
+            self.linelen = parse_limit(value, 512) or self.linelen
+
+    def _set_prefix(self, prefix):
+        self.prefix = prefix
+        modes, _, symbols = prefix[1:].partition(')')
+        self.prefix_modes = dict(zip(symbols, modes))
+
+    def _compile(self):
+        self._nickname_re, self._channel_re = compile_validators(
+            self.nicklen, self.chantypes or '#', self.channellen)
+
+    def is_channel(self, name):
+        """Return ``True`` if the given name is a channel name (based on its first character)."""
+        return bool(name) and name[0] in self.chantypes
+
+    def casefold(self, name):
+        """Convert a name to its canonical form using the server's case mapping."""
+        return casefold(name, self.casemapping)
+
+    def validate_nickname(self, name):
+        """
+        Ensure that a nickname conforms to the server's restrictions.
+
+        :param str name: the nickname to validate
+        :raises ircproto.ProtocolError: if the nickname is invalid
+
+        """
+        if not self._nickname_re.match(name):
+            raise ProtocolError('invalid nickname: %s' % name)
+
+    def validate_channel_name(self, name):
+        """
+        Ensure that a channel name conforms to the server's restrictions.
+
+        :param str name: the channel name to validate
+        :raises ircproto.ProtocolError: if the channel name is invalid
+
+        """
+        if not self._channel_re.match(name):
+            raise ProtocolError('invalid channel name: %s' % name)
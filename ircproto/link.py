@@ -0,0 +1,435 @@
+"""
+Linking servers together.
+
+When two servers link, each sends the other a burst of its state: a ``NICK`` introduction
+(:rfc:`2813#section-4.1.3`) for every client, then ``SJOIN`` commands carrying the timestamp,
+modes and members of every channel, packed into as few lines as the 512 byte limit allows, and
+finally the mask lists (bans etc.) as ``MODE`` commands.
+
+A channel that exists on both servers is merged based on the channel timestamps: the older channel
+wins, and the modes and membership modes set on the side of the newer one are removed. With equal
+timestamps, the modes of both sides are kept.
+
+The events received over a link are relayed to the other linked servers, so any number of
+servers can be linked as long as the links form a tree (there is no loop detection). A nickname
+that is already in use on this server is refused with a ``KILL`` sent back over the link.
+
+A :class:`ServerLink` outlives the connection it runs on. Splitting the link does not remove the
+clients of the other server, so when the link is re-established, :meth:`ServerLink.burst` only
+needs to introduce the clients the other server has not seen yet and send the channels that
+changed after the split.
+
+The link stream can optionally be compressed with zlib. Both servers must agree on this
+beforehand.
+"""
+from __future__ import unicode_literals
+
+import zlib
+from time import time
+
+from ircproto.events import Join, Kill, Mode, Nick, SJoin
+from ircproto.exceptions import ProtocolError
+from ircproto.modes import PREFIX_MODE, ModeChange, flags_to_modes, mode_bits
+from ircproto.states import IRCChannel
+
+
+class RemoteClient(object):
+    """
+    A client connected to another server.
+
+    Events sent to a remote client are dropped, as its own server receives the channel events
+    over the link anyway.
+
+    :ivar str nickname: nickname of the client
+    :ivar str username: user name of the client
+    :ivar str host: host name of the client
+    :ivar int hopcount: distance of the client from this server, in hops
+    :ivar link: the :class:`ServerLink` the client was introduced through
+    :ivar str realname: real name of the client (``None`` if not known)
+    """
+
+    __slots__ = ('nickname', 'username', 'host', 'hopcount', 'link', 'realname')
+
+    def __init__(self, nickname, username, host, hopcount, link, realname=None):
+        self.nickname = nickname
+        self.username = username
+        self.host = host
+        self.hopcount = hopcount
+        self.link = link
+        self.realname = realname
+
+    @property
+    def prefix(self):
+        """Return the ``nickname!username@host`` prefix identifying this client."""
+        return '%s!%s@%s' % (self.nickname, self.username, self.host)
+
+    def send_event(self, event):
+        pass
+
+    def send_reply(self, code, **templatevars):
+        pass
+
+
+def pack_sjoin(server, channel, max_line_length=512):
+    """
+    Create the ``SJOIN`` commands for bursting a channel.
+
+    Every command carries the channel modes. The members are spread over as many commands as
+    needed to keep each one within the line length limit.
+
+    :param ircproto.states.IRCServer server: the server the channel is on
+    :param ircproto.states.IRCChannel channel: the channel
+    :param int max_line_length: maximum length of each encoded command, including the CRLF
+    :return: a list of :class:`~ircproto.events.SJoin` events (empty if the channel has no
+        members)
+
+    """
+    mode_table = server.mode_table
+    modes = '+'
+    params = []
+    for mode in flags_to_modes(channel.modes):
+        if mode_table.takes_param(mode, True):
+            param = channel.get_mode_param(mode)
+            if param is None:
+                continue
+
+            params.append('%s' % param)
+
+        modes += mode
+
+    prefix_modes, _, symbols = mode_table.prefix[1:].partition(')')
+    prefixes = [(mode_bits[mode], symbol) for mode, symbol in zip(prefix_modes, symbols)]
+    ts = '%d' % channel.ts
+    overhead = len(':%s SJOIN %s %s %s :\r\n' % (server.host, ts, channel.name, modes)) + \
+        sum(len(param) + 1 for param in params)
+    groups = []
+    length = overhead
+    for nickname, flags in channel.member_modes.items():
+        entry = ''.join(symbol for bit, symbol in prefixes if flags & bit) + nickname
+        if not groups or length + len(entry) + 1 > max_line_length:
+            groups.append([])
+            length = overhead
+
+        groups[-1].append(entry)
+        length += len(entry) + 1
+
+    return [SJoin(server.host, ts, channel.name, modes, *(params + [' '.join(members)]))
+            for members in groups]
+
+
+class ServerLink(object):
+    """
+    A link to another server.
+
+    Call :meth:`attach` with the connection to the other server, then :meth:`burst` to send it
+    the state of this server. The burst adds the connection to
+    :attr:`~ircproto.states.IRCServer.servers`, so the changes made after it (like clients
+    registering in :meth:`~ircproto.states.IRCServer.add_client_connection`) are relayed to the
+    other server as they happen.
+
+    Incoming data is passed to :meth:`feed_data` and outgoing data is taken from
+    :meth:`data_to_send` instead of the connection's own methods, so that the link can apply the
+    other server's state and (optionally) compress the stream.
+
+    :param ircproto.states.IRCServer server: the local server
+    :param str name: host name of the other server
+    :param bool compress: ``True`` to compress the link stream with zlib
+    :ivar connection: the :class:`~ircproto.connection.IRCServerConnection` to the other server,
+        or ``None`` while the link is split
+    :ivar float synced_at: the time up to which the other server has received the changes to
+        the channels (``None`` if it has received nothing yet)
+    """
+
+    __slots__ = ('server', 'name', 'compress', 'connection', 'synced_at', '_introduced',
+                 '_compressor', '_decompressor')
+
+    def __init__(self, server, name, compress=False):
+        self.server = server
+        self.name = name
+        self.compress = compress
+        self.connection = None
+        self.synced_at = None
+        self._introduced = set()
+        self._compressor = self._decompressor = None
+
+    def attach(self, connection):
+        """
+        Start using a (new) connection to the other server.
+
+        :param ircproto.connection.IRCServerConnection connection: the connection
+
+        """
+        if self.connection is not None:
+            self.detach()
+
+        self.connection = connection
+        if self.compress:
+            self._compressor = zlib.compressobj()
+            self._decompressor = zlib.decompressobj()
+
+    def detach(self):
+        """
+        Stop using the connection after the link has been split.
+
+        The clients of the other server and their channel memberships are kept. Changes made
+        while the link was up were relayed as they happened, so the next burst only sends the
+        changes made after this call. Does nothing if the link is already split.
+
+        """
+        if self.connection is None:
+            return
+
+        server = self.server
+        if self.connection in server.servers:
+            self._mark_introduced()
+            server.servers.remove(self.connection)
+            server.metrics.gauge('servers', len(server.servers))
+
+        self.connection = None
+        if self.synced_at is not None:
+            self.synced_at = time()
+
+    def reset(self):
+        """Forget what the other server knows, so that the next burst sends everything."""
+        self._introduced.clear()
+        self.synced_at = None
+
+    def burst(self):
+        """
+        Send the state of this server to the other server.
+
+        The first burst sends everything. Later ones only introduce the clients the other server
+        has not seen yet and send the channels that changed since :attr:`synced_at`.
+
+        :return: the number of commands sent
+
+        """
+        server = self.server
+        host = server.host
+        start = time()
+        if self.connection not in server.servers:
+            server.add_server_connection(self.connection)
+        elif self.synced_at is not None:
+            self._mark_introduced()
+
+        events = []
+        for client in list(server.nicknames.values()):
+            if isinstance(client, RemoteClient):
+                if client.link is self:
+                    continue
+
+                hopcount, realname = client.hopcount + 1, client.realname
+            else:
+                hopcount, realname = 1, None
+
+            prefix = client.prefix
+            if prefix not in self._introduced:
+                self._introduced.add(prefix)
+                events.append(Nick(host, client.nickname, '%d' % hopcount, client.username,
+                                   client.host, '1', '+', realname))
+
+        for channel in server.channels.values():
+            if self.synced_at is None or channel.changed >= self.synced_at:
+                events.extend(pack_sjoin(server, channel))
+                changes = [ModeChange(True, mode, mask)
+                           for mode, masks in sorted(channel.mode_lists.items())
+                           for mask in masks]
+                events.extend(server.mode_table.coalesce(channel.name, changes,
+                                                         server.max_mode_params, sender=host))
+
+        for event in events:
+            self.connection.send_event(event)
+
+        self.synced_at = start
+        return len(events)
+
+    def feed_data(self, data):
+        """
+        Feed data received from the other server to the connection and apply the received state.
+
+        :param bytes data: incoming data
+        :raise ircproto.ProtocolError: if the protocol is violated
+        :return: the list of events received from the connection
+
+        """
+        if self._decompressor is not None:
+            try:
+                data = self._decompressor.decompress(data)
+            except zlib.error as exc:
+                raise ProtocolError('invalid compressed data: %s' % exc)
+
+        events = self.connection.feed_data(data)
+        for event in events:
+            if isinstance(event, SJoin):
+                event = self._handle_sjoin(event)
+            elif isinstance(event, Nick) and event.hopcount is not None:
+                event = self._handle_introduction(event)
+            elif isinstance(event, Join):
+                event = self._handle_join(event)
+            elif isinstance(event, Mode) and event.target in self.server.channels:
+                changes = self.server.mode_table.parse_event(event)
+                self._apply_modes(self.server.channels[event.target], changes)
+            else:
+                continue
+
+            if event is not None:
+                self._relay(event)
+
+        return events
+
+    def data_to_send(self):
+        """
+        Return any data that is due to be sent to the other server.
+
+        :rtype: bytes
+
+        """
+        data = self.connection.data_to_send()
+        if data and self._compressor is not None:
+            data = self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        return data
+
+    def _mark_introduced(self):
+        # Everything but the other server's own clients has been sent to it by now
+        self._introduced.update(client.prefix for client in self.server.nicknames.values()
+                                if not self._is_remote(client))
+
+    def _is_remote(self, client):
+        return isinstance(client, RemoteClient) and client.link is self
+
+    def _relay(self, event):
+        for conn in self.server.servers:
+            if conn is not self.connection:
+                conn.send_event(event)
+
+    def _handle_introduction(self, event):
+        try:
+            hopcount = int(event.hopcount)
+        except ValueError:
+            raise ProtocolError('invalid hop count: %s' % event.hopcount)
+
+        server = self.server
+        client = server.nicknames.get(event.nickname)
+        if client is not None:
+            # On a nickname collision, the existing client is kept
+            if not self._is_remote(client):
+                self.connection.send_event(Kill(server.host, event.nickname,
+                                                'Nickname collision'))
+
+            return None
+
+        server.nicknames[event.nickname] = RemoteClient(
+            event.nickname, event.username, event.host, hopcount, self, event.realname)
+        return Nick(server.host, event.nickname, '%d' % (hopcount + 1), event.username,
+                    event.host, event.servertoken, event.umode, event.realname)
+
+    def _handle_sjoin(self, event):
+        try:
+            ts = int(event.timestamp)
+        except ValueError:
+            raise ProtocolError('invalid channel timestamp: %s' % event.timestamp)
+
+        mode_table = self.server.mode_table
+        channel = self.server.channels.get(event.channel)
+        removals = ()
+        if channel is None:
+            channel = self._create_channel(event.channel, 0, ts)
+            accept_modes = True
+        elif ts < channel.ts:
+            # The channel on the other side is older, so the modes set on this side are void
+            channel.ts = ts
+            removals = [ModeChange(False, mode, None) for mode in flags_to_modes(channel.modes)]
+            for nickname, flags in channel.member_modes.items():
+                removals.extend(ModeChange(False, mode, nickname)
+                                for mode in flags_to_modes(flags))
+
+            accept_modes = True
+        else:
+            accept_modes = ts == channel.ts
+
+        changes = mode_table.parse(event.modes, event.modeparams) if accept_modes else []
+
+        prefix_modes = mode_table.prefix_modes
+        members = []
+        for entry in event.members.split():
+            nickname = entry
+            modes = ''
+            while nickname and nickname[0] in prefix_modes:
+                modes += prefix_modes[nickname[0]]
+                nickname = nickname[1:]
+
+            # Only the clients introduced by the other server can be its channel members
+            client = self.server.nicknames.get(nickname)
+            if self._is_remote(client):
+                members.append(entry)
+                self._add_member(channel, client)
+                if accept_modes:
+                    changes.extend(ModeChange(True, mode, nickname) for mode in modes)
+
+        if removals:
+            # Leave out the removals of modes the other side sets again anyway
+            types = mode_table.types
+            kept = set((change.mode, change.param) if types.get(change.mode) == PREFIX_MODE
+                       else (change.mode, None) for change in changes)
+            changes = [change for change in removals
+                       if (change.mode, change.param) not in kept] + changes
+
+        self._apply_modes(channel, changes)
+        if members:
+            return SJoin(event.sender, event.timestamp, event.channel, event.modes,
+                         *(event.modeparams + (' '.join(members),)))
+
+        return None
+
+    def _handle_join(self, event):
+        client = self.server.nicknames.get((event.sender or '').partition('!')[0])
+        if not self._is_remote(client):
+            return None
+
+        channel = self.server.channels.get(event.channel)
+        if channel is None:
+            channel = self._create_channel(event.channel, self.server.default_channel_modes)
+            self._add_member(channel, client)
+            self._apply_modes(channel, [ModeChange(True, 'o', client.nickname)])
+        else:
+            self._add_member(channel, client)
+
+        return event
+
+    def _create_channel(self, name, modes, ts=None):
+        server = self.server
+        channel = server.channels[name] = IRCChannel(name, modes, ts)
+        server.metrics.gauge('channels', len(server.channels))
+        if server.journal is not None:
+            server.journal.channel_created(channel)
+
+        return channel
+
+    def _add_member(self, channel, client):
+        if client.nickname in channel.member_modes:
+            return
+
+        channel.member_modes[client.nickname] = 0
+        channel.users.append(client)
+        channel.changed = time()
+        if self.server.journal is not None:
+            self.server.journal.member_joined(channel, client, 0)
+
+        join = Join(client.prefix, channel.name)
+        for conn in channel.users:
+            conn.send_event(join)
+
+    def _apply_modes(self, channel, changes):
+        server = self.server
+        changes = server.mode_table.apply(channel, changes)
+        if changes:
+            channel.changed = time()
+            if server.journal is not None:
+                server.journal.modes_changed(channel, changes)
+
+            for mode_event in server.mode_table.coalesce(channel.name, changes,
+                                                         server.max_mode_params,
+                                                         sender=self.name):
+                for conn in channel.users:
+                    conn.send_event(mode_event)
@@ -0,0 +1,216 @@
+"""
+Optional instrumentation for connections and server state.
+
+By default, connections use :data:`null_metrics` which does nothing. To collect metrics, pass a
+:class:`Metrics` instance to the connection (or :class:`~ircproto.states.IRCServer`) and call
+:meth:`Metrics.snapshot` to export the collected values in the Prometheus text exposition format.
+"""
+from __future__ import unicode_literals
+
+from bisect import bisect_left
+
+#: default histogram buckets for encode/decode times (in seconds)
+default_buckets = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 1e-2)
+
+
+def event_label(event):
+    """
+    Return the label used to identify the type of the given event in metrics.
+
+    This is the command word for commands, the zero padded numeric code for replies and the class
+    name for anything else.
+
+    """
+    command = getattr(event, 'command', None)
+    if command:
+        return command
+
+    code = getattr(event, 'code', None)
+    if code is not None:
+        return '%03d' % code
+
+    return type(event).__name__
+
+
+class NullMetrics(object):
+    """
+    A metrics collector that discards everything.
+
+    Connections check :attr:`enabled` before taking any timings, so using this costs next to
+    nothing.
+    """
+
+    __slots__ = ()
+
+    enabled = False
+
+    def event_decoded(self, event, seconds):
+        """Record the decoding of an incoming event and the time it took."""
+
+    def event_encoded(self, event, seconds):
+        """Record the encoding of an outgoing event and the time it took."""
+
+    def bytes_received(self, count):
+        """Record the number of bytes fed to a connection."""
+
+    def bytes_sent(self, count):
+        """Record the number of bytes added to the output buffer of a connection."""
+
+    def output_buffered(self, size):
+        """Record the current size of an output buffer."""
+
+    def protocol_error(self, exception):
+        """Record a protocol violation by the peer."""
+
+    def gauge(self, name, value):
+        """Set the value of a named gauge."""
+
+
+#: the shared do-nothing metrics collector
+null_metrics = NullMetrics()
+
+
+class Histogram(object):
+    """
+    A cumulative histogram with fixed bucket boundaries.
+
+    :ivar tuple buckets: upper bounds of the buckets
+    :ivar list counts: number of observations per bucket (the last one is for ``+Inf``)
+    :ivar float sum: sum of all observed values
+    :ivar int count: number of observations
+    """
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=default_buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics(NullMetrics):
+    """
+    Collects counters and histograms in memory.
+
+    A single instance may be shared by any number of connections.
+
+    :param str namespace: prefix for the exported metric names
+    :param tuple buckets: histogram bucket boundaries for encode/decode times (in seconds)
+    :ivar dict decoded: number of decoded events per command
+    :ivar dict encoded: number of encoded events per command
+    :ivar dict decode_times: decoding time histograms per command
+    :ivar dict encode_times: encoding time histograms per command
+    :ivar int bytes_in: total number of bytes received
+    :ivar int bytes_out: total number of bytes sent
+    :ivar int output_high_water: largest output buffer size seen
+    :ivar dict errors: number of protocol errors per exception class name
+    :ivar dict gauges: values of named gauges
+    """
+
+    __slots__ = ('namespace', 'buckets', 'decoded', 'encoded', 'decode_times', 'encode_times',
+                 'bytes_in', 'bytes_out', 'output_high_water', 'errors', 'gauges')
+
+    enabled = True
+
+    def __init__(self, namespace='ircproto', buckets=default_buckets):
+        self.namespace = namespace
+        self.buckets = buckets
+        self.decoded = {}
+        self.encoded = {}
+        self.decode_times = {}
+        self.encode_times = {}
+        self.bytes_in = self.bytes_out = self.output_high_water = 0
+        self.errors = {}
+        self.gauges = {}
+
+    def event_decoded(self, event, seconds):
+        label = event_label(event)
+        self.decoded[label] = self.decoded.get(label, 0) + 1
+        histogram = self.decode_times.get(label)
+        if histogram is None:
+            histogram = self.decode_times[label] = Histogram(self.buckets)
+
+        histogram.observe(seconds)
+
+    def event_encoded(self, event, seconds):
+        label = event_label(event)
+        self.encoded[label] = self.encoded.get(label, 0) + 1
+        histogram = self.encode_times.get(label)
+        if histogram is None:
+            histogram = self.encode_times[label] = Histogram(self.buckets)
+
+        histogram.observe(seconds)
+
+    def bytes_received(self, count):
+        self.bytes_in += count
+
+    def bytes_sent(self, count):
+        self.bytes_out += count
+
+    def output_buffered(self, size):
+        if size > self.output_high_water:
+            self.output_high_water = size
+
+    def protocol_error(self, exception):
+        name = type(exception).__name__
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    def snapshot(self):
+        """
+        Export the collected metrics in the Prometheus text exposition format.
+
+        :rtype: str
+
+        """
+        lines = []
+        ns = self.namespace
+
+        def header(name, type_, help_text):
+            lines.append('# HELP %s_%s %s' % (ns, name, help_text))
+            lines.append('# TYPE %s_%s %s' % (ns, name, type_))
+
+        def labelled(name, label, values):
+            for value, count in sorted(values.items()):
+                lines.append('%s_%s{%s="%s"} %s' % (ns, name, label, value, count))
+
+        def histograms(name, histograms):
+            for command, histogram in sorted(histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append('%s_%s_bucket{command="%s",le="%s"} %d' %
+                                 (ns, name, command, bound, cumulative))
+
+                lines.append('%s_%s_sum{command="%s"} %r' % (ns, name, command, histogram.sum))
+                lines.append('%s_%s_count{command="%s"} %d' % (ns, name, command, histogram.count))
+
+        header('events_decoded_total', 'counter', 'Number of events decoded, per command')
+        labelled('events_decoded_total', 'command', self.decoded)
+        header('events_encoded_total', 'counter', 'Number of events encoded, per command')
+        labelled('events_encoded_total', 'command', self.encoded)
+        header('decode_seconds', 'histogram', 'Time spent decoding events')
+        histograms('decode_seconds', self.decode_times)
+        header('encode_seconds', 'histogram', 'Time spent encoding events')
+        histograms('encode_seconds', self.encode_times)
+        header('received_bytes_total', 'counter', 'Number of bytes received')
+        lines.append('%s_received_bytes_total %d' % (ns, self.bytes_in))
+        header('sent_bytes_total', 'counter', 'Number of bytes sent')
+        lines.append('%s_sent_bytes_total %d' % (ns, self.bytes_out))
+        header('output_buffer_high_water_bytes', 'gauge', 'Largest output buffer size seen')
+        lines.append('%s_output_buffer_high_water_bytes %d' % (ns, self.output_high_water))
+        header('protocol_errors_total', 'counter', 'Number of protocol violations, per type')
+        labelled('protocol_errors_total', 'type', self.errors)
+        for name, value in sorted(self.gauges.items()):
+            header(name, 'gauge', name.replace('_', ' ').capitalize())
+            lines.append('%s_%s %s' % (ns, name, value))
+
+        return '\n'.join(lines) + '\n'
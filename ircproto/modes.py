@@ -0,0 +1,268 @@
+"""
+Parsing, applying and generating channel mode changes.
+
+A :class:`ModeTable` knows which channel modes take parameters, based on the ``CHANMODES`` and
+``PREFIX`` ISUPPORT tokens. It turns mode strings into lists of :class:`ModeChange` tuples, applies
+them to :class:`~ircproto.states.IRCChannel` instances and packs outgoing changes into as few
+``MODE`` commands as the server's ``MODES`` limit allows.
+
+Modes without list semantics are stored on channels as bit flags (see :data:`mode_bits`).
+"""
+from __future__ import unicode_literals
+
+import string
+from collections import namedtuple
+
+from ircproto.events import Mode
+from ircproto.exceptions import ProtocolError
+
+try:
+    from typing import Dict, Tuple  # noqa: F401
+except ImportError:  # Python < 3.5
+    pass
+
+#: the mode type for modes that maintain a list of masks (``b``, ``e``, ``I``)
+LIST_MODE = 'list'
+#: the mode type for modes that always take a parameter (``k``)
+PARAM_MODE = 'param'
+#: the mode type for modes that only take a parameter when set (``l``)
+SET_PARAM_MODE = 'set_param'
+#: the mode type for modes that never take a parameter (``n``, ``t`` etc.)
+FLAG_MODE = 'flag'
+#: the mode type for membership modes that take a nickname as the parameter (``o``, ``v``)
+PREFIX_MODE = 'prefix'
+
+#: bit flags for each mode letter
+mode_bits = dict((letter, 1 << i) for i, letter in enumerate(string.ascii_letters))
+
+table_cache = {}  # type: Dict[Tuple[str, str], ModeTable]
+
+
+def mode_flags(modes):
+    """Convert a string of mode letters into bit flags."""
+    flags = 0
+    for mode in modes:
+        flags |= mode_bits[mode]
+
+    return flags
+
+
+def flags_to_modes(flags):
+    """Convert bit flags back into a string of mode letters."""
+    return ''.join(letter for letter in string.ascii_letters if flags & mode_bits[letter])
+
+
+class ModeChange(namedtuple('ModeChange', 'adding mode param')):
+    """
+    A single mode change.
+
+    :ivar bool adding: ``True`` if the mode is being set, ``False`` if it is being unset
+    :ivar str mode: the mode letter
+    :ivar str param: the parameter of the change, or ``None``
+    """
+
+    __slots__ = ()
+
+    def __str__(self):
+        change = ('+' if self.adding else '-') + self.mode
+        return change + ' ' + self.param if self.param is not None else change
+
+
+class ModeTable(object):
+    """
+    Describes the channel modes supported by a server.
+
+    Use :func:`get_mode_table` to share tables between connections.
+
+    :param str chanmodes: the channel mode types in the ``CHANMODES`` ISUPPORT format
+    :param str prefix: the membership prefixes in the ``PREFIX`` ISUPPORT format
+    :ivar dict types: mode types (like :data:`LIST_MODE`) keyed by mode letter
+    :ivar dict prefix_modes: membership mode letters keyed by their prefix symbol
+    """
+
+    __slots__ = ('chanmodes', 'prefix', 'types', 'prefix_modes')
+
+    def __init__(self, chanmodes='beI,k,l,aimnqpsrt', prefix='(ov)@+'):
+        self.chanmodes = chanmodes
+        self.prefix = prefix
+        self.types = {}
+        groups = (chanmodes.split(',') + ['', '', '', ''])[:4]
+        for mode_type, modes in zip((LIST_MODE, PARAM_MODE, SET_PARAM_MODE, FLAG_MODE), groups):
+            for mode in modes:
+                self.types[mode] = mode_type
+
+        modes, _, symbols = prefix[1:].partition(')')
+        self.prefix_modes = dict(zip(symbols, modes))
+        for mode in modes:
+            self.types[mode] = PREFIX_MODE
+
+    def takes_param(self, mode, adding):
+        """Return ``True`` if changing the given mode requires a parameter."""
+        mode_type = self.types.get(mode, FLAG_MODE)
+        return mode_type not in (FLAG_MODE, SET_PARAM_MODE) or \
+            (adding and mode_type == SET_PARAM_MODE)
+
+    def parse(self, modes, params=(), strict=True):
+        """
+        Parse a mode string and its parameters into a list of changes.
+
+        List modes without a parameter (list queries like ``+b``) are returned with ``None`` as the
+        parameter.
+
+        :param str modes: the mode string (e.g. ``+o-v+b``)
+        :param params: the parameters following the mode string
+        :param bool strict: ``False`` to skip invalid mode letters and changes missing their
+            parameter instead of raising an exception
+        :rtype: list
+        :raises ProtocolError: if a parameter is missing or a mode letter is invalid (only in
+            strict mode)
+
+        """
+        changes = []
+        params = iter(params)
+        adding = True
+        for mode in modes:
+            if mode == '+':
+                adding = True
+            elif mode == '-':
+                adding = False
+            elif mode not in mode_bits:
+                if strict:
+                    raise ProtocolError('invalid mode character: %s' % mode)
+            elif self.takes_param(mode, adding):
+                param = next(params, None)
+                if param is None:
+                    mode_type = self.types[mode]
+                    if mode_type == PREFIX_MODE or (adding and mode_type == PARAM_MODE):
+                        if strict:
+                            raise ProtocolError('missing parameter for mode %s%s' %
+                                                ('+' if adding else '-', mode))
+
+                        continue
+                    elif not strict and mode_type != LIST_MODE:
+                        continue
+
+                changes.append(ModeChange(adding, mode, param))
+            else:
+                changes.append(ModeChange(adding, mode, None))
+
+        return changes
+
+    def parse_event(self, event):
+        """Parse the changes in a :class:`~ircproto.events.Mode` event."""
+        return self.parse(event.modes, event.modeparams)
+
+    def apply(self, channel, changes):
+        """
+        Apply mode changes to a channel.
+
+        Changes that would not alter the channel's state (setting a mode that is already set,
+        removing a ban that does not exist etc.) are skipped.
+
+        :param ircproto.states.IRCChannel channel: the channel to modify
+        :param changes: an iterable of :class:`ModeChange`
+        :return: the list of changes that were actually applied
+
+        """
+        applied = []
+        for change in changes:
+            adding, mode, param = change
+            mode_type = self.types.get(mode, FLAG_MODE)
+            bit = mode_bits[mode]
+            if mode_type == PREFIX_MODE:
+                flags = channel.member_modes.get(param)
+                if flags is None or bool(flags & bit) == adding:
+                    continue
+
+                channel.member_modes[param] = flags | bit if adding else flags & ~bit
+            elif mode_type == LIST_MODE:
+                if param is None:
+                    continue
+
+                masks = channel.mode_lists.setdefault(mode, [])
+                if adding == (param in masks):
+                    continue
+                elif adding:
+                    masks.append(param)
+                else:
+                    masks.remove(param)
+            elif adding:
+                if mode == 'l':
+                    try:
+                        param = int(param)
+                    except (TypeError, ValueError):
+                        continue
+
+                if channel.modes & bit and channel.get_mode_param(mode) == param:
+                    continue
+
+                channel.modes |= bit
+                if param is not None:
+                    channel.set_mode_param(mode, param)
+            else:
+                if not channel.modes & bit:
+                    continue
+
+                channel.modes &= ~bit
+                channel.set_mode_param(mode, None)
+
+            applied.append(change)
+
+        return applied
+
+    def coalesce(self, target, changes, max_params=3, max_line_length=512, sender=None):
+        """
+        Pack mode changes into as few ``MODE`` commands as possible.
+
+        :param str target: the channel name
+        :param changes: an iterable of :class:`ModeChange`
+        :param int max_params: maximum number of parametrized changes per command (the ``MODES``
+            ISUPPORT token), or ``None`` for no limit
+        :param int max_line_length: maximum length of each encoded command, including the CRLF
+        :param str sender: the sender of the generated events
+        :return: a list of :class:`~ircproto.events.Mode` events
+
+        """
+        events = []
+        overhead = len('MODE %s \r\n' % target) + (len(sender) + 2 if sender else 0)
+        modes, params = '', []
+        length = overhead
+        adding = None
+        for change in changes:
+            param_length = len(change.param) + 1 if change.param else 0
+            if modes:
+                too_many = change.param and max_params is not None and len(params) >= max_params
+                if too_many or length + 2 + param_length > max_line_length:
+                    events.append(Mode(sender, target, modes, *params))
+                    modes, params = '', []
+                    length = overhead
+                    adding = None
+
+            if change.adding != adding:
+                modes += '+' if change.adding else '-'
+                adding = change.adding
+                length += 1
+
+            modes += change.mode
+            length += 1 + param_length
+            if change.param:
+                params.append(change.param)
+
+        if modes:
+            events.append(Mode(sender, target, modes, *params))
+
+        return events
+
+
+def get_mode_table(chanmodes='beI,k,l,aimnqpsrt', prefix='(ov)@+'):
+    """
+    Return a (shared) mode table for the given ``CHANMODES`` and ``PREFIX`` values.
+
+    :rtype: ModeTable
+
+    """
+    table = table_cache.get((chanmodes, prefix))
+    if table is None:
+        table = table_cache[(chanmodes, prefix)] = ModeTable(chanmodes, prefix)
+
+    return table
@@ -0,0 +1,251 @@
+"""
+Sampling profiler that attributes CPU time to the IRC traffic causing it.
+
+Connections with a profiler attached tag the running thread with the connection, the command (or
+reply code) and the channel of the event being decoded, handled or encoded. A background thread
+periodically samples the stacks of tagged threads and aggregates the samples per tag. Time spent
+decoding a line is attributed to the resulting event once decoding finishes.
+
+Applications can tag their own event handling code with :meth:`CommandProfiler.profile`::
+
+    profiler = CommandProfiler()
+    conn = IRCClientConnection(profiler=profiler)
+    profiler.start()
+    for event in conn.feed_data(data):
+        with profiler.profile(conn, event):
+            handle(event)
+
+    profiler.stop()
+    with open('irc.folded', 'w') as f:
+        profiler.dump_folded(f)
+"""
+from __future__ import unicode_literals
+
+import os.path
+import sys
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from ircproto.constants import reply_names
+
+try:
+    from threading import get_ident
+except ImportError:  # Python 2
+    from thread import get_ident  # type: ignore
+
+channel_prefixes = ('#', '&', '+', '!')
+
+
+def reply_label(code):
+    """Return the symbolic name of the given reply code, or the zero padded code itself."""
+    return reply_names.get(code, '%03d' % code)
+
+
+def event_command(event):
+    """Return the command word, reply name or class name of the given event."""
+    command = getattr(event, 'command', None)
+    if command:
+        return command
+
+    code = getattr(event, 'code', None)
+    if code is not None:
+        return reply_label(code)
+
+    return type(event).__name__
+
+
+def event_channel(event):
+    """Return the name of the channel the given event targets, or ``None``."""
+    channel = getattr(event, 'channel', None)
+    if channel:
+        return channel
+
+    for attribute in ('recipient', 'target'):
+        target = getattr(event, attribute, None)
+        if target and target.startswith(channel_prefixes):
+            return target
+
+    return None
+
+
+def connection_label(connection):
+    """Return a label identifying the given connection in the profile."""
+    return (getattr(connection, 'nickname', None) or getattr(connection, 'host', None) or
+            'connection-%x' % id(connection))
+
+
+class CommandProfiler(object):
+    """
+    Sampling profiler that aggregates samples per connection, command and channel.
+
+    :param float interval: seconds between samples taken by the background thread
+    :param int max_depth: maximum number of stack frames recorded per sample
+    :ivar dict samples: sample counts keyed by ``(connection, command, channel, stack)`` (updated
+        by the sampling thread; use the methods below to read it while the profiler is running)
+    """
+
+    def __init__(self, interval=0.001, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = defaultdict(int)
+        self._tags = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def tag(self, connection, event=None, command=None, channel=None):
+        """
+        Tag the current thread with the given connection and event.
+
+        :param connection: the connection doing the work
+        :param event: the event being processed (used to derive ``command`` and ``channel``)
+        :param str command: the command or reply name, if not derived from ``event``
+        :param str channel: the channel name, if not derived from ``event``
+        :return: the previous tag, to be passed to :meth:`restore`
+
+        """
+        if event is not None:
+            command = command or event_command(event)
+            channel = channel or event_channel(event)
+
+        ident = get_ident()
+        previous = self._tags.get(ident)
+        self._tags[ident] = (connection_label(connection), command, channel)
+        return previous
+
+    def tag_decoding(self, connection):
+        """
+        Tag the current thread as decoding data on the given connection.
+
+        Samples taken while decoding are held back until :meth:`decoded` is called.
+
+        :return: the previous tag, to be passed to :meth:`restore`
+
+        """
+        return self.tag(connection)
+
+    def decoded(self, connection, event):
+        """
+        Attribute the samples taken while decoding to the decoded event and tag the thread with it.
+
+        """
+        self.tag(connection, event)
+        ident = get_ident()
+        tag = self._tags[ident]
+        with self._lock:
+            for stack in self._pending.pop(ident, ()):
+                self.samples[tag + (stack,)] += 1
+
+    def restore(self, previous):
+        """Restore the tag returned from :meth:`tag` or :meth:`tag_decoding`."""
+        ident = get_ident()
+        with self._lock:
+            self._pending.pop(ident, None)
+
+        if previous is None:
+            self._tags.pop(ident, None)
+        else:
+            self._tags[ident] = previous
+
+    @contextmanager
+    def profile(self, connection, event=None, command=None, channel=None):
+        """Tag the current thread for the duration of the ``with`` block."""
+        previous = self.tag(connection, event, command, channel)
+        try:
+            yield
+        finally:
+            self.restore(previous)
+
+    def sample(self):
+        """Take one sample of every tagged thread."""
+        frames = sys._current_frames()
+        for ident, tag in list(self._tags.items()):
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+
+            stack = self._extract_stack(frame)
+            with self._lock:
+                if tag[1] is None:
+                    self._pending.setdefault(ident, []).append(stack)
+                else:
+                    self.samples[tag + (stack,)] += 1
+
+    def _extract_stack(self, frame):
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            stack.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+                                         code.co_firstlineno))
+            frame = frame.f_back
+
+        stack.reverse()
+        return tuple(stack)
+
+    def start(self):
+        """Start sampling in a background thread."""
+        if self._thread is not None:
+            raise RuntimeError('the profiler is already running')
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='ircproto profiler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background sampling thread."""
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def _sample_items(self):
+        # The sampling thread may be adding keys while the caller iterates
+        with self._lock:
+            return list(self.samples.items())
+
+    def _totals(self, index):
+        totals = defaultdict(int)
+        for key, count in self._sample_items():
+            totals[key[index]] += count
+
+        return dict(totals)
+
+    def by_connection(self):
+        """Return the number of samples per connection label."""
+        return self._totals(0)
+
+    def by_command(self):
+        """Return the number of samples per command or reply name."""
+        return self._totals(1)
+
+    def by_channel(self):
+        """Return the number of samples per channel (``None`` for events without a channel)."""
+        return self._totals(2)
+
+    def folded(self):
+        """
+        Return the samples as folded stacks, usable with ``flamegraph.pl`` and compatible tools.
+
+        Each stack is rooted at the connection, followed by the command and the channel (if any).
+
+        :return: a list of lines
+
+        """
+        totals = defaultdict(int)
+        for (connection, command, channel, stack), count in self._sample_items():
+            frames = (connection, command) + ((channel,) if channel else ()) + stack
+            totals[';'.join(frame.replace(';', ':') for frame in frames)] += count
+
+        return ['%s %d' % (key, count) for key, count in sorted(totals.items())]
+
+    def dump_folded(self, stream):
+        """Write the folded stacks (see :meth:`folded`) to a text stream."""
+        for line in self.folded():
+            stream.write(line + '\n')
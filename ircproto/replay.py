@@ -0,0 +1,277 @@
+"""
+Offline replay of captured or synthetic IRC traffic through the connection state machines.
+
+This is meant for measuring the throughput of ``feed_data()`` on realistic traffic and for
+regression testing the decoder against captured logs. Run ``python -m ircproto.replay --help`` for
+the command line interface.
+"""
+from __future__ import division, print_function, unicode_literals
+
+import math
+import mmap
+import sys
+from argparse import ArgumentParser
+from timeit import default_timer
+
+from ircproto.connection import IRCClientConnection, IRCServerConnection
+from ircproto.exceptions import ProtocolError
+from ircproto.states import IRCServer
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None  # type: ignore
+
+
+class ReplayStats(object):
+    """
+    Results of a replay run.
+
+    :ivar int lines: number of lines fed to the connection
+    :ivar int events: number of events the connection generated
+    :ivar int errors: number of protocol errors raised while feeding data
+    :ivar int bytes: number of bytes fed to the connection
+    :ivar float elapsed: total time spent in ``feed_data()`` (in seconds)
+    :ivar list latencies: time spent processing each chunk (in seconds)
+    :ivar int memory_peak: peak traced memory during the run (in bytes), or ``None``
+    :ivar int memory_net: traced memory still allocated after the run (in bytes), or ``None``
+    """
+
+    __slots__ = ('lines', 'events', 'errors', 'bytes', 'elapsed', 'latencies', 'memory_peak',
+                 'memory_net')
+
+    def __init__(self):
+        self.lines = self.events = self.errors = self.bytes = 0
+        self.elapsed = 0.0
+        self.latencies = []
+        self.memory_peak = self.memory_net = None
+
+    @property
+    def lines_per_second(self):
+        return self.lines / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def bytes_per_second(self):
+        return self.bytes / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, percent):
+        """
+        Return the per-chunk latency at the given percentile (nearest rank method).
+
+        :param float percent: a number between 0 and 100
+        :rtype: float
+
+        """
+        if not self.latencies:
+            return 0.0
+
+        latencies = sorted(self.latencies)
+        rank = int(math.ceil(percent / 100 * len(latencies)))
+        return latencies[min(max(rank, 1), len(latencies)) - 1]
+
+    def format(self):
+        """Return a human readable summary of the results."""
+        lines = [
+            'lines:      %d (%d events, %d errors)' % (self.lines, self.events, self.errors),
+            'bytes:      %d' % self.bytes,
+            'elapsed:    %.3f s' % self.elapsed,
+            'throughput: %.0f lines/s, %.0f bytes/s' % (
+                self.lines_per_second, self.bytes_per_second),
+            'latency:    p50 %.1f us, p99 %.1f us per chunk' % (
+                self.percentile(50) * 1e6, self.percentile(99) * 1e6)
+        ]
+        if self.memory_peak is not None:
+            lines.append('memory:     %d bytes peak, %d bytes retained' % (
+                self.memory_peak, self.memory_net))
+
+        return '\n'.join(lines)
+
+
+def read_log(path):
+    """
+    Read a captured IRC log one line at a time.
+
+    Lines are normalized to end in CRLF. Blank lines are skipped.
+
+    :param str path: path to a file containing one raw IRC message per line
+    :return: an iterator yielding :class:`bytes`
+
+    """
+    with open(path, 'rb') as f:
+        for line in f:
+            line = line.rstrip(b'\r\n')
+            if line:
+                yield line + b'\r\n'
+
+
+def map_capture(path):
+    """
+    Memory map a raw capture file containing CRLF delimited IRC traffic.
+
+    The caller is responsible for closing the returned memory map.
+
+    :param str path: path to the capture file
+    :return: a read-only memory map of the file
+    :rtype: mmap.mmap
+
+    """
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def chunked(source, chunk_size):
+    """
+    Split the source traffic into chunks of a fixed size.
+
+    :param source: either a bytes-like object (such as the return value of :func:`map_capture`)
+        or an iterable of :class:`bytes` objects (such as lines)
+    :param int chunk_size: size of each chunk (the last chunk may be shorter)
+    :return: an iterator yielding :class:`bytes`
+
+    """
+    if isinstance(source, (bytes, bytearray, mmap.mmap)):
+        for offset in range(0, len(source), chunk_size):
+            yield bytes(source[offset:offset + chunk_size])
+    else:
+        buffer = bytearray()
+        for data in source:
+            buffer.extend(data)
+            if len(buffer) >= chunk_size:
+                end = len(buffer) - len(buffer) % chunk_size
+                for offset in range(0, end, chunk_size):
+                    yield bytes(buffer[offset:offset + chunk_size])
+
+                del buffer[:end]
+
+        if buffer:
+            yield bytes(buffer)
+
+
+def privmsg_storm(count, channel='#storm', senders=100, message_length=80):
+    """
+    Generate a flood of channel messages from a rotating set of senders.
+
+    :param int count: number of messages to generate
+    :param str channel: the target channel
+    :param int senders: number of distinct senders
+    :param int message_length: length of each message text
+    :return: an iterator yielding CRLF terminated :class:`bytes` lines
+
+    """
+    text = ('lorem ipsum dolor sit amet ' * (message_length // 27 + 1))[:message_length]
+    prefixes = [':user%d!~user%d@host%d.example.org' % (i, i, i) for i in range(senders)]
+    for i in range(count):
+        line = '%s PRIVMSG %s :%s\r\n' % (prefixes[i % senders], channel, text)
+        yield line.encode('ascii')
+
+
+def netsplit_burst(users, hub='hub.example.org', leaf='leaf.example.org'):
+    """
+    Generate the QUIT messages a client sees when a server splits from the network.
+
+    :param int users: number of users lost in the split
+    :param str hub: name of the server remaining on this side of the split
+    :param str leaf: name of the server that split off
+    :return: an iterator yielding CRLF terminated :class:`bytes` lines
+
+    """
+    for i in range(users):
+        line = ':split%d!~split%d@host%d.example.org QUIT :%s %s\r\n' % (i, i, i, hub, leaf)
+        yield line.encode('ascii')
+
+
+def replay(chunks, connection=None, trace_memory=False):
+    """
+    Feed a stream of chunks through a connection and measure how it performs.
+
+    Any outgoing data generated by the connection (such as ``PONG`` replies) is discarded.
+    Protocol errors are counted but do not stop the replay.
+
+    :param chunks: an iterable of :class:`bytes` (see :func:`chunked`)
+    :param connection: the connection to feed the data to (defaults to a new
+        :class:`~ircproto.connection.IRCClientConnection`)
+    :param bool trace_memory: ``True`` to trace memory allocations using :mod:`tracemalloc`
+        (slows down the replay considerably)
+    :rtype: ReplayStats
+
+    """
+    if connection is None:
+        connection = IRCClientConnection()
+
+    stats = ReplayStats()
+    latencies = stats.latencies
+    feed_data = connection.feed_data
+    data_to_send = connection.data_to_send
+    timer = default_timer
+    if trace_memory:
+        if tracemalloc is None:
+            raise RuntimeError('memory tracing requires Python 3.4 or later')
+
+        tracemalloc.start()
+        memory_start = tracemalloc.get_traced_memory()[0]
+
+    try:
+        for chunk in chunks:
+            stats.lines += chunk.count(b'\n')
+            stats.bytes += len(chunk)
+            start = timer()
+            try:
+                stats.events += len(feed_data(chunk))
+            except ProtocolError:
+                stats.errors += 1
+
+            latencies.append(timer() - start)
+            data_to_send()
+    finally:
+        if trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            stats.memory_peak = peak - memory_start
+            stats.memory_net = current - memory_start
+
+    stats.elapsed = sum(latencies)
+    return stats
+
+
+def main(args=None):
+    parser = ArgumentParser(description='Replay IRC traffic through ircproto offline')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--log', help='path to a captured log with one message per line')
+    source.add_argument('--capture', help='path to a raw CRLF delimited capture (memory mapped)')
+    source.add_argument('--synthetic', choices=('privmsg-storm', 'netsplit-burst'),
+                        help='generate synthetic traffic instead')
+    parser.add_argument('--count', type=int, default=100000,
+                        help='number of synthetic messages to generate (default: %(default)s)')
+    parser.add_argument('--chunk-size', type=int, default=4096,
+                        help='number of bytes to feed at a time (default: %(default)s)')
+    parser.add_argument('--server', action='store_true',
+                        help='feed the traffic to a server side connection instead of a client')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='measure memory allocations during the replay')
+    args = parser.parse_args(args)
+
+    if args.log:
+        source = read_log(args.log)
+    elif args.capture:
+        source = map_capture(args.capture)
+    elif args.synthetic == 'privmsg-storm':
+        source = privmsg_storm(args.count)
+    else:
+        source = netsplit_burst(args.count)
+
+    if args.server:
+        connection = IRCServerConnection('client.example.org', IRCServer('irc.example.org'))
+    else:
+        connection = IRCClientConnection()
+
+    try:
+        stats = replay(chunked(source, args.chunk_size), connection, args.trace_memory)
+    finally:
+        if args.capture:
+            source.close()
+
+    print(stats.format())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,56 @@
+"""
+Reply message templates and the parsers that extract their fields.
+
+The templates are used to format outgoing replies. The same templates also describe where each
+field is located in a received reply, so :func:`get_reply_parser` generates a parser for each
+reply code from its template the first time a reply with that code needs to be parsed.
+"""
 from __future__ import unicode_literals
 
-from ircproto.constants import *
+import re
+
+from ircproto.constants import (
+    ERR_ALREADYREGISTRED, ERR_BADCHANMASK, ERR_BADCHANNELKEY, ERR_BADMASK, ERR_BANLISTFULL,
+    ERR_BANNEDFROMCHAN, ERR_CANNOTSENDTOCHAN, ERR_CANTKILLSERVER, ERR_CHANNELISFULL,
+    ERR_CHANOPRIVSNEEDED, ERR_ERRONEUSNICKNAME, ERR_FILEERROR, ERR_INVITEONLYCHAN, ERR_KEYSET,
+    ERR_NEEDMOREPARAMS, ERR_NICKCOLLISION, ERR_NICKLOCKED, ERR_NICKNAMEINUSE, ERR_NOADMININFO,
+    ERR_NOCHANMODES, ERR_NOLOGIN, ERR_NOMOTD, ERR_NONICKNAMEGIVEN, ERR_NOOPERHOST, ERR_NOORIGIN,
+    ERR_NOPERMFORHOST, ERR_NOPRIVILEGES, ERR_NORECIPIENT, ERR_NOSUCHCHANNEL, ERR_NOSUCHNICK,
+    ERR_NOSUCHSERVER, ERR_NOSUCHSERVICE, ERR_NOTEXTTOSEND, ERR_NOTONCHANNEL, ERR_NOTOPLEVEL,
+    ERR_NOTREGISTERED, ERR_PASSWDMISMATCH, ERR_RESTRICTED, ERR_SASLABORTED, ERR_SASLALREADY,
+    ERR_SASLFAIL, ERR_SASLTOOLONG, ERR_SUMMONDISABLED, ERR_TOOMANYCHANNELS, ERR_TOOMANYTARGETS,
+    ERR_UMODEUNKNOWNFLAG, ERR_UNAVAILRESOURCE, ERR_UNIQOPPRIVSNEEDED, ERR_UNKNOWNCOMMAND,
+    ERR_UNKNOWNMODE, ERR_USERNOTINCHANNEL, ERR_USERONCHANNEL, ERR_USERSDISABLED,
+    ERR_USERSDONTMATCH, ERR_WASNOSUCHNICK, ERR_WILDTOPLEVEL, ERR_YOUREBANNEDCREEP,
+    ERR_YOUWILLBEBANNED, RPL_ADMINEMAIL, RPL_ADMINLOC1, RPL_ADMINLOC2, RPL_ADMINME, RPL_AWAY,
+    RPL_BANLIST, RPL_CHANNELMODEIS, RPL_CREATED, RPL_ENDOFBANLIST, RPL_ENDOFEXCEPTLIST,
+    RPL_ENDOFINFO, RPL_ENDOFINVITELIST, RPL_ENDOFLINKS, RPL_ENDOFMOTD, RPL_ENDOFNAMES,
+    RPL_ENDOFSTATS, RPL_ENDOFUSERS, RPL_ENDOFWHO, RPL_ENDOFWHOIS, RPL_ENDOFWHOWAS, RPL_EXCEPTLIST,
+    RPL_INFO, RPL_INVITELIST, RPL_INVITING, RPL_ISON, RPL_ISUPPORT, RPL_LINKS, RPL_LIST,
+    RPL_LISTEND, RPL_LOGGEDIN, RPL_LOGGEDOUT, RPL_LUSERCHANNELS, RPL_LUSERCLIENT, RPL_LUSERME,
+    RPL_LUSEROP, RPL_LUSERUNKNOWN, RPL_MOTD, RPL_MOTDSTART, RPL_MYINFO, RPL_NAMREPLY, RPL_NOTOPIC,
+    RPL_NOUSERS, RPL_NOWAWAY, RPL_REHASHING, RPL_SASLMECHS, RPL_SASLSUCCESS, RPL_SERVLIST,
+    RPL_SERVLISTEND, RPL_STATSCOMMANDS, RPL_STATSLINKINFO, RPL_STATSOLINE, RPL_STATSUPTIME,
+    RPL_SUMMONING, RPL_TIME, RPL_TOPIC, RPL_TRACECLASS, RPL_TRACECONNECTING, RPL_TRACEEND,
+    RPL_TRACEHANDSHAKE, RPL_TRACELINK, RPL_TRACELOG, RPL_TRACENEWTYPE, RPL_TRACEOPERATOR,
+    RPL_TRACESERVER, RPL_TRACESERVICE, RPL_TRACEUNKNOWN, RPL_TRACEUSER, RPL_TRYAGAIN, RPL_UMODEIS,
+    RPL_UNAWAY, RPL_UNIQOPIS, RPL_USERHOST, RPL_USERS, RPL_USERSSTART, RPL_VERSION, RPL_WELCOME,
+    RPL_WHOISCHANNELS, RPL_WHOISOPERATOR, RPL_WHOISSERVER, RPL_WHOISSIDLE, RPL_WHOISUSER,
+    RPL_WHOREPLY, RPL_WHOWASUSER, RPL_YOUREOPER, RPL_YOURESERVICE, RPL_YOURHOST)
+
+try:
+    from typing import Any, Callable, Dict, List, Optional  # noqa: F401
+except ImportError:  # Python < 3.5
+    pass
+
+placeholder_re = re.compile(r'{([^}]*)}')
 
 reply_templates = {
     RPL_WELCOME: "Welcome to the Internet Relay Network {nickname}!{username}@{host}",
     RPL_YOURHOST: "Your host is {host}, running version {version}",
     RPL_CREATED: "This server was created {date}",
     RPL_MYINFO: "{servername} {version} {available_user_modes} {available_channel_modes}",
-    RPL_BOUNCE: "Try server {server_name}, port {port_number}",
+    RPL_ISUPPORT: "{tokens} :are supported by this server",
     RPL_USERHOST: None,
     RPL_ISON: None,
     RPL_AWAY: "{nick} :{away_message}",
@@ -140,5 +183,133 @@ reply_templates = {
     ERR_UNIQOPPRIVSNEEDED: ":You're not the original channel operator",
     ERR_NOOPERHOST: ":No O-lines for your host",
     ERR_UMODEUNKNOWNFLAG: ":Unknown MODE flag",
-    ERR_USERSDONTMATCH: ":Cannot change mode for other users"
+    ERR_USERSDONTMATCH: ":Cannot change mode for other users",
+    RPL_LOGGEDIN: "{nick}!{user}@{host} {account} :You are now logged in as {account}",
+    RPL_LOGGEDOUT: "{nick}!{user}@{host} :You are now logged out",
+    ERR_NICKLOCKED: ":You must use a nick assigned to you",
+    RPL_SASLSUCCESS: ":SASL authentication successful",
+    ERR_SASLFAIL: ":SASL authentication failed",
+    ERR_SASLTOOLONG: ":SASL message too long",
+    ERR_SASLABORTED: ":SASL authentication aborted",
+    ERR_SASLALREADY: ":You have already authenticated using SASL",
+    RPL_SASLMECHS: "{mechanisms} :are available SASL mechanisms"
+}
+
+#: templates for parsing the replies that have no formatting template
+parse_templates = {
+    RPL_USERHOST: ":{replies}",
+    RPL_ISON: ":{nicks}",
+    RPL_WHOISCHANNELS: "{nick} :{channels}",
+    RPL_NAMREPLY: "{channel_type} {channel} :{nicks}"
+}
+
+
+def split_words(value):
+    return value.split()
+
+
+#: converters for fields that are not plain strings
+field_types = {
+    'replies': split_words,
+    'nicks': split_words,
+    'channels': split_words,
+    'visible': int,
+    'integer': int,
+    'hop_count': int,
+    'hopcount': int
 }
+
+reply_parsers = {}  # type: Dict[int, Optional[Callable[[List[str]], Dict[str, Any]]]]
+
+
+def compile_field_pattern(template):
+    """
+    Compile a regular expression for a parameter containing fields mixed with literal text.
+
+    :return: a tuple of (compiled pattern, list of field names), or ``None`` if the template
+        contains no usable fields
+
+    """
+    names = []
+    pattern = ''
+    position = 0
+    for match in placeholder_re.finditer(template):
+        pattern += re.escape(template[position:match.start()])
+        position = match.end()
+        name = match.group(1)
+        if re.match(r'[a-z_]+$', name):
+            names.append(name)
+            pattern += '(.*?)'
+        else:
+            pattern += '.*?'
+
+    if not names:
+        return None
+
+    pattern = pattern + re.escape(template[position:]) + '$'
+    return re.compile(pattern, re.DOTALL), names
+
+
+def compile_reply_parser(template):
+    """
+    Generate a parser function from a reply template.
+
+    The generated function takes the list of reply parameters (starting with the target of the
+    reply) and returns a dictionary of the fields it could find in them.
+
+    :param str template: a reply template (like ``{channel} :{topic}``)
+
+    """
+    middle, separator, trailing = (' ' + template).partition(' :')
+    params = middle.split()
+    if separator:
+        params.append(trailing)
+
+    fields = []
+    for index, param in enumerate(params, 1):
+        if param.startswith('{') and param.endswith('}') and param.count('{') == 1:
+            fields.append((index, param[1:-1], None))
+        else:
+            compiled = compile_field_pattern(param)
+            if compiled is not None:
+                fields.append((index, None, compiled))
+
+    def parse(reply_params):
+        values = {}
+        for index, name, compiled in fields:
+            if index >= len(reply_params):
+                break
+            elif name is not None:
+                values[name] = reply_params[index]
+            else:
+                pattern, names = compiled
+                match = pattern.match(reply_params[index])
+                if match:
+                    values.update(zip(names, match.groups()))
+
+        for name in field_types:
+            if name in values:
+                try:
+                    values[name] = field_types[name](values[name])
+                except ValueError:
+                    pass
+
+        return values
+
+    return parse
+
+
+def get_reply_parser(code):
+    """
+    Return the (shared) field parser for the given reply code.
+
+    :param int code: the reply code
+    :return: a parser function, or ``None`` if there is no template for the code
+
+    """
+    try:
+        return reply_parsers[code]
+    except KeyError:
+        template = parse_templates.get(code) or reply_templates.get(code)
+        parser = reply_parsers[code] = compile_reply_parser(template) if template else None
+        return parser
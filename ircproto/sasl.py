@@ -0,0 +1,224 @@
+"""
+SASL authentication mechanisms for use with :class:`~ircproto.connection.IRCClientConnection`.
+
+The mechanisms are sans-IO: the connection feeds them the decoded server challenges and sends
+back whatever they respond with. Deriving the SCRAM keys from a password is deliberately slow, so
+the derived keys are cached per credential, letting repeated logins (e.g. after a reconnect) skip
+the key derivation entirely.
+"""
+from __future__ import unicode_literals
+
+import base64
+import hashlib
+import hmac
+import os
+from collections import OrderedDict
+
+from ircproto.exceptions import ProtocolError
+
+try:
+    from typing import Tuple  # noqa: F401
+except ImportError:  # Python < 3.5
+    pass
+
+#: maximum length of a single ``AUTHENTICATE`` payload line
+chunk_size = 400
+
+#: maximum number of credentials to keep derived SCRAM keys for
+max_cached_keys = 256
+
+scram_key_cache = OrderedDict()  # type: OrderedDict[Tuple[str, bytes, int], tuple]
+
+
+def encode_payload(data):
+    """
+    Encode a SASL response into ``AUTHENTICATE`` parameters.
+
+    :param bytes data: the response
+    :return: a list of base64 encoded chunks, with ``+`` marking an empty response or the end of
+        a response whose length is a multiple of the chunk size
+    :rtype: list
+
+    """
+    encoded = base64.b64encode(data).decode('ascii')
+    chunks = [encoded[i:i + chunk_size] for i in range(0, len(encoded), chunk_size)]
+    if not chunks or len(chunks[-1]) == chunk_size:
+        chunks.append('+')
+
+    return chunks
+
+
+def derive_scram_keys(digestmod, password, salt, iterations):
+    """
+    Derive the client and server keys for SCRAM authentication.
+
+    The results are cached, keyed by all of the arguments (the password and salt only as a digest,
+    so the password itself is not kept in memory).
+
+    :param str digestmod: name of the hash function in :mod:`hashlib`
+    :param bytes password: the password
+    :param bytes salt: the salt sent by the server
+    :param int iterations: the iteration count sent by the server
+    :return: a tuple of (client key, stored key, server key)
+
+    """
+    key = (digestmod, hmac.new(salt, password, hashlib.sha256).digest(), iterations)
+    keys = scram_key_cache.pop(key, None)
+    if keys is None:
+        digest = getattr(hashlib, digestmod)
+        salted_password = hashlib.pbkdf2_hmac(digestmod, password, salt, iterations)
+        client_key = hmac.new(salted_password, b'Client Key', digest).digest()
+        stored_key = digest(client_key).digest()
+        server_key = hmac.new(salted_password, b'Server Key', digest).digest()
+        keys = (client_key, stored_key, server_key)
+        if len(scram_key_cache) >= max_cached_keys:
+            scram_key_cache.popitem(last=False)
+
+    scram_key_cache[key] = keys
+    return keys
+
+
+class SASLMechanism(object):
+    """
+    Base class for SASL mechanisms.
+
+    :var str name: name of the mechanism, as sent in the ``AUTHENTICATE`` command
+    """
+
+    __slots__ = ()
+
+    name = None  # type: str
+
+    def respond(self, challenge):
+        """
+        Respond to a challenge from the server.
+
+        :param bytes challenge: the decoded challenge (empty for the initial ``+``)
+        :return: the response to send
+        :rtype: bytes
+        :raises ProtocolError: if the challenge is invalid
+
+        """
+        raise NotImplementedError
+
+
+class PlainMechanism(SASLMechanism):
+    """
+    The ``PLAIN`` mechanism (user name and password).
+
+    :param str username: the account name
+    :param str password: the password
+    :param str authzid: the identity to act as (defaults to the account itself)
+    """
+
+    __slots__ = ('username', 'password', 'authzid')
+
+    name = 'PLAIN'
+
+    def __init__(self, username, password, authzid=''):
+        self.username = username
+        self.password = password
+        self.authzid = authzid
+
+    def respond(self, challenge):
+        return '\0'.join((self.authzid, self.username, self.password)).encode('utf-8')
+
+
+class ExternalMechanism(SASLMechanism):
+    """
+    The ``EXTERNAL`` mechanism (e.g. a TLS client certificate).
+
+    :param str authzid: the identity to act as (defaults to the one derived from the certificate)
+    """
+
+    __slots__ = ('authzid',)
+
+    name = 'EXTERNAL'
+
+    def __init__(self, authzid=''):
+        self.authzid = authzid
+
+    def respond(self, challenge):
+        return self.authzid.encode('utf-8')
+
+
+class ScramSHA256Mechanism(SASLMechanism):
+    """
+    The ``SCRAM-SHA-256`` mechanism (:rfc:`7677`).
+
+    The server signature is verified before the exchange is allowed to complete. Every exchange
+    starts over with a new client nonce, so the same instance can be used again for later logins
+    (but not for concurrent ones).
+
+    :param str username: the account name
+    :param str password: the password
+    :param str nonce: a fixed client nonce to use in every exchange (only meant for testing; by
+        default, a random nonce is generated for each exchange)
+    :ivar str nonce: the client nonce of the current exchange
+    """
+
+    __slots__ = ('username', 'password', 'nonce', '_fixed_nonce', '_client_first_bare',
+                 '_server_signature')
+
+    name = 'SCRAM-SHA-256'
+    digestmod = 'sha256'
+
+    def __init__(self, username, password, nonce=None):
+        self.username = username
+        self.password = password
+        self.nonce = self._fixed_nonce = nonce
+        self._client_first_bare = self._server_signature = None
+
+    def respond(self, challenge):
+        if not challenge or self._client_first_bare is None:
+            # The server starts a new exchange with an empty challenge
+            self.nonce = self._fixed_nonce or base64.b64encode(os.urandom(18)).decode('ascii')
+            self._server_signature = None
+            username = self.username.replace('=', '=3D').replace(',', '=2C')
+            self._client_first_bare = 'n=%s,r=%s' % (username, self.nonce)
+            return ('n,,' + self._client_first_bare).encode('utf-8')
+        elif self._server_signature is None:
+            return self._client_final(challenge)
+        else:
+            self._verify_server_final(challenge)
+            return b''
+
+    def _client_final(self, challenge):
+        try:
+            server_first = challenge.decode('utf-8')
+            attributes = dict(item.split('=', 1) for item in server_first.split(','))
+            nonce = attributes['r']
+            salt = base64.b64decode(attributes['s'])
+            iterations = int(attributes['i'])
+        except (KeyError, ValueError, TypeError):
+            raise ProtocolError('invalid SCRAM server-first message')
+
+        if not nonce.startswith(self.nonce):
+            raise ProtocolError('the SCRAM server nonce does not match the client nonce')
+
+        client_key, stored_key, server_key = derive_scram_keys(
+            self.digestmod, self.password.encode('utf-8'), salt, iterations)
+        client_final_bare = 'c=biws,r=' + nonce
+        auth_message = ','.join((self._client_first_bare, server_first, client_final_bare))
+        auth_message = auth_message.encode('utf-8')
+        digest = getattr(hashlib, self.digestmod)
+        client_signature = hmac.new(stored_key, auth_message, digest).digest()
+        proof = bytearray(a ^ b for a, b in zip(bytearray(client_key),
+                                                bytearray(client_signature)))
+        self._server_signature = hmac.new(server_key, auth_message, digest).digest()
+        proof = base64.b64encode(bytes(proof)).decode('ascii')
+        return ('%s,p=%s' % (client_final_bare, proof)).encode('utf-8')
+
+    def _verify_server_final(self, challenge):
+        try:
+            attributes = dict(item.split('=', 1) for item in challenge.decode('utf-8').split(','))
+            if 'e' not in attributes:
+                signature = base64.b64decode(attributes['v'])
+        except (KeyError, ValueError, TypeError):
+            raise ProtocolError('invalid SCRAM server-final message')
+
+        if 'e' in attributes:
+            raise ProtocolError('SCRAM authentication failed: %s' % attributes['e'])
+
+        if not hmac.compare_digest(signature, self._server_signature):
+            raise ProtocolError('invalid SCRAM server signature')
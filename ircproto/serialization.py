@@ -0,0 +1,251 @@
+"""
+Compact binary serialization of events, for passing them between processes or storing them.
+
+Events are serialized in batches. Each event is stored as a one byte class identifier followed by
+its fields, each a type byte and (for strings, integers and sequences) a varint length or value.
+Senders are interned: a sender that already appeared earlier in the same batch is stored as a
+reference to its first occurrence. Deserialization restores the field values directly, without
+going through the parsing and validation done by :func:`~ircproto.events.decode_event`.
+
+The class identifiers depend on the set of event classes in this version of the library, so the
+serialized form is meant for exchanging data between processes running the same version, not for
+long term storage.
+
+Supported are all the classes in :data:`~ircproto.events.commands`,
+:class:`~ircproto.events.Reply` and :class:`~ircproto.events.CTCPMessage` and its subclasses.
+"""
+from __future__ import unicode_literals
+
+from ircproto.events import commands, ctcp_types, CTCPMessage, Reply
+
+#: version of the serialization format, stored as the first byte of every batch
+format_version = 1
+
+NONE, STRING, INTEGER, TRUE, FALSE, LIST, TUPLE, REFERENCE, DICT, BYTES = range(10)
+
+try:
+    text_type = unicode  # type: ignore
+except NameError:
+    text_type = str
+
+
+def get_fields(cls):
+    """Return the names of the slots of an event class, excluding ``sender`` and ``_tags``."""
+    fields = []
+    for klass in reversed(cls.__mro__):
+        slots = klass.__dict__.get('__slots__', ())
+        fields.extend((slots,) if isinstance(slots, str) else slots)
+
+    return tuple(field for field in fields if field not in ('sender', '_tags'))
+
+
+event_classes = ([Reply, CTCPMessage] + [ctcp_types[tag] for tag in sorted(ctcp_types)] +
+                 [commands[command] for command in sorted(commands)])
+class_ids = dict((cls, i) for i, cls in enumerate(event_classes))
+
+# Private slots (caches and the like) are not serialized, but reset on deserialization
+class_fields = [tuple(field for field in get_fields(cls) if not field.startswith('_'))
+                for cls in event_classes]
+class_private_fields = [tuple(field for field in get_fields(cls) if field.startswith('_'))
+                        for cls in event_classes]
+
+
+def write_varint(buffer, value):
+    while value > 127:
+        buffer.append(value & 127 | 128)
+        value >>= 7
+
+    buffer.append(value)
+
+
+def read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 127) << shift
+        if byte < 128:
+            return value, pos
+
+        shift += 7
+
+
+def write_value(buffer, value):
+    if value is None:
+        buffer.append(NONE)
+    elif value is True:
+        buffer.append(TRUE)
+    elif value is False:
+        buffer.append(FALSE)
+    elif isinstance(value, text_type):
+        encoded = value.encode('utf-8')
+        buffer.append(STRING)
+        write_varint(buffer, len(encoded))
+        buffer += encoded
+    elif isinstance(value, (bytes, bytearray)):
+        buffer.append(BYTES)
+        write_varint(buffer, len(value))
+        buffer += value
+    elif isinstance(value, int):
+        buffer.append(INTEGER)
+        write_varint(buffer, value << 1 if value >= 0 else (-value << 1) - 1)
+    elif isinstance(value, (list, tuple)):
+        buffer.append(LIST if isinstance(value, list) else TUPLE)
+        write_varint(buffer, len(value))
+        for item in value:
+            write_value(buffer, item)
+    elif isinstance(value, dict):
+        buffer.append(DICT)
+        write_varint(buffer, len(value))
+        for key, item in value.items():
+            write_value(buffer, key)
+            write_value(buffer, item)
+    else:
+        raise TypeError('cannot serialize a value of type %s' % type(value).__name__)
+
+
+def read_value(data, pos):
+    value_type = data[pos]
+    pos += 1
+    if value_type == STRING:
+        length, pos = read_varint(data, pos)
+        if pos + length > len(data):
+            raise ValueError('truncated serialized data')
+
+        return data[pos:pos + length].decode('utf-8'), pos + length
+    elif value_type == NONE:
+        return None, pos
+    elif value_type == TRUE:
+        return True, pos
+    elif value_type == FALSE:
+        return False, pos
+    elif value_type == INTEGER:
+        value, pos = read_varint(data, pos)
+        return (value >> 1) if not value & 1 else -((value + 1) >> 1), pos
+    elif value_type in (LIST, TUPLE):
+        length, pos = read_varint(data, pos)
+        items = []
+        for _ in range(length):
+            item, pos = read_value(data, pos)
+            items.append(item)
+
+        return (items if value_type == LIST else tuple(items)), pos
+    elif value_type == DICT:
+        length, pos = read_varint(data, pos)
+        items = {}
+        for _ in range(length):
+            key, pos = read_value(data, pos)
+            items[key], pos = read_value(data, pos)
+
+        return items, pos
+    elif value_type == BYTES:
+        length, pos = read_varint(data, pos)
+        if pos + length > len(data):
+            raise ValueError('truncated serialized data')
+
+        return bytes(data[pos:pos + length]), pos + length
+    else:
+        raise ValueError('invalid value type: %d' % value_type)
+
+
+def serialize_events(events):
+    """
+    Serialize a sequence of events into bytes.
+
+    :param events: an iterable of events
+    :rtype: bytes
+    :raises TypeError: if an event or one of its field values cannot be serialized
+
+    """
+    buffer = bytearray([format_version])
+    body = bytearray()
+    senders = {}
+    count = 0
+    for event in events:
+        try:
+            class_id = class_ids[event.__class__]
+        except KeyError:
+            raise TypeError('cannot serialize %s' % type(event).__name__)
+
+        body.append(class_id)
+        sender = event.sender
+        index = senders.get(sender)
+        if index is not None:
+            body.append(REFERENCE)
+            write_varint(body, index)
+        else:
+            if sender is not None:
+                senders[sender] = len(senders)
+
+            write_value(body, sender)
+
+        write_value(body, event._tags or None)
+        for field in class_fields[class_id]:
+            write_value(body, getattr(event, field))
+
+        count += 1
+
+    write_varint(buffer, count)
+    return bytes(buffer + body)
+
+
+def deserialize_events(data):
+    """
+    Restore a list of events from bytes produced by :func:`serialize_events`.
+
+    :param bytes data: the serialized events
+    :rtype: list
+    :raises ValueError: if the data is invalid or was produced by an incompatible version
+
+    """
+    data = bytearray(data)
+    if not data or data[0] != format_version:
+        raise ValueError('unsupported serialization format')
+
+    try:
+        count, pos = read_varint(data, 1)
+        events = []
+        senders = []
+        for _ in range(count):
+            class_id = data[pos]
+            cls = event_classes[class_id]
+            if data[pos + 1] == REFERENCE:
+                index, pos = read_varint(data, pos + 2)
+                sender = senders[index]
+            else:
+                sender, pos = read_value(data, pos + 1)
+                if sender is not None:
+                    senders.append(sender)
+
+            event = cls.__new__(cls)
+            event.sender = sender
+            event._tags, pos = read_value(data, pos)
+            for field in class_fields[class_id]:
+                value, pos = read_value(data, pos)
+                setattr(event, field, value)
+
+            for field in class_private_fields[class_id]:
+                setattr(event, field, None)
+
+            events.append(event)
+    except IndexError:
+        raise ValueError('truncated serialized data')
+
+    if pos != len(data):
+        raise ValueError('trailing data after the serialized events')
+
+    return events
+
+
+def serialize_event(event):
+    """Serialize a single event (see :func:`serialize_events`)."""
+    return serialize_events([event])
+
+
+def deserialize_event(data):
+    """Restore a single event serialized with :func:`serialize_event`."""
+    events = deserialize_events(data)
+    if len(events) != 1:
+        raise ValueError('expected exactly one event, got %d' % len(events))
+
+    return events[0]
@@ -0,0 +1,288 @@
+"""
+Saving and restoring the state of an :class:`~ircproto.states.IRCServer`.
+
+A snapshot contains the server settings, the prefixes of the connected clients and the complete
+state of every channel (modes, topic, mask lists, invites and memberships). Channel records are
+length-prefixed, so a :class:`Snapshot` opened from a memory mapped file only builds an index of
+channel names up front and decodes each channel when it is needed.
+
+Between snapshots, a :class:`Journal` attached to the server records each change to the channels
+as it happens. Replaying the journal on top of the latest snapshot restores the state at the time
+of the last recorded change.
+
+Client connections cannot be saved. When restoring, a connection factory may be given to recreate
+connections (for example from sockets inherited from the previous process). Without one, the
+channels are restored without members.
+"""
+from __future__ import unicode_literals
+
+import mmap
+import os
+import sys
+
+from ircproto.modes import ModeChange, get_mode_table
+from ircproto.serialization import read_value, read_varint, write_value, write_varint
+from ircproto.states import IRCChannel
+
+snapshot_magic = b'IRCSNAP'
+
+#: version of the snapshot format
+snapshot_version = 2
+
+CHANNEL_CREATED, MEMBER_JOINED, MODES_CHANGED, TOPIC_CHANGED = range(4)
+
+
+def write_snapshot(server, fileobj):
+    """
+    Write the state of a server to a file.
+
+    :param ircproto.states.IRCServer server: the server to save
+    :param fileobj: a file-like object opened in binary mode
+
+    """
+    buffer = bytearray(snapshot_magic)
+    buffer.append(snapshot_version)
+    clients = [conn.prefix for conn in server.clients if conn.nickname]
+    write_value(buffer, [server.host, server.default_channel_modes, server.max_mode_params,
+                         server.mode_table.chanmodes, server.mode_table.prefix, clients])
+    write_varint(buffer, len(server.channels))
+    fileobj.write(bytes(buffer))
+
+    for channel in server.channels.values():
+        record = bytearray()
+        write_value(record, channel.name)
+        write_value(record, [channel.modes, channel.topic, channel.key, channel.limit,
+                             channel.mode_params, channel.member_modes, channel.mode_lists,
+                             channel.invites, channel.ts])
+        buffer = bytearray()
+        write_varint(buffer, len(record))
+        fileobj.write(bytes(buffer + record))
+
+
+class Snapshot(object):
+    """
+    A saved server state.
+
+    :param data: the contents of a snapshot file (``bytes`` or a memory map)
+    :ivar str host: host name of the server
+    :ivar list clients: ``nickname!username@host`` prefixes of the clients that were connected
+    :raises ValueError: if the data is not a valid snapshot
+    """
+
+    __slots__ = ('host', 'default_channel_modes', 'max_mode_params', 'chanmodes', 'prefix',
+                 'clients', '_data', '_offsets')
+
+    def __init__(self, data):
+        if sys.version_info < (3,):
+            data = bytearray(data)
+
+        header_length = len(snapshot_magic) + 1
+        if data[:len(snapshot_magic)] != snapshot_magic:
+            raise ValueError('not a snapshot file')
+        elif data[header_length - 1] != snapshot_version:
+            raise ValueError('unsupported snapshot version')
+
+        self._data = data
+        try:
+            settings, pos = read_value(data, header_length)
+            (self.host, self.default_channel_modes, self.max_mode_params, self.chanmodes,
+             self.prefix, self.clients) = settings
+            count, pos = read_varint(data, pos)
+            self._offsets = {}
+            for _ in range(count):
+                length, pos = read_varint(data, pos)
+                name, body_pos = read_value(data, pos)
+                self._offsets[name] = body_pos
+                pos += length
+        except IndexError:
+            raise ValueError('truncated snapshot')
+
+    @classmethod
+    def open(cls, path):
+        """Open a snapshot file by memory mapping it."""
+        with open(path, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @property
+    def channel_names(self):
+        """Return the names of the saved channels."""
+        return list(self._offsets)
+
+    def load_channel(self, name):
+        """
+        Decode a single channel from the snapshot.
+
+        The channel has no users, but its :attr:`~ircproto.states.IRCChannel.member_modes` lists
+        the members at the time of the snapshot.
+
+        :rtype: ircproto.states.IRCChannel
+        :raises KeyError: if there is no such channel
+
+        """
+        (modes, topic, key, limit, mode_params, member_modes, mode_lists, invites,
+         ts), _ = read_value(self._data, self._offsets[name])
+        channel = IRCChannel(name, modes, ts)
+        channel.topic = topic
+        channel.key = key
+        channel.limit = limit
+        channel.mode_params = mode_params
+        channel.member_modes = member_modes
+        channel.invites = invites
+        for mode, masks in mode_lists.items():
+            if mode in channel.mode_lists:
+                channel.mode_lists[mode][:] = masks
+            else:
+                channel.mode_lists[mode] = masks
+
+        return channel
+
+    def restore(self, server, journal=None, connection_factory=None):
+        """
+        Restore the saved state into a server.
+
+        The server's channels are replaced with those from the snapshot, and the server settings
+        are restored. If the server was created with a different host name, that is kept.
+
+        :param ircproto.states.IRCServer server: the (freshly created) server to restore into
+        :param bytes journal: the contents of a journal file to replay on top of the snapshot
+        :param connection_factory: a callable that takes a client prefix
+            (``nickname!username@host``) and returns an
+            :class:`~ircproto.connection.IRCServerConnection` for it, or ``None`` if the client is
+            gone
+
+        """
+        server.default_channel_modes = self.default_channel_modes
+        server.max_mode_params = self.max_mode_params
+        server.mode_table = get_mode_table(self.chanmodes, self.prefix)
+        server.channels = dict((name, self.load_channel(name)) for name in self._offsets)
+        prefixes = dict((prefix.partition('!')[0], prefix) for prefix in self.clients)
+        if journal:
+            replay_journal(server, journal, prefixes)
+
+        if connection_factory is not None:
+            for prefix in prefixes.values():
+                connection = connection_factory(prefix)
+                if connection is not None:
+                    server.add_client_connection(connection)
+
+        # Members without a connection are dropped
+        nicknames = server.nicknames
+        for channel in server.channels.values():
+            channel.users = [nicknames[nickname] for nickname in channel.member_modes
+                             if nickname in nicknames]
+            if len(channel.users) < len(channel.member_modes):
+                channel.member_modes = dict((conn.nickname, channel.member_modes[conn.nickname])
+                                            for conn in channel.users)
+
+        server.metrics.gauge('channels', len(server.channels))
+
+
+class Journal(object):
+    """
+    Records changes to a server's channels between snapshots.
+
+    Assign an instance to :attr:`IRCServer.journal <ircproto.states.IRCServer.journal>` to have
+    the changes recorded. Each change is written (and flushed) as soon as it happens, so at most
+    the change being written is lost on a crash.
+
+    :param fileobj: a file-like object opened for appending in binary mode
+    :param bool sync: ``True`` to also ask the operating system to write each change to disk
+        (slow)
+    """
+
+    __slots__ = ('fileobj', 'sync')
+
+    def __init__(self, fileobj, sync=False):
+        self.fileobj = fileobj
+        self.sync = sync
+
+    def _write(self, record):
+        payload = bytearray()
+        write_value(payload, record)
+        buffer = bytearray()
+        write_varint(buffer, len(payload))
+        self.fileobj.write(bytes(buffer + payload))
+        self.fileobj.flush()
+        if self.sync:
+            os.fsync(self.fileobj.fileno())
+
+    def channel_created(self, channel):
+        """Record the creation of a channel."""
+        self._write([CHANNEL_CREATED, channel.name, channel.modes, channel.ts])
+
+    def member_joined(self, channel, connection, flags):
+        """Record a client joining a channel with the given membership mode flags."""
+        self._write([MEMBER_JOINED, channel.name, connection.prefix, flags])
+
+    def modes_changed(self, channel, changes):
+        """Record mode changes applied to a channel."""
+        self._write([MODES_CHANGED, channel.name,
+                     [[change.adding, change.mode, change.param] for change in changes]])
+
+    def topic_changed(self, channel):
+        """Record a change of a channel's topic."""
+        self._write([TOPIC_CHANGED, channel.name, channel.topic])
+
+    def reset(self):
+        """Discard the recorded changes (call this after writing a new snapshot)."""
+        self.fileobj.seek(0)
+        self.fileobj.truncate()
+
+
+def read_journal(data):
+    """
+    Read the records from the contents of a journal file.
+
+    An incomplete record at the end (from a crash during writing) is ignored.
+
+    :param bytes data: contents of the journal file
+    :return: a list of records (lists starting with the record type)
+
+    """
+    data = bytearray(data)
+    records = []
+    pos = 0
+    while pos < len(data):
+        try:
+            length, start = read_varint(data, pos)
+        except IndexError:
+            break
+
+        if start + length > len(data):
+            break
+
+        records.append(read_value(data, start)[0])
+        pos = start + length
+
+    return records
+
+
+def replay_journal(server, data, prefixes=None):
+    """
+    Apply the changes recorded in a journal to a server's channels.
+
+    :param ircproto.states.IRCServer server: the server to update
+    :param bytes data: contents of the journal file
+    :param dict prefixes: a dictionary of nicknames to client prefixes, updated with the clients
+        seen joining channels
+
+    """
+    channels = server.channels
+    for record in read_journal(data):
+        record_type, name = record[:2]
+        if record_type == CHANNEL_CREATED:
+            channels[name] = IRCChannel(name, record[2], record[3])
+            continue
+
+        channel = channels.get(name)
+        if channel is None:
+            continue
+        elif record_type == MEMBER_JOINED:
+            nickname = record[2].partition('!')[0]
+            channel.member_modes[nickname] = record[3]
+            if prefixes is not None:
+                prefixes[nickname] = record[2]
+        elif record_type == MODES_CHANGED:
+            server.mode_table.apply(channel, [ModeChange(*change) for change in record[2]])
+        elif record_type == TOPIC_CHANGED:
+            channel.topic = record[2]
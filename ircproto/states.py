@@ -1,29 +1,86 @@
-from ircproto.constants import *
+from time import time
+
+from ircproto.constants import (
+    ERR_BANNEDFROMCHAN, ERR_CHANNELISFULL, ERR_CHANOPRIVSNEEDED, ERR_INVITEONLYCHAN,
+    ERR_NOSUCHCHANNEL, RPL_TOPIC)
+from ircproto.events import Join, Nick
+from ircproto.metrics import null_metrics
+from ircproto.modes import get_mode_table, mode_bits, mode_flags
 from ircproto.utils import match_hostmask
 
+operator_bit = mode_bits['o']
+invite_only_bit = mode_bits['i']
+
 
 class IRCChannel(object):
     """
     Represents the state of an IRC channel.
 
     :ivar str name: name of the channel
+    :ivar int modes: the channel modes as bit flags (see :data:`~ircproto.modes.mode_bits`)
     :ivar str topic: current topic
     :ivar str key: current channel key
     :ivar int limit: current channel limit (maximum number of users)
+    :ivar dict mode_params: parameters of other channel modes that have one
     :ivar list users: list of client connections who are currently on this channel
+    :ivar dict member_modes: membership modes (``o``, ``v``) of the users as bit flags, keyed by
+        nickname
     :ivar list bans: list of hostmasks (matching clients are prohibited from joining)
+    :ivar list exceptions: list of hostmasks exempted from the bans
+    :ivar list invite_masks: list of hostmasks that may join even if the channel is invite only
+    :ivar dict mode_lists: the mask lists keyed by their mode letter (``b``, ``e``, ``I`` etc.)
     :ivar list invites: list of nicknames who are invited to join the channel
+    :ivar int ts: creation time of the channel as a UNIX timestamp (when servers link, the older
+        channel's modes win)
+    :ivar float changed: time of the last change to the channel's modes or members
     """
 
-    __slots__ = ('name', 'modes', 'topic', 'key', 'limit', 'users', 'bans', 'invites')
+    __slots__ = ('name', 'modes', 'topic', 'key', 'limit', 'mode_params', 'users',
+                 'member_modes', 'bans', 'exceptions', 'invite_masks', 'mode_lists', 'invites',
+                 'ts', 'changed')
 
-    def __init__(self, name, modes):
+    def __init__(self, name, modes, ts=None):
         self.name = name
-        self.modes = modes
+        self.modes = modes if isinstance(modes, int) else mode_flags(modes)
+        self.changed = time()
+        self.ts = int(self.changed) if ts is None else ts
         self.topic = self.key = self.limit = None
+        self.mode_params = {}
         self.bans = []
+        self.exceptions = []
+        self.invite_masks = []
+        self.mode_lists = {'b': self.bans, 'e': self.exceptions, 'I': self.invite_masks}
         self.invites = []
         self.users = []
+        self.member_modes = {}
+
+    def has_mode(self, mode):
+        """Return ``True`` if the given channel mode is set."""
+        return bool(self.modes & mode_bits[mode])
+
+    def get_mode_param(self, mode):
+        """Return the parameter of the given channel mode, or ``None``."""
+        if mode == 'k':
+            return self.key
+        elif mode == 'l':
+            return self.limit
+        else:
+            return self.mode_params.get(mode)
+
+    def set_mode_param(self, mode, value):
+        """Set (or clear, if ``value`` is ``None``) the parameter of the given channel mode."""
+        if mode == 'k':
+            self.key = value
+        elif mode == 'l':
+            self.limit = value
+        elif value is None:
+            self.mode_params.pop(mode, None)
+        else:
+            self.mode_params[mode] = value
+
+    def is_operator(self, nickname):
+        """Return ``True`` if the given user is a channel operator."""
+        return bool(self.member_modes.get(nickname, 0) & operator_bit)
 
 
 class IRCServer(object):
@@ -31,45 +88,143 @@ class IRCServer(object):
     Represents the state of an IRC server.
 
     :ivar str host: host name of the server
-    :ivar dict clients: list of all client connections
+    :ivar list clients: list of all client connections
+    :ivar list servers: list of all server connections
     :ivar dict channels: dictionary of channel names to :class:`.IRCChannel` instances
-    :ivar dict nicknames: dictionary of nicknames to client connections
+    :ivar dict nicknames: dictionary of nicknames to client connections (or
+        :class:`~ircproto.link.RemoteClient` instances for clients on linked servers)
+    :ivar metrics: the metrics collector shared by all connections of this server
+    :ivar profiler: the profiler shared by all connections of this server, or ``None``
+    :ivar mode_table: the :class:`~ircproto.modes.ModeTable` describing the supported channel
+        modes
+    :ivar int max_mode_params: maximum number of parametrized mode changes per ``MODE`` command
+    :ivar journal: the :class:`~ircproto.snapshot.Journal` recording changes to the channels, or
+        ``None``
     """
 
-    __slots__ = ('host', 'default_channel_modes', 'clients', 'servers', 'channels', 'nicknames')
+    __slots__ = ('host', 'default_channel_modes', 'metrics', 'profiler', 'mode_table',
+                 'max_mode_params', 'journal', 'clients', 'servers', 'channels', 'nicknames')
 
-    def __init__(self, host, default_channel_modes='nt'):
+    def __init__(self, host, default_channel_modes='nt', metrics=None, profiler=None):
         self.host = host
-        self.default_channel_modes = default_channel_modes
+        self.default_channel_modes = mode_flags(default_channel_modes)
+        self.mode_table = get_mode_table()
+        self.max_mode_params = 3
+        self.journal = None
+        self.metrics = metrics or null_metrics
+        self.profiler = profiler
         self.clients = []
         self.servers = []
         self.channels = {}
         self.nicknames = {}
 
     def add_client_connection(self, connection):
-        self.clients[connection.nickname] = connection
+        """
+        Add a registered client.
+
+        The client is introduced to all connected servers.
+
+        :param ircproto.connection.IRCServerConnection connection: the client connection
+
+        """
+        self.clients.append(connection)
+        self.nicknames[connection.nickname] = connection
+        self.metrics.gauge('clients', len(self.clients))
+        if self.servers:
+            introduction = Nick(self.host, connection.nickname, '1', connection.username,
+                                connection.host, '1', '+')
+            for conn in self.servers:
+                conn.send_event(introduction)
 
     def add_server_connection(self, connection):
-        self.servers[connection.host] = connection
+        self.servers.append(connection)
+        self.metrics.gauge('servers', len(self.servers))
 
     def handle_join(self, connection, event):
+        """
+        Add a client to a channel, creating the channel if necessary.
+
+        The join is announced to all channel members (including the joining client) and to all
+        connected servers.
+
+        :param ircproto.connection.IRCServerConnection connection: the joining client
+        :param ircproto.events.Join event: the join event received from the client
+
+        """
         channel_name = event.channel
         channel = self.channels.get(channel_name)
         if not channel:
             channel = self.channels[channel_name] = IRCChannel(channel_name,
                                                                self.default_channel_modes)
+            self.metrics.gauge('channels', len(self.channels))
+            channel.member_modes[connection.nickname] = operator_bit
+            if self.journal is not None:
+                self.journal.channel_created(channel)
         else:
             if channel.limit and len(channel.users) >= channel.limit:
-                connection.process_reply(ERR_CHANNELISFULL, channel=channel_name)
+                connection.send_reply(ERR_CHANNELISFULL, channel=channel_name)
                 return
-            elif any(match_hostmask(connection, mask) for mask in channel.bans):
-                connection.process_reply(ERR_BANNEDFROMCHAN, channel=channel_name)
+            elif channel.bans and self._matches_any(connection, channel.bans) and \
+                    not self._matches_any(connection, channel.exceptions):
+                connection.send_reply(ERR_BANNEDFROMCHAN, channel=channel_name)
                 return
-            elif 'i' in channel.modes and connection.nickname not in channel.invites:
-                connection.process_reply(ERR_INVITEONLYCHAN, channel=channel_name)
+            elif channel.modes & invite_only_bit and \
+                    connection.nickname not in channel.invites and \
+                    not self._matches_any(connection, channel.invite_masks):
+                connection.send_reply(ERR_INVITEONLYCHAN, channel=channel_name)
                 return
 
+            channel.member_modes[connection.nickname] = 0
+
         channel.users.append(connection)
-        connection.process_reply(RPL_TOPIC, channel.topic)
-        for conn in (channel.users + self.servers):
-            conn.reply()
+        channel.changed = time()
+        if self.journal is not None:
+            self.journal.member_joined(channel, connection,
+                                       channel.member_modes[connection.nickname])
+
+        join = Join(connection.prefix, channel_name)
+        for conn in channel.users:
+            conn.send_event(join)
+        for conn in self.servers:
+            conn.send_event(join)
+
+        if channel.topic:
+            connection.send_reply(RPL_TOPIC, channel=channel_name, topic=channel.topic)
+
+    def handle_mode(self, connection, event):
+        """
+        Change the modes of a channel.
+
+        Only channel operators may change the modes. The changes that actually alter the channel's
+        state are announced to all channel members and to all connected servers, packed into as
+        few ``MODE`` commands as possible.
+
+        :param ircproto.connection.IRCServerConnection connection: the client changing the modes
+        :param ircproto.events.Mode event: the mode event received from the client
+
+        """
+        channel = self.channels.get(event.target)
+        if channel is None:
+            connection.send_reply(ERR_NOSUCHCHANNEL, channel_name=event.target)
+            return
+        elif not channel.is_operator(connection.nickname):
+            connection.send_reply(ERR_CHANOPRIVSNEEDED, channel=event.target)
+            return
+
+        changes = self.mode_table.apply(channel, self.mode_table.parse_event(event))
+        if changes:
+            channel.changed = time()
+            if self.journal is not None:
+                self.journal.modes_changed(channel, changes)
+
+        for mode_event in self.mode_table.coalesce(channel.name, changes, self.max_mode_params,
+                                                   sender=connection.prefix):
+            for conn in channel.users:
+                conn.send_event(mode_event)
+            for conn in self.servers:
+                conn.send_event(mode_event)
+
+    @staticmethod
+    def _matches_any(connection, masks):
+        prefix = connection.prefix.encode('utf-8')
+        return any(match_hostmask(prefix, mask.encode('utf-8')) for mask in masks)
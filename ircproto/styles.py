@@ -1,8 +1,14 @@
 from __future__ import unicode_literals
 
 import re
+from collections import namedtuple
 from enum import Enum
 
+try:
+    from typing import Any, Dict, Tuple  # noqa: F401
+except ImportError:  # Python < 3.5
+    pass
+
 
 class IRCTextColor(Enum):
     """
@@ -54,6 +60,8 @@ class IRCTextStyle(Enum):
      * italic
      * underline
      * reverse
+     * strikethrough
+     * monospace
      * plain
     """
 
@@ -61,46 +69,351 @@ class IRCTextStyle(Enum):
     italic = '\x1d'
     underline = '\x1f'
     reverse = '\x16'
+    strikethrough = '\x1e'
+    monospace = '\x11'
     plain = '\x0f'
 
 
-styles_re = re.compile('(\x03\d+(?:,\d+)?)|[\x02\x03\x1d\x1f\x16\x0f]')
+#: matches a single formatting code: a color code (with its arguments) or a style toggle
+styles_re = re.compile(r'\x03(?:(\d{1,2})(?:,(\d{1,2}))?)?|'
+                       r'\x04(?:([0-9a-fA-F]{6})(?:,([0-9a-fA-F]{6}))?)?|'
+                       r'[\x02\x1d\x1f\x16\x1e\x11\x0f]')
 
+#: RGB values of the mIRC colors 0-98, as hex strings
+color_values = (
+    'ffffff', '000000', '00007f', '009300', 'ff0000', '7f0000', '9c009c', 'fc7f00',
+    'ffff00', '00fc00', '009393', '00ffff', '0000fc', 'ff00ff', '7f7f7f', 'd2d2d2',
+    '470000', '472100', '474700', '324700', '004700', '00472c', '004747', '002747',
+    '000047', '2e0047', '470047', '47002a', '740000', '743a00', '747400', '517400',
+    '007400', '007449', '007474', '004074', '000074', '4b0074', '740074', '740045',
+    'b50000', 'b56300', 'b5b500', '7db500', '00b500', '00b571', '00b5b5', '0063b5',
+    '0000b5', '7500b5', 'b500b5', 'b5006b', 'ff0000', 'ff8c00', 'ffff00', 'b2ff00',
+    '00ff00', '00ffa0', '00ffff', '008cff', '0000ff', 'a500ff', 'ff00ff', 'ff0098',
+    'ff5959', 'ffb459', 'ffff71', 'cfff60', '6fff6f', '65ffc9', '6dffff', '59b4ff',
+    '5959ff', 'c459ff', 'ff66ff', 'ff59bc', 'ff9c9c', 'ffd39c', 'ffff9c', 'e2ff9c',
+    '9cff9c', '9cffdb', '9cffff', '9cd3ff', '9c9cff', 'dc9cff', 'ff9cff', 'ff94d3',
+    '000000', '131313', '282828', '363636', '4d4d4d', '656565', '818181', '9f9f9f',
+    'bcbcbc', 'e2e2e2', 'ffffff'
+)
 
-def styled(text, foreground=None, background=None, styles=None):
+#: xterm 256 color palette indexes of the mIRC colors 0-15
+ansi_colors = (15, 0, 4, 2, 9, 1, 5, 3, 11, 10, 6, 14, 12, 13, 8, 7)
+
+
+class StyleState(namedtuple('StyleState', 'bold italic underline reverse strikethrough monospace '
+                                          'foreground background')):
     """
-    Apply mIRC compatible colors and styles to the given text.
+    The formatting in effect for a span of text.
 
-    :param text: the text to be styled
-    :param foreground: the foreground color
+    Colors are either mIRC color numbers (:class:`int`) or ``RRGGBB`` hex strings (:class:`str`),
+    or ``None`` for the default color.
+    """
+
+    __slots__ = ()
+
+    @property
+    def is_plain(self):
+        """``True`` if no formatting is in effect."""
+        return self == plain_state
+
+
+#: the style state of unformatted text
+plain_state = StyleState(False, False, False, False, False, False, None, None)
+
+_toggles = {
+    '\x02': 'bold',
+    '\x1d': 'italic',
+    '\x1f': 'underline',
+    '\x16': 'reverse',
+    '\x1e': 'strikethrough',
+    '\x11': 'monospace'
+}
+
+
+def _build_color_prefixes():
+    prefixes = {}
+    for foreground in IRCTextColor:
+        for fg_key in (foreground, foreground.value):
+            prefixes[(fg_key, None)] = '\x03%d' % foreground.value
+            for background in IRCTextColor:
+                prefix = '\x03%d,%d' % (foreground.value, background.value)
+                prefixes[(fg_key, background)] = prefixes[(fg_key, background.value)] = prefix
+
+    return prefixes
+
+
+#: color code prefixes for every (foreground, background) combination, keyed by either
+#: :class:`IRCTextColor` members or plain color numbers
+color_prefixes = _build_color_prefixes()
+
+_style_order = {style: index for index, style in enumerate(IRCTextStyle)}
+
+_templates = {}  # type: Dict[Tuple[Any, Any, Any], StyleTemplate]
+_max_templates = 4096
+
+
+class StyleTemplate(object):
+    """
+    A precompiled combination of colors and text styles.
+
+    Calling the template with a piece of text returns the styled text. Use :func:`compile_style`
+    to get an instance.
+
+    :ivar str prefix: control codes placed in front of the text
+    :ivar str suffix: control codes placed after the text
+    """
+
+    __slots__ = ('prefix', 'suffix')
+
+    def __init__(self, foreground=None, background=None, styles=None):
+        prefix = suffix = ''
+        if styles:
+            if isinstance(styles, IRCTextStyle):
+                styles = (styles,)
+
+            ordered = sorted(set(styles), key=_style_order.__getitem__)
+            prefix = ''.join(style.value for style in ordered)
+            suffix = IRCTextStyle.plain.value  # reset to default at the end
+
+        if foreground is not None:
+            prefix += color_prefixes[(foreground, background)]
+            suffix = '\x03' + suffix
+
+        self.prefix = prefix
+        self.suffix = suffix
+
+    def __call__(self, text):
+        return self.prefix + text + self.suffix
+
+
+def compile_style(foreground=None, background=None, styles=None):
+    """
+    Return a (cached) style template for the given combination of colors and styles.
+
+    :param foreground: the foreground color (an :class:`IRCTextColor` or a color number)
     :param background: the background color (only works if foreground is defined too)
     :param styles: a text style or iterable of text styles to apply
+    :rtype: StyleTemplate
 
     """
-    # Apply coloring
-    if foreground and not background:
-        text = '\x03%d%s\x03' % (foreground.value, text)
-    elif foreground and background:
-        text = '\x03%d,%d%s\x03' % (foreground.value, background.value, text)
+    if styles is not None and not isinstance(styles, (IRCTextStyle, tuple)):
+        styles = tuple(styles)
 
-    # Apply text styles
-    if styles:
-        if isinstance(styles, IRCTextStyle):
-            text = styles.value + text
-        else:
-            text = ''.join(style.value for style in styles) + text
+    key = (foreground, background, styles)
+    template = _templates.get(key)
+    if template is None:
+        if len(_templates) >= _max_templates:
+            _templates.clear()
 
-        text += IRCTextStyle.plain.value  # reset to default at the end
+        template = _templates[key] = StyleTemplate(foreground, background, styles)
 
-    return text
+    return template
+
+
+def styled(text, foreground=None, background=None, styles=None):
+    """
+    Apply mIRC compatible colors and styles to the given text.
+
+    Text styles are always emitted in a fixed order, regardless of the order they were given in.
+    When styling many texts the same way, use :func:`compile_style` instead.
+
+    :param text: the text to be styled
+    :param foreground: the foreground color (an :class:`IRCTextColor` or a color number)
+    :param background: the background color (only works if foreground is defined too)
+    :param styles: a text style or iterable of text styles to apply
+
+    """
+    template = compile_style(foreground, background, styles)
+    return template.prefix + text + template.suffix
 
 
 def strip_styles(text):
     """
     Remove all mIRC compatible styles and coloring from the given text.
 
+    Text without any formatting codes is returned as is.
+
     :param str text: the text to be sanitized
     :return: input text with styles removed
 
     """
-    return styles_re.sub('', text)
+    match = styles_re.search(text)
+    if match is None:
+        return text
+
+    start = match.start()
+    return text[:start] + styles_re.sub('', text[start:])
+
+
+def _parse_color(match, state):
+    if match.group(1) is not None:
+        foreground = int(match.group(1))
+        background = state.background
+        if match.group(2) is not None:
+            background = int(match.group(2))
+    elif match.group(3) is not None:
+        foreground = match.group(3).lower()
+        background = state.background
+        if match.group(4) is not None:
+            background = match.group(4).lower()
+    else:
+        # A bare color code resets both colors
+        return state._replace(foreground=None, background=None)
+
+    # Color 99 means the default color
+    return state._replace(foreground=None if foreground == 99 else foreground,
+                          background=None if background == 99 else background)
+
+
+def tokenize_styles(text):
+    """
+    Split formatted text into spans of uniformly styled text.
+
+    Formatting codes that do not change the effective style still end the current span, and empty
+    spans are not yielded. Text without any formatting codes is yielded as is, in a single span.
+
+    :param str text: the formatted text
+    :return: an iterator yielding ``(text, state)`` tuples where ``state`` is a
+        :class:`StyleState`
+
+    """
+    state = plain_state
+    position = 0
+    for match in styles_re.finditer(text):
+        start = match.start()
+        if start > position:
+            yield text[position:start], state
+
+        code = match.group()[0]
+        if code in _toggles:
+            attribute = _toggles[code]
+            state = state._replace(**{attribute: not getattr(state, attribute)})
+        elif code == '\x0f':
+            state = plain_state
+        else:
+            state = _parse_color(match, state)
+
+        position = match.end()
+
+    if position < len(text):
+        yield text[position:] if position else text, state
+
+
+def _color_value(color):
+    if isinstance(color, int):
+        return color_values[color] if color < len(color_values) else None
+
+    return color
+
+
+def _html_escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').\
+        replace('"', '&quot;')
+
+
+def _html_style(state):
+    foreground, background = _color_value(state.foreground), _color_value(state.background)
+    if state.reverse:
+        foreground, background = background or 'ffffff', foreground or '000000'
+
+    rules = []
+    if state.bold:
+        rules.append('font-weight: bold')
+    if state.italic:
+        rules.append('font-style: italic')
+    if state.underline or state.strikethrough:
+        rules.append('text-decoration:%s%s' % (' underline' if state.underline else '',
+                                               ' line-through' if state.strikethrough else ''))
+    if state.monospace:
+        rules.append('font-family: monospace')
+    if foreground:
+        rules.append('color: #' + foreground)
+    if background:
+        rules.append('background-color: #' + background)
+
+    return '; '.join(rules)
+
+
+def styles_to_html(text):
+    """
+    Convert formatted text to HTML.
+
+    Styled spans are wrapped in ``<span>`` elements with inline CSS. All text is HTML escaped.
+
+    :param str text: the formatted text
+    :rtype: str
+
+    """
+    if styles_re.search(text) is None:
+        return _html_escape(text)
+
+    parts = []
+    for span, state in tokenize_styles(text):
+        span = _html_escape(span)
+        style = _html_style(state)
+        if style:
+            parts.append('<span style="%s">%s</span>' % (style, span))
+        else:
+            parts.append(span)
+
+    return ''.join(parts)
+
+
+def _ansi_color(color, base):
+    if isinstance(color, int):
+        if color < len(ansi_colors):
+            return '%d;5;%d' % (base, ansi_colors[color])
+
+        color = _color_value(color)
+        if color is None:
+            return None
+
+    return '%d;2;%d;%d;%d' % (base, int(color[:2], 16), int(color[2:4], 16), int(color[4:], 16))
+
+
+def _ansi_sequence(state):
+    codes = ['0']
+    if state.bold:
+        codes.append('1')
+    if state.italic:
+        codes.append('3')
+    if state.underline:
+        codes.append('4')
+    if state.reverse:
+        codes.append('7')
+    if state.strikethrough:
+        codes.append('9')
+    if state.foreground is not None:
+        codes.append(_ansi_color(state.foreground, 38))
+    if state.background is not None:
+        codes.append(_ansi_color(state.background, 48))
+
+    return '\x1b[%sm' % ';'.join(code for code in codes if code)
+
+
+def styles_to_ansi(text):
+    """
+    Convert formatted text to ANSI terminal escape sequences.
+
+    Colors are emitted as 256 color (for the basic mIRC colors) or 24-bit color sequences.
+
+    :param str text: the formatted text
+    :rtype: str
+
+    """
+    if styles_re.search(text) is None:
+        return text
+
+    parts = []
+    current = plain_state
+    for span, state in tokenize_styles(text):
+        if state != current:
+            parts.append(_ansi_sequence(state))
+            current = state
+
+        parts.append(span)
+
+    if current != plain_state:
+        parts.append('\x1b[0m')
+
+    return ''.join(parts)
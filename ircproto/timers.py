@@ -0,0 +1,366 @@
+"""
+Timers for large numbers of connections.
+
+:class:`TimerWheel` is a hierarchical timer wheel. Scheduling and cancelling a timer take constant
+time, and so does each tick, apart from running the timers that expire on it, no matter how many
+timers are pending. The wheel does no I/O of its own: the application calls
+:meth:`TimerWheel.advance` regularly (for example once per tick from its event loop) and the
+expired timers are run from within that call. The time is read from a clock callable, so tests can
+use a fake clock.
+
+:class:`ConnectionMonitor` uses a wheel to check that connections are alive with ``PING``, to time
+out connections that fail to register and to resume reading from connections whose flood penalty
+has decayed. A single wheel and monitor can serve all the connections of an
+:class:`~ircproto.states.IRCServer`, or a swarm of client connections.
+"""
+from __future__ import unicode_literals
+
+import math
+from collections import deque
+from timeit import default_timer
+
+#: number of bits of the tick counter covered by each level of the wheel
+level_bits = (8, 6, 6, 6)
+
+
+class Timer(object):
+    """
+    A scheduled call, returned by :meth:`TimerWheel.call_at` and :meth:`TimerWheel.call_later`.
+
+    :ivar int deadline: the tick on which the timer expires
+    """
+
+    __slots__ = ('deadline', 'callback', 'args', '_wheel', '_bucket', '_level')
+
+    def __init__(self, wheel, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self._wheel = wheel
+        self._bucket = None
+        self._level = 0
+
+    @property
+    def active(self):
+        """``True`` if the timer has neither run nor been cancelled."""
+        return self.callback is not None
+
+    def cancel(self):
+        """Cancel the timer. Does nothing if the timer has already run or been cancelled."""
+        if self.callback is not None:
+            self.callback = self.args = None
+            self._wheel._count -= 1
+            if self._bucket is not None:
+                del self._bucket[self]
+                self._bucket = None
+                self._wheel._level_counts[self._level] -= 1
+
+
+class TimerWheel(object):
+    """
+    Runs callbacks after a delay, in ticks of ``resolution`` seconds.
+
+    Timers never run early, but may run up to one tick (plus the interval between calls to
+    :meth:`advance`) late. If a callback raises an exception, it propagates from :meth:`advance`
+    and the remaining expired timers are run on the next call.
+
+    :param float resolution: length of a tick, in seconds
+    :param clock: a callable returning the current time in seconds
+    :ivar float now: the time on the clock at the last call to :meth:`advance`
+    """
+
+    __slots__ = ('resolution', 'clock', 'now', '_tick', '_levels', '_level_counts', '_due',
+                 '_count')
+
+    def __init__(self, resolution=1.0, clock=default_timer):
+        self.resolution = resolution
+        self.clock = clock
+        self.now = clock()
+        self._tick = int(self.now // resolution) + 1  # the next tick to process
+        self._levels = [[{} for _ in range(1 << bits)] for bits in level_bits]
+        self._level_counts = [0] * len(level_bits)
+        self._due = deque()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def call_at(self, when, callback, *args):
+        """
+        Schedule a callback to be run at the given time.
+
+        :param float when: the time (on the wheel's clock) to run the callback at
+        :param callback: the callable to run
+        :param args: positional arguments to the callable
+        :rtype: Timer
+
+        """
+        timer = Timer(self, int(math.ceil(when / self.resolution)), callback, args)
+        self._count += 1
+        self._schedule(timer)
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        """
+        Schedule a callback to be run after the given delay from :attr:`now`.
+
+        :param float delay: the delay, in seconds
+        :param callback: the callable to run
+        :param args: positional arguments to the callable
+        :rtype: Timer
+
+        """
+        return self.call_at(self.now + delay, callback, *args)
+
+    def advance(self):
+        """
+        Run the timers that have expired by the current time on the clock.
+
+        :return: the number of timers that were run
+
+        """
+        self.now = self.clock()
+        target = int(self.now // self.resolution)
+        fired = self._run_due()
+        level0 = self._levels[0]
+        level_counts = self._level_counts
+        mask = len(level0) - 1
+        while self._tick <= target:
+            if not self._count:
+                # Nothing is scheduled, so the ticks in between can be skipped
+                self._tick = target + 1
+                break
+
+            tick = self._tick
+            if not level_counts[0]:
+                # Skip ahead to the next tick on which timers can cascade down to the first level
+                shift = level_bits[0]
+                for level in range(1, len(level_bits) - 1):
+                    if level_counts[level]:
+                        break
+
+                    shift += level_bits[level]
+
+                span_mask = (1 << shift) - 1
+                if tick & span_mask:
+                    self._tick = min((tick | span_mask) + 1, target + 1)
+                    continue
+
+            index = tick & mask
+            if not index:
+                self._cascade(tick)
+
+            bucket = level0[index]
+            self._tick = tick + 1
+            if bucket:
+                level0[index] = {}
+                level_counts[0] -= len(bucket)
+                for timer in bucket:
+                    timer._bucket = None
+
+                self._due.extend(bucket)
+                fired += self._run_due()
+
+        return fired
+
+    def _schedule(self, timer):
+        deadline = max(timer.deadline, self._tick)
+        delta = deadline - self._tick
+        shift = 0
+        for level, (bits, buckets) in enumerate(zip(level_bits, self._levels)):
+            if delta < 1 << (shift + bits):
+                break
+
+            shift += bits
+        else:
+            # Too far in the future for the wheel: park the timer in the last slot that can be
+            # reached, from where it is rescheduled when that slot is cascaded
+            shift -= bits
+            deadline = self._tick + (1 << (shift + bits)) - 1
+
+        bucket = buckets[(deadline >> shift) & ((1 << bits) - 1)]
+        bucket[timer] = None
+        timer._bucket = bucket
+        timer._level = level
+        self._level_counts[level] += 1
+
+    def _cascade(self, tick):
+        # Move the timers from the next slot of each higher level down as the level below wraps
+        shift = level_bits[0]
+        for level in range(1, len(level_bits)):
+            bits, buckets = level_bits[level], self._levels[level]
+            index = (tick >> shift) & ((1 << bits) - 1)
+            bucket = buckets[index]
+            if bucket:
+                buckets[index] = {}
+                self._level_counts[level] -= len(bucket)
+                for timer in bucket:
+                    self._schedule(timer)
+
+            if index:
+                break
+
+            shift += bits
+
+    def _run_due(self):
+        due = self._due
+        fired = 0
+        while due:
+            timer = due.popleft()
+            callback, args = timer.callback, timer.args
+            if callback is not None:
+                timer.callback = timer.args = None
+                self._count -= 1
+                fired += 1
+                callback(*args)
+
+        return fired
+
+
+class _Watch(object):
+    __slots__ = ('connection', 'last_received', 'penalty', 'penalty_time', 'liveness_timer',
+                 'registration_timer', 'resume_timer')
+
+    def __init__(self, connection, now):
+        self.connection = connection
+        self.last_received = now
+        self.penalty = 0.0
+        self.penalty_time = now
+        self.liveness_timer = self.registration_timer = self.resume_timer = None
+
+    def decay_penalty(self, now):
+        self.penalty = max(0.0, self.penalty - (now - self.penalty_time))
+        self.penalty_time = now
+        return self.penalty
+
+
+class ConnectionMonitor(object):
+    """
+    Watches over connections with a :class:`TimerWheel`.
+
+    * Liveness: a connection that has received nothing for ``ping_interval`` seconds is sent a
+      ``PING``. If nothing has been received ``ping_timeout`` seconds after that, the connection
+      has timed out.
+    * Registration: a connection that has not registered within ``registration_timeout``
+      seconds of being added has timed out.
+    * Flood penalties: :meth:`add_penalty` adds to a connection's penalty, which decays at one
+      second per second. While the penalty exceeds ``max_penalty``, the application should stop
+      reading from the connection. ``on_resume`` is called when it may continue.
+
+    Call :meth:`data_received` whenever data arrives on a connection. This only records the time,
+    so it is cheap: the liveness timer of each connection runs once per ping interval and checks
+    when the connection was last heard from.
+
+    :param TimerWheel wheel: the timer wheel to use
+    :param on_timeout: a callable taking the connection and the reason (``ping timeout`` or
+        ``registration timeout``), called when a connection times out; the application should
+        close the connection
+    :param float ping_interval: seconds of silence after which a ``PING`` is sent
+    :param float ping_timeout: seconds to wait for data after sending a ``PING``
+    :param float registration_timeout: seconds a connection has to register, or ``None`` to not
+        time out unregistered connections
+    :param float max_penalty: the flood penalty (in seconds) above which a connection is throttled
+    :param on_resume: a callable taking the connection, called when a throttled connection's
+        penalty has decayed to ``max_penalty``
+    """
+
+    __slots__ = ('wheel', 'on_timeout', 'ping_interval', 'ping_timeout', 'registration_timeout',
+                 'max_penalty', 'on_resume', '_watches')
+
+    def __init__(self, wheel, on_timeout, ping_interval=120.0, ping_timeout=60.0,
+                 registration_timeout=30.0, max_penalty=10.0, on_resume=None):
+        self.wheel = wheel
+        self.on_timeout = on_timeout
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.registration_timeout = registration_timeout
+        self.max_penalty = max_penalty
+        self.on_resume = on_resume
+        self._watches = {}
+
+    def __len__(self):
+        return len(self._watches)
+
+    def add(self, connection):
+        """Start watching a connection."""
+        watch = self._watches[connection] = _Watch(connection, self.wheel.now)
+        watch.liveness_timer = self.wheel.call_later(self.ping_interval, self._check_liveness,
+                                                     watch)
+        if self.registration_timeout is not None and not connection.registered:
+            watch.registration_timer = self.wheel.call_later(
+                self.registration_timeout, self._check_registration, watch)
+
+    def remove(self, connection):
+        """Stop watching a connection. Does nothing if the connection is not being watched."""
+        watch = self._watches.pop(connection, None)
+        if watch is not None:
+            for timer in (watch.liveness_timer, watch.registration_timer, watch.resume_timer):
+                if timer is not None:
+                    timer.cancel()
+
+    def data_received(self, connection):
+        """Record that data was received on a connection."""
+        watch = self._watches.get(connection)
+        if watch is not None:
+            watch.last_received = self.wheel.now
+
+    def add_penalty(self, connection, seconds):
+        """
+        Add to the flood penalty of a connection.
+
+        :param connection: the connection
+        :param float seconds: the penalty to add
+        :return: ``True`` if the connection is now throttled
+
+        """
+        watch = self._watches[connection]
+        now = self.wheel.now
+        penalty = watch.decay_penalty(now) + seconds
+        watch.penalty = penalty
+        if penalty <= self.max_penalty:
+            return False
+
+        if watch.resume_timer is None:
+            watch.resume_timer = self.wheel.call_at(now + penalty - self.max_penalty,
+                                                    self._check_penalty, watch)
+
+        return True
+
+    def is_throttled(self, connection):
+        """Return ``True`` if the flood penalty of the connection exceeds the maximum."""
+        watch = self._watches[connection]
+        return watch.decay_penalty(self.wheel.now) > self.max_penalty
+
+    def _time_out(self, watch, reason):
+        self.remove(watch.connection)
+        self.on_timeout(watch.connection, reason)
+
+    def _check_liveness(self, watch):
+        now = self.wheel.now
+        if watch.last_received is None:
+            watch.liveness_timer = None
+            self._time_out(watch, 'ping timeout')
+        elif now - watch.last_received >= self.ping_interval:
+            watch.connection.send_command('PING', '%d' % now)
+            watch.last_received = None
+            watch.liveness_timer = self.wheel.call_later(self.ping_timeout, self._check_liveness,
+                                                         watch)
+        else:
+            watch.liveness_timer = self.wheel.call_at(watch.last_received + self.ping_interval,
+                                                      self._check_liveness, watch)
+
+    def _check_registration(self, watch):
+        watch.registration_timer = None
+        if not watch.connection.registered:
+            self._time_out(watch, 'registration timeout')
+
+    def _check_penalty(self, watch):
+        now = self.wheel.now
+        excess = watch.decay_penalty(now) - self.max_penalty
+        if excess > 0:
+            # More penalty was added after the timer was scheduled
+            watch.resume_timer = self.wheel.call_at(now + excess, self._check_penalty, watch)
+        else:
+            watch.resume_timer = None
+            if self.on_resume is not None:
+                self.on_resume(watch.connection)
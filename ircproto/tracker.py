@@ -0,0 +1,303 @@
+"""
+Client side tracking of channels and their members.
+
+The tracker is opt-in: pass a :class:`StateTracker` to
+:class:`~ircproto.connection.IRCClientConnection` and it will be updated with every received event.
+Channels and users are indexed by their case folded names, so membership and status checks such as
+``tracker.has_mode('#channel', 'nick', 'o')`` take constant time.
+"""
+from __future__ import unicode_literals
+
+from ircproto.constants import (
+    RPL_CHANNELMODEIS, RPL_ENDOFNAMES, RPL_NAMREPLY, RPL_NOTOPIC, RPL_TOPIC, RPL_WHOREPLY)
+from ircproto.events import Join, Kick, Mode, Nick, Part, Quit, Reply, Topic
+from ircproto.modes import LIST_MODE, PREFIX_MODE, get_mode_table
+from ircproto.utils import casefold
+
+
+class TrackedUser(object):
+    """
+    A user seen on at least one of the tracked channels.
+
+    :ivar str nickname: the nickname of the user
+    :ivar str username: the user name, if known
+    :ivar str host: the host name, if known
+    :ivar str realname: the real name, if known (from ``WHO`` replies)
+    :ivar set channels: case folded names of the tracked channels the user is on
+    """
+
+    __slots__ = ('nickname', 'username', 'host', 'realname', 'channels')
+
+    def __init__(self, nickname, username=None, host=None):
+        self.nickname = nickname
+        self.username = username
+        self.host = host
+        self.realname = None
+        self.channels = set()
+
+
+class TrackedChannel(object):
+    """
+    A channel the client is on.
+
+    :ivar str name: the channel name
+    :ivar str topic: the channel topic (``None`` if not set)
+    :ivar set modes: the parameterless channel modes currently set
+    :ivar dict mode_params: parameters of the channel modes that have one (e.g. ``k`` and ``l``)
+    :ivar dict members: member mode letters (like ``o`` or ``v``), keyed by case folded nickname
+    """
+
+    __slots__ = ('name', 'topic', 'modes', 'mode_params', 'members', '_names_complete')
+
+    def __init__(self, name):
+        self.name = name
+        self.topic = None
+        self.modes = set()
+        self.mode_params = {}
+        self.members = {}
+        self._names_complete = True
+
+
+class StateTracker(object):
+    """
+    Keeps track of the channels the client is on, their members and their state.
+
+    :param str casemapping: the case mapping used by the server
+    :param str prefixes: the membership prefixes in the ``PREFIX`` ISUPPORT format
+    :param str chanmodes: the channel mode types in the ``CHANMODES`` ISUPPORT format
+    :ivar mode_table: the :class:`~ircproto.modes.ModeTable` used to parse mode changes
+    :ivar dict channels: :class:`TrackedChannel` instances keyed by case folded channel name
+    :ivar dict users: :class:`TrackedUser` instances keyed by case folded nickname
+    """
+
+    __slots__ = ('casemapping', 'mode_table', 'channels', 'users')
+
+    def __init__(self, casemapping='rfc1459', prefixes='(qaohv)~&@%+', chanmodes='beI,k,l,'):
+        self.casemapping = casemapping
+        self.mode_table = get_mode_table(chanmodes, prefixes)
+        self.channels = {}
+        self.users = {}
+
+    @property
+    def prefix_modes(self):
+        """Membership mode letters keyed by their prefix symbol."""
+        return self.mode_table.prefix_modes
+
+    def set_prefixes(self, prefixes):
+        """Set the membership prefixes, in the ``PREFIX`` ISUPPORT format (e.g. ``(ov)@+``)."""
+        self.mode_table = get_mode_table(self.mode_table.chanmodes, prefixes)
+
+    def set_chanmodes(self, chanmodes):
+        """Set the channel mode types, in the ``CHANMODES`` ISUPPORT format."""
+        self.mode_table = get_mode_table(chanmodes, self.mode_table.prefix)
+
+    def fold(self, name):
+        """Return the case folded form of a nickname or channel name."""
+        return casefold(name, self.casemapping)
+
+    def get_channel(self, name):
+        """Return the tracked channel by the given name, or ``None``."""
+        return self.channels.get(self.fold(name))
+
+    def get_user(self, nickname):
+        """Return the tracked user by the given nickname, or ``None``."""
+        return self.users.get(self.fold(nickname))
+
+    def is_on_channel(self, nickname, channel):
+        """Return ``True`` if the user is on the given channel."""
+        channel = self.channels.get(self.fold(channel))
+        return channel is not None and self.fold(nickname) in channel.members
+
+    def has_mode(self, channel, nickname, mode):
+        """
+        Check if a user is on a channel with the given membership mode.
+
+        :param str channel: name of the channel
+        :param str nickname: nickname of the user
+        :param str mode: the mode letter (e.g. ``o`` for channel operators)
+
+        """
+        channel = self.channels.get(self.fold(channel))
+        if channel is not None:
+            modes = channel.members.get(self.fold(nickname))
+            return modes is not None and mode in modes
+
+        return False
+
+    def is_op(self, channel, nickname):
+        """Return ``True`` if the user is a channel operator on the given channel."""
+        return self.has_mode(channel, nickname, 'o')
+
+    def handle_event(self, event, own_nickname):
+        """
+        Update the tracked state based on a received event.
+
+        :param event: the received event
+        :param str own_nickname: the client's current nickname
+
+        """
+        if isinstance(event, Reply):
+            self._handle_reply(event)
+            return
+
+        sender = event.sender
+        if not sender:
+            return
+
+        nickname, _, userhost = sender.partition('!')
+        folded_nick = self.fold(nickname)
+        if isinstance(event, Join):
+            if folded_nick == self.fold(own_nickname):
+                self.channels[self.fold(event.channel)] = TrackedChannel(event.channel)
+
+            username, _, host = userhost.partition('@')
+            self._add_member(event.channel, nickname, '', username or None, host or None)
+        elif isinstance(event, Part):
+            for channel in event.channel.split(','):
+                if folded_nick == self.fold(own_nickname):
+                    self._remove_channel(channel)
+                else:
+                    self._remove_member(channel, folded_nick)
+        elif isinstance(event, Kick):
+            if self.fold(event.nickname) == self.fold(own_nickname):
+                self._remove_channel(event.channel)
+            else:
+                self._remove_member(event.channel, self.fold(event.nickname))
+        elif isinstance(event, Quit):
+            user = self.users.pop(folded_nick, None)
+            if user is not None:
+                for channel in user.channels:
+                    self.channels[channel].members.pop(folded_nick, None)
+        elif isinstance(event, Nick):
+            self._rename_user(folded_nick, event.nickname)
+        elif isinstance(event, Topic):
+            channel = self.channels.get(self.fold(event.channel))
+            if channel is not None:
+                channel.topic = event.topic or None
+        elif isinstance(event, Mode):
+            channel = self.channels.get(self.fold(event.target))
+            if channel is not None:
+                self._apply_modes(channel, event.modes, event.modeparams)
+
+    def _handle_reply(self, event):
+        code = event.code
+        if code == RPL_NAMREPLY:
+            channel = self._find_channel(event.channel)
+            if channel is not None:
+                if channel._names_complete:
+                    # A new listing replaces the old membership information
+                    for folded_nick in list(channel.members):
+                        self._remove_member(channel.name, folded_nick)
+
+                    channel._names_complete = False
+
+                for name in event.nicks or ():
+                    modes = ''
+                    while name and name[0] in self.prefix_modes:
+                        modes += self.prefix_modes[name[0]]
+                        name = name[1:]
+
+                    nickname, _, userhost = name.partition('!')
+                    username, _, host = userhost.partition('@')
+                    self._add_member(channel.name, nickname, modes, username or None,
+                                     host or None)
+        elif code == RPL_ENDOFNAMES:
+            channel = self._find_channel(event.channel)
+            if channel is not None:
+                channel._names_complete = True
+        elif code == RPL_WHOREPLY:
+            fields = event.fields
+            nickname = fields.get('nick')
+            folded_nick = self.fold(nickname) if nickname else None
+            user = self.users.get(folded_nick)
+            if user is not None:
+                user.username = fields.get('user', user.username)
+                user.host = fields.get('host', user.host)
+                user.realname = fields.get('real_name', '')
+                channel = self._find_channel(fields.get('channel'))
+                if channel is not None and folded_nick in channel.members:
+                    channel.members[folded_nick] = ''.join(
+                        self.prefix_modes[char] for char in fields.get('flags', '')
+                        if char in self.prefix_modes)
+        elif code in (RPL_TOPIC, RPL_NOTOPIC):
+            channel = self._find_channel(event.channel)
+            if channel is not None:
+                channel.topic = event.topic
+        elif code == RPL_CHANNELMODEIS:
+            params = event.params
+            channel = self._find_channel(event.channel)
+            if channel is not None and len(params) > 2:
+                self._apply_modes(channel, params[2], params[3:])
+
+    def _find_channel(self, name):
+        # Truncated replies have no channel name
+        return self.channels.get(self.fold(name)) if name else None
+
+    def _add_member(self, channel_name, nickname, modes, username=None, host=None):
+        folded_channel = self.fold(channel_name)
+        channel = self.channels.get(folded_channel)
+        if channel is None:
+            return
+
+        folded_nick = self.fold(nickname)
+        user = self.users.get(folded_nick)
+        if user is None:
+            user = self.users[folded_nick] = TrackedUser(nickname, username, host)
+        elif username:
+            user.username = username
+            user.host = host
+
+        user.channels.add(folded_channel)
+        channel.members[folded_nick] = modes
+
+    def _remove_member(self, channel_name, folded_nick):
+        folded_channel = self.fold(channel_name)
+        channel = self.channels.get(folded_channel)
+        if channel is not None and channel.members.pop(folded_nick, None) is not None:
+            user = self.users[folded_nick]
+            user.channels.discard(folded_channel)
+            if not user.channels:
+                del self.users[folded_nick]
+
+    def _remove_channel(self, channel_name):
+        folded_channel = self.fold(channel_name)
+        channel = self.channels.pop(folded_channel, None)
+        if channel is not None:
+            for folded_nick in channel.members:
+                user = self.users[folded_nick]
+                user.channels.discard(folded_channel)
+                if not user.channels:
+                    del self.users[folded_nick]
+
+    def _rename_user(self, folded_nick, new_nickname):
+        user = self.users.pop(folded_nick, None)
+        if user is not None:
+            new_folded_nick = self.fold(new_nickname)
+            user.nickname = new_nickname
+            self.users[new_folded_nick] = user
+            for folded_channel in user.channels:
+                members = self.channels[folded_channel].members
+                members[new_folded_nick] = members.pop(folded_nick)
+
+    def _apply_modes(self, channel, modes, params):
+        types = self.mode_table.types
+        for adding, mode, param in self.mode_table.parse(modes, params, strict=False):
+            mode_type = types.get(mode)
+            if mode_type == PREFIX_MODE:
+                folded_nick = self.fold(param)
+                member_modes = channel.members.get(folded_nick)
+                if member_modes is not None:
+                    if adding and mode not in member_modes:
+                        channel.members[folded_nick] = member_modes + mode
+                    elif not adding:
+                        channel.members[folded_nick] = member_modes.replace(mode, '')
+            elif mode_type == LIST_MODE:
+                pass
+            elif adding:
+                if param is None:
+                    channel.modes.add(mode)
+                else:
+                    channel.mode_params[mode] = param
+            else:
+                channel.modes.discard(mode)
+                channel.mode_params.pop(mode, None)
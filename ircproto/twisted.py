@@ -0,0 +1,182 @@
+"""
+Twisted protocol adapters for the ircproto connection state machines.
+
+The protocols in this module register themselves as push producers on their transports. When the
+transport's write buffer fills up, outgoing data is held back and written in a single
+``writeSequence()`` call once the transport resumes. If the held back data grows past
+``high_water`` bytes, reading from the peer is paused until the backlog drops below ``low_water``.
+"""
+from __future__ import absolute_import, unicode_literals
+
+from twisted.internet.interfaces import IPushProducer
+from twisted.internet.protocol import Protocol, Factory, connectionDone
+from twisted.python import log
+from zope.interface import implementer
+
+from ircproto.connection import IRCClientConnection, IRCServerConnection
+from ircproto.exceptions import ProtocolError
+
+
+@implementer(IPushProducer)
+class BaseIRCProtocol(Protocol):
+    """
+    Base class for Twisted protocols driving an ircproto connection.
+
+    Subclasses must set the ``conn`` attribute before the superclass implementation of
+    :meth:`connectionMade` runs: either in ``__init__()`` (like :class:`IRCClientProtocol`) or in
+    their own :meth:`connectionMade` (like :class:`IRCServerProtocol`, which needs the transport).
+
+    :ivar conn: the connection state machine
+    :ivar int high_water: number of pending outgoing bytes that causes reading to be paused
+    :ivar int low_water: number of pending outgoing bytes below which reading is resumed
+    """
+
+    conn = None
+    high_water = 256 * 1024
+    low_water = 64 * 1024
+
+    def __init__(self):
+        self._pending = []
+        self._pending_size = 0
+        self._writing_paused = False
+        self._reading_paused = False
+
+    @property
+    def pending_output_size(self):
+        """Return the number of outgoing bytes not yet handed over to the transport."""
+        return self._pending_size + self.conn.output_buffer_size
+
+    def connectionMade(self):
+        self.transport.registerProducer(self, True)
+        self.send_pending()
+
+    def connectionLost(self, reason=connectionDone):
+        del self._pending[:]
+        self._pending_size = 0
+
+    def dataReceived(self, data):
+        try:
+            events = self.conn.feed_data(data)
+        except ProtocolError:
+            log.err(None, 'IRC protocol violation from %s' % (self.transport.getPeer(),))
+            self.send_pending()
+            self.transport.abortConnection()
+            return
+
+        for event in events:
+            self.event_received(event)
+
+        self.send_pending()
+
+    def event_received(self, event):
+        """
+        Handle an event generated by the connection.
+
+        Any outgoing data generated by this method is sent automatically afterwards.
+
+        :param ircproto.events.IRCEvent event: the received event
+
+        """
+
+    def send_pending(self):
+        """
+        Move any outgoing data from the connection to the transport.
+
+        If the transport has asked us to stop producing, the data is held back instead and reading
+        from the peer is paused if the backlog exceeds ``high_water``.
+
+        """
+        data = self.conn.data_to_send()
+        if data:
+            self._pending.append(data)
+            self._pending_size += len(data)
+
+        if not self._pending:
+            return
+        elif self._writing_paused:
+            if not self._reading_paused and self._pending_size > self.high_water:
+                self._reading_paused = True
+                self.transport.pauseProducing()
+        else:
+            self._write_pending()
+
+    def _write_pending(self):
+        pending = self._pending
+        self._pending = []
+        self._pending_size = 0
+        self.transport.writeSequence(pending)
+
+    def pauseProducing(self):
+        self._writing_paused = True
+
+    def resumeProducing(self):
+        self._writing_paused = False
+        self.send_pending()
+        if self._reading_paused and self.pending_output_size < self.low_water:
+            self._reading_paused = False
+            self.transport.resumeProducing()
+
+    def stopProducing(self):
+        del self._pending[:]
+        self._pending_size = 0
+
+
+class IRCClientProtocol(BaseIRCProtocol):
+    """
+    Twisted protocol for the client side of an IRC connection.
+
+    Any arguments are passed to :class:`~ircproto.connection.IRCClientConnection`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(IRCClientProtocol, self).__init__()
+        self.conn = IRCClientConnection(*args, **kwargs)
+
+
+class IRCServerProtocol(BaseIRCProtocol):
+    """
+    Twisted protocol for the server side of a connection from an IRC client or server.
+
+    Handling an event on one connection often produces outgoing data on several others, so after
+    each event, pending data is flushed on every protocol known to the factory.
+    """
+
+    def connectionMade(self):
+        self.conn = IRCServerConnection(self.transport.getPeer().host, self.factory.server_state)
+        self.factory.protocols.add(self)
+        super(IRCServerProtocol, self).connectionMade()
+
+    def connectionLost(self, reason=connectionDone):
+        self.factory.protocols.discard(self)
+        super(IRCServerProtocol, self).connectionLost(reason)
+
+    def send_pending(self):
+        super(IRCServerProtocol, self).send_pending()
+        self.factory.send_pending(exclude=self)
+
+
+class IRCServerFactory(Factory):
+    """
+    Factory for :class:`IRCServerProtocol` instances sharing a single server state.
+
+    :ivar server_state: the shared server state
+    :vartype server_state: ircproto.states.IRCServer
+    :ivar set protocols: currently connected protocols
+    """
+
+    protocol = IRCServerProtocol
+
+    def __init__(self, server_state):
+        self.server_state = server_state
+        self.protocols = set()
+
+    def send_pending(self, exclude=None):
+        """
+        Flush outgoing data on every connected protocol that has some.
+
+        :param exclude: a protocol to skip
+
+        """
+        for protocol in list(self.protocols):
+            if protocol is not exclude and protocol.conn.output_buffer_size:
+                BaseIRCProtocol.send_pending(protocol)
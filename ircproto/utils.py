@@ -6,6 +6,19 @@ nickname_re = re.compile(b'[a-zA-Z[\]\\\\`_^{|}][a-zA-Z[\]\\\\`_^{|}0-9-]{0,8}$'
 channel_re = re.compile(b'([#+&]|![A-Z0-9]{5})[^\x00\x0b\r\n ,:]+$')
 hostmask_re = re.compile(b'(?:[^\x00?*]|[^\x00\\\\]\\?|\\*)+')
 
+ascii_casemap = dict((char, char + 32) for char in range(ord('A'), ord('Z') + 1))
+strict_rfc1459_casemap = dict(ascii_casemap)
+strict_rfc1459_casemap.update({ord('['): ord('{'), ord(']'): ord('}'), ord('\\'): ord('|')})
+rfc1459_casemap = dict(strict_rfc1459_casemap)
+rfc1459_casemap[ord('~')] = ord('^')
+
+#: translation tables for the case mappings defined by the ``CASEMAPPING`` ISUPPORT token
+casemaps = {
+    'ascii': ascii_casemap,
+    'strict-rfc1459': strict_rfc1459_casemap,
+    'rfc1459': rfc1459_casemap
+}
+
 
 def validate_channel_name(name):
     """
@@ -46,6 +59,18 @@ def validate_hostmask(mask):
                                                                    errors='backslashreplace'))
 
 
+def casefold(name, casemapping='rfc1459'):
+    """
+    Convert a nickname or channel name to a canonical form for case insensitive comparison.
+
+    :param str name: the name to convert
+    :param str casemapping: the case mapping in use on the server
+    :rtype: str
+
+    """
+    return name.translate(casemaps[casemapping])
+
+
 def match_hostmask(prefix, mask):
     """
     Match a prefix against a hostmask.
@@ -55,30 +80,39 @@ def match_hostmask(prefix, mask):
     :return: ``True`` if the prefix matches the mask, ``False`` otherwise
 
     """
+    # Work on integers so that indexing behaves the same on Python 2 and 3
+    prefix = bytearray(prefix)
+    mask = bytearray(mask)
     prefix_index = mask_index = 0
-    escape = False
-    while prefix_index < len(prefix) and mask_index < len(mask):
-        mask_char = mask[mask_index]
-        prefix_char = prefix[prefix_index]
-        if mask[mask_index] == b'\\':
-            escape = True
-            mask_index += 1
+    star_index = -1
+    star_prefix_index = 0
+    while prefix_index < len(prefix):
+        if mask_index < len(mask):
             mask_char = mask[mask_index]
-
-        prefix_index += 1
+            if mask_char == 0x5c and mask_index + 1 < len(mask):  # backslash
+                if mask[mask_index + 1] == prefix[prefix_index]:
+                    prefix_index += 1
+                    mask_index += 2
+                    continue
+            elif mask_char == 0x2a:  # *
+                star_index = mask_index
+                star_prefix_index = prefix_index
+                mask_index += 1
+                continue
+            elif mask_char == 0x3f or mask_char == prefix[prefix_index]:  # ?
+                prefix_index += 1
+                mask_index += 1
+                continue
+
+        # Backtrack: let the last * consume one more character
+        if star_index == -1:
+            return False
+
+        star_prefix_index += 1
+        prefix_index = star_prefix_index
+        mask_index = star_index + 1
+
+    while mask_index < len(mask) and mask[mask_index] == 0x2a:
         mask_index += 1
-        if escape or mask_char not in b'?*':
-            if mask_char != prefix_char:
-                return False
-        elif mask_char == b'?':
-            pass
-        elif mask_char == b'*':
-            if mask_index < len(mask):
-                mask_char = mask[mask_index]
-                prefix_index = prefix.find(mask_char, prefix_index)
-                if prefix_index == -1:
-                    return False
-            else:
-                break
-
-    return True
+
+    return mask_index == len(mask)
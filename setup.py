@@ -33,5 +33,8 @@ setup(
     keywords='irc',
     license='MIT',
     packages=find_packages(exclude=['tests']),
+    extras_require={
+        'twisted': ['twisted']
+    },
     setup_requires=['setuptools_scm']
 )
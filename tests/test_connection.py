@@ -0,0 +1,188 @@
+from __future__ import unicode_literals
+
+import pytest
+
+from ircproto.connection import IRCClientConnection
+from ircproto.events import BatchedEvents, Cap, OversizedMessage, PrivateMessage, Quit
+from ircproto.exceptions import ProtocolError
+
+
+def test_cap_negotiation():
+    conn = IRCClientConnection(capabilities=['batch', 'multi-prefix', 'echo-message'])
+    conn.negotiate_capabilities()
+    assert conn.data_to_send() == b'CAP LS 302\r\n'
+
+    conn.feed_data(b':irc.example.org CAP * LS * :multi-prefix sasl=PLAIN,EXTERNAL\r\n')
+    assert conn.data_to_send() == b''
+    conn.feed_data(b':irc.example.org CAP * LS :batch server-time\r\n')
+    assert conn.available_capabilities == {
+        'multi-prefix': None, 'sasl': 'PLAIN,EXTERNAL', 'batch': None, 'server-time': None}
+    assert conn.cap_state == 'requesting'
+    assert conn.data_to_send() == b'CAP REQ :batch multi-prefix\r\n'
+
+    conn.feed_data(b':irc.example.org CAP * ACK :batch multi-prefix\r\n')
+    assert conn.enabled_capabilities == {'batch', 'multi-prefix'}
+    assert conn.cap_state == 'done'
+    assert conn.data_to_send() == b'CAP END\r\n'
+
+
+def test_cap_nothing_to_request():
+    conn = IRCClientConnection(capabilities=['echo-message'])
+    conn.negotiate_capabilities()
+    conn.feed_data(b':irc.example.org CAP * LS :batch\r\n')
+    assert conn.data_to_send() == b'CAP LS 302\r\nCAP END\r\n'
+
+
+def test_cap_sasl_without_mechanism():
+    conn = IRCClientConnection(capabilities=['sasl'])
+    conn.negotiate_capabilities()
+    conn.feed_data(b':irc.example.org CAP * LS :sasl=PLAIN\r\n')
+    assert conn.data_to_send() == b'CAP LS 302\r\nCAP REQ sasl\r\n'
+    conn.feed_data(b':irc.example.org CAP * ACK :sasl\r\n')
+    assert conn.sasl_state is None
+    assert conn.data_to_send() == b'CAP END\r\n'
+
+
+def test_cap_nak():
+    conn = IRCClientConnection(capabilities=['batch'])
+    conn.negotiate_capabilities()
+    conn.feed_data(b':irc.example.org CAP * LS :batch\r\n'
+                   b':irc.example.org CAP * NAK :batch\r\n')
+    assert conn.enabled_capabilities == set()
+    assert conn.data_to_send().endswith(b'CAP END\r\n')
+
+
+def test_cap_decode_client():
+    event = Cap.decode(None, 'REQ', 'multi-prefix batch')
+    assert event.target is None
+    assert event.subcommand == 'REQ'
+    assert event.encode() == 'CAP REQ :multi-prefix batch\r\n'
+
+
+def test_batch():
+    conn = IRCClientConnection(capabilities=['batch'])
+    conn.negotiate_capabilities()
+    conn.feed_data(b':irc.example.org CAP * LS :batch\r\n:irc.example.org CAP * ACK batch\r\n')
+    events = conn.feed_data(
+        b':irc.example.org BATCH +yXNAbvnRHTRBv netsplit irc.hub other.host\r\n'
+        b'@batch=yXNAbvnRHTRBv :aji!a@a QUIT :irc.hub other.host\r\n'
+        b'@batch=yXNAbvnRHTRBv :bob!b@b QUIT :irc.hub other.host\r\n'
+        b':foo!bar@blah PRIVMSG #channel :interleaved\r\n'
+        b':irc.example.org BATCH -yXNAbvnRHTRBv\r\n')
+    assert len(events) == 2
+    assert isinstance(events[0], PrivateMessage)
+    batch = events[1]
+    assert isinstance(batch, BatchedEvents)
+    assert batch.type == 'netsplit'
+    assert batch.params == ('irc.hub', 'other.host')
+    assert [event.sender for event in batch.events] == ['aji!a@a', 'bob!b@b']
+    assert all(isinstance(event, Quit) for event in batch.events)
+
+
+def test_nested_batch():
+    conn = IRCClientConnection()
+    conn._batches = {}
+    events = conn.feed_data(
+        b':irc.example.org BATCH +outer example.com/outer\r\n'
+        b'@batch=outer :irc.example.org BATCH +inner example.com/inner\r\n'
+        b'@batch=inner :foo!bar@blah PRIVMSG #channel :hi\r\n'
+        b'@batch=outer :irc.example.org BATCH -inner\r\n'
+        b':irc.example.org BATCH -outer\r\n')
+    assert len(events) == 1
+    inner = events[0].events[0]
+    assert inner.reference == 'inner'
+    assert inner.events[0].message == 'hi'
+
+
+def test_register_pipelined():
+    conn = IRCClientConnection(capabilities=['multi-prefix'])
+    conn.register('nick', 'user', 'Real Name', password='secret')
+    assert conn.data_to_send() == (b'PASS secret\r\nCAP LS 302\r\nNICK nick\r\n'
+                                   b'USER user 0 * :Real Name\r\n')
+    assert conn.registration_state == 'registering'
+
+
+def test_register_alternate_nicknames():
+    conn = IRCClientConnection()
+    conn.register('nick', 'user', 'Real Name')
+    conn.data_to_send()
+    conn.feed_data(b':irc.example.org 433 * nick :Nickname is already in use\r\n'
+                   b':irc.example.org 433 * nick_ :Nickname is already in use\r\n'
+                   b':irc.example.org 433 * nick__ :Nickname is already in use\r\n')
+    assert conn.data_to_send() == b'NICK nick_\r\nNICK nick__\r\nNICK nick1\r\n'
+    assert conn.nickname == 'nick1'
+
+
+def test_register_custom_nickname_generator():
+    conn = IRCClientConnection(nickname_generator=lambda nickname: iter(['other']))
+    conn.register('nick', 'user', 'Real Name')
+    conn.feed_data(b':irc.example.org 433 * nick :Nickname is already in use\r\n')
+    assert conn.data_to_send().endswith(b'NICK other\r\n')
+    exc = pytest.raises(ProtocolError, conn.feed_data,
+                        b':irc.example.org 433 * other :Nickname is already in use\r\n')
+    assert str(exc.value) == 'IRC protocol violation: ran out of alternate nicknames'
+
+
+def test_queued_joins():
+    conn = IRCClientConnection()
+    conn.register('nick', 'user', 'Real Name')
+    conn.join('#foo')
+    conn.join('#secret', 'key')
+    conn.join('#bar')
+    conn.data_to_send()
+    conn.feed_data(b':irc.example.org 001 nick_ :Welcome to the Internet Relay Network '
+                   b'nick_!user@host\r\n')
+    assert conn.registered
+    assert conn.nickname == 'nick_'
+    assert conn.data_to_send() == b'JOIN #secret,#foo,#bar key\r\n'
+
+    conn.join('#baz')
+    assert conn.data_to_send() == b'JOIN #baz\r\n'
+
+
+def test_raw_events():
+    conn = IRCClientConnection(raw_events=True)
+    conn.register('foo', 'foo', 'Foo')
+    conn.data_to_send()
+    events = conn.feed_data(b':irc.example.org 433 * foo :Nickname is already in use\r\n'
+                            b'PING irc.example.org\r\n'
+                            b':bar!b@b PRIVMSG #channel :caf\xe9 \xff\r\n')
+    assert conn.data_to_send() == b'NICK foo_\r\nPONG irc.example.org\r\n'
+    assert [event.command for event in events] == ['433', 'PING', 'PRIVMSG']
+    assert events[2]._event is None
+    assert events[2].sender == b'bar!b@b'
+    assert events[2].params == [b'#channel', b'caf\xe9 \xff']
+    assert events[2].decode_param(0) == '#channel'
+    assert isinstance(events[2].decode(), PrivateMessage)
+
+
+def test_oversized_line():
+    conn = IRCClientConnection()
+    events = conn.feed_data(b':foo!bar@blah PRIVMSG #channel :' + b'x' * 600 + b'\r\n'
+                            b':foo!bar@blah QUIT\r\n')
+    assert isinstance(events[0], OversizedMessage)
+    assert events[0].length == 634
+    assert isinstance(events[1], Quit)
+
+
+def test_unterminated_line_discarded():
+    conn = IRCClientConnection()
+    assert conn.feed_data(b'x' * 5000) == []
+    assert conn.feed_data(b'x' * 5000) == []
+    assert len(conn._input_buffer) == 0
+    assert conn.feed_data(b'x' * 5000) == []
+    events = conn.feed_data(b'xx\r\n:foo!bar@blah QUIT\n')
+    assert isinstance(events[0], OversizedMessage)
+    assert events[0].length == 15004
+    assert isinstance(events[1], Quit)
+    assert len(conn._input_buffer) == 0
+
+
+@pytest.mark.parametrize('raw_events', [False, True], ids=['decoded', 'raw'])
+def test_blank_lines(raw_events):
+    conn = IRCClientConnection(raw_events=raw_events)
+    assert conn.feed_data(b'\r\n') == []
+    events = conn.feed_data(b'PING :a\n\n')
+    assert len(events) == 1
+    assert conn.data_to_send() == b'PONG a\r\n'
+    assert len(conn._input_buffer) == 0
@@ -0,0 +1,154 @@
+from __future__ import unicode_literals
+
+import pytest
+
+from ircproto.connection import IRCClientConnection
+from ircproto.ctcp import (
+    CTCPResponder, RateLimiter, extract_ctcp, join_tagged, pack_ipv4, unpack_ipv4)
+from ircproto.events import (
+    decode_event, CTCPAction, CTCPDCC, CTCPMessage, CTCPPing, CTCPVersion, PrivateMessage)
+from ircproto.exceptions import ProtocolError
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+def decode(line):
+    return decode_event(bytearray(line + b'\r\n'))
+
+
+@pytest.mark.parametrize('message, expected', [
+    ('hello', ('hello', [])),
+    ('\x01VERSION\x01', ('', [('VERSION', None)])),
+    ('hi \x01ACTION waves\x01 there', ('hi  there', [('ACTION', 'waves')])),
+    ('\x01PING 123\x01\x01TIME\x01', ('', [('PING', '123'), ('TIME', None)])),
+    ('\x01ACTION unterminated', ('', [('ACTION', 'unterminated')]))
+], ids=['plain', 'query', 'mixed', 'multiple', 'unterminated'])
+def test_extract_ctcp(message, expected):
+    assert extract_ctcp(message) == expected
+
+
+def test_join_tagged_invalid():
+    exc = pytest.raises(ProtocolError, join_tagged, 'ACTION', 'bad\x01data')
+    assert str(exc.value) == "IRC protocol violation: CTCP messages cannot contain '\\x01'"
+
+
+def test_decode_action():
+    event = decode(b':foo!bar@blah PRIVMSG #channel :\x01ACTION waves hello\x01')
+    assert isinstance(event, CTCPAction)
+    assert event.recipient == '#channel'
+    assert event.data == 'waves hello'
+    assert not event.is_reply
+    assert event.encode() == ':foo!bar@blah PRIVMSG #channel :\x01ACTION waves hello\x01\r\n'
+
+
+def test_decode_version_reply():
+    event = decode(b':foo!bar@blah NOTICE me :\x01VERSION someclient 1.0\x01')
+    assert isinstance(event, CTCPVersion)
+    assert event.is_reply
+    assert event.command == 'NOTICE'
+    assert event.data == 'someclient 1.0'
+
+
+def test_decode_unknown_tag():
+    event = decode(b':foo!bar@blah PRIVMSG me :\x01FINGER\x01')
+    assert type(event) is CTCPMessage
+    assert event.tag == 'FINGER'
+    assert event.data is None
+
+
+def test_decode_dcc_send():
+    event = decode(b':foo!bar@blah PRIVMSG me '
+                   b':\x01DCC SEND "my file.txt" 3232235777 5000 1024\x01')
+    assert isinstance(event, CTCPDCC)
+    assert event.type == 'SEND'
+    assert event.argument == 'my file.txt'
+    assert event.address == '192.168.1.1'
+    assert event.port == 5000
+    assert event.size == 1024
+    assert event.data == 'SEND "my file.txt" 3232235777 5000 1024'
+
+
+@pytest.mark.parametrize('address', [b'99999999999', b'example.org', b'10.0.1'],
+                         ids=['out_of_range', 'hostname', 'three_octets'])
+def test_decode_dcc_invalid_address(address):
+    conn = IRCClientConnection()
+    events = conn.feed_data(b':foo!bar@blah PRIVMSG me :\x01DCC SEND file ' + address +
+                            b' 5000\x01\r\n:foo!bar@blah PRIVMSG me :hello\r\n')
+    assert len(events) == 2
+    assert type(events[0]) is CTCPMessage
+    assert events[0].tag == 'DCC'
+    assert events[0].data == 'SEND file %s 5000' % address.decode('ascii')
+    assert events[1].message == 'hello'
+
+
+@pytest.mark.parametrize('value', [0, 3232235777, (1 << 32) - 1])
+def test_ipv4_roundtrip(value):
+    assert pack_ipv4(unpack_ipv4(value)) == value
+
+
+@pytest.mark.parametrize('value', [-1, 1 << 32])
+def test_unpack_ipv4_out_of_range(value):
+    pytest.raises(ProtocolError, unpack_ipv4, value)
+
+
+def test_mixed_message():
+    event = decode(b':foo!bar@blah PRIVMSG #channel :look \x01ACTION waves\x01')
+    assert isinstance(event, PrivateMessage)
+    assert event.text == 'look '
+    ctcp_messages = event.ctcp_messages
+    assert len(ctcp_messages) == 1
+    assert isinstance(ctcp_messages[0], CTCPAction)
+    assert ctcp_messages[0].data == 'waves'
+
+
+def test_reply():
+    event = CTCPPing('foo!bar@blah', 'me', '123').reply('123')
+    assert isinstance(event, CTCPMessage)
+    assert event.encode() == 'NOTICE foo :\x01PING 123\x01\r\n'
+
+
+def test_rate_limiter():
+    clock = FakeClock()
+    limiter = RateLimiter(interval=5, burst=2, max_senders=2, clock=clock)
+    assert limiter.allow('foo')
+    assert limiter.allow('foo')
+    assert not limiter.allow('foo')
+    clock.time += 5
+    assert limiter.allow('foo')
+    assert not limiter.allow('foo')
+
+
+def test_rate_limiter_max_senders():
+    limiter = RateLimiter(burst=1, max_senders=2, clock=FakeClock())
+    assert limiter.allow('foo')
+    assert limiter.allow('bar')
+    assert limiter.allow('baz')
+    assert limiter.allow('foo')  # forgotten since it was the least recently seen sender
+
+
+def test_auto_responder():
+    responder = CTCPResponder('ircproto test', RateLimiter(burst=1, clock=FakeClock()))
+    conn = IRCClientConnection(ctcp_responder=responder)
+    events = conn.feed_data(b':foo!bar@blah PRIVMSG me :\x01VERSION\x01\r\n' * 2)
+    assert len(events) == 2
+    assert conn.data_to_send() == b'NOTICE foo :\x01VERSION ircproto test\x01\r\n'
+
+
+def test_auto_responder_ignores_replies():
+    conn = IRCClientConnection(ctcp_responder=CTCPResponder())
+    conn.feed_data(b':foo!bar@blah NOTICE me :\x01VERSION other\x01\r\n')
+    assert conn.data_to_send() == b''
+
+
+def test_auto_responder_unsendable_data():
+    conn = IRCClientConnection(ctcp_responder=CTCPResponder())
+    events = conn.feed_data(b':evil!e@h PRIVMSG me :\x01PING a\x00b\x01\r\n'
+                            b':foo!bar@blah PRIVMSG me :\x01PING 123\x01\r\n')
+    assert len(events) == 2
+    assert conn.data_to_send() == b'NOTICE foo :\x01PING 123\x01\r\n'
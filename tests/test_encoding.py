@@ -0,0 +1,88 @@
+from __future__ import unicode_literals
+
+import codecs
+
+from ircproto.connection import IRCClientConnection
+from ircproto.encoding import EncodingCache, is_ascii
+
+utf8_decoder = codecs.getdecoder('utf-8')
+latin1_decoder = codecs.getdecoder('iso-8859-1')
+
+
+def test_is_ascii():
+    assert is_ascii(bytearray(b'PRIVMSG #channel :hello'))
+    assert not is_ascii(bytearray(b'PRIVMSG #channel :caf\xe9'))
+
+
+def test_ascii_fast_path():
+    cache = EncodingCache()
+    assert cache.decode(bytearray(b':foo!bar@blah PRIVMSG #channel :hello'), utf8_decoder,
+                        latin1_decoder) == ':foo!bar@blah PRIVMSG #channel :hello'
+    assert cache.stats == {'hits': 0, 'misses': 0, 'ascii_lines': 1, 'size': 0}
+
+
+def test_ascii_fast_path_incompatible_decoder():
+    cache = EncodingCache()
+    line = bytearray(':foo PRIVMSG #channel :hello'.encode('utf-16-le'))
+    assert cache.decode(line, codecs.getdecoder('utf-16-le'),
+                        latin1_decoder) == ':foo PRIVMSG #channel :hello'
+    assert cache.ascii_lines == 0
+
+
+def test_remembered_fallback():
+    def decoder(data):
+        calls.append(data)
+        return utf8_decoder(data)
+
+    calls = []
+    cache = EncodingCache(revalidate_interval=3)
+    line = bytearray(b':foo!bar@blah PRIVMSG #channel :caf\xe9')
+    for _ in range(3):
+        assert cache.decode(line, decoder, latin1_decoder).endswith('caf\xe9')
+
+    # Only the first line went through the input decoder
+    assert len(calls) == 1
+    assert cache.stats == {'hits': 2, 'misses': 1, 'ascii_lines': 0, 'size': 1}
+
+    # Other senders are unaffected
+    line2 = bytearray(b':baz!bar@blah PRIVMSG #channel :caf\xc3\xa9')
+    assert cache.decode(line2, decoder, latin1_decoder).endswith('caf\xe9')
+    assert len(calls) == 2
+
+
+def test_revalidate():
+    cache = EncodingCache(revalidate_interval=2)
+    line = bytearray(b':foo!bar@blah PRIVMSG #channel :caf\xe9')
+    for _ in range(2):
+        cache.decode(line, utf8_decoder, latin1_decoder)
+
+    # The input decoder is tried again on the third line, so the switch to UTF-8 is noticed
+    line = bytearray(b':foo!bar@blah PRIVMSG #channel :caf\xc3\xa9')
+    assert cache.decode(line, utf8_decoder, latin1_decoder).endswith('caf\xe9')
+    assert cache.stats == {'hits': 1, 'misses': 2, 'ascii_lines': 0, 'size': 0}
+    assert cache.decode(line, utf8_decoder, latin1_decoder).endswith('caf\xe9')
+    assert cache.misses == 3
+
+
+def test_max_size():
+    cache = EncodingCache(max_size=2)
+    for nickname in (b'a', b'b', b'a', b'c'):
+        cache.decode(bytearray(b':' + nickname + b' PRIVMSG #channel :\xe9'), utf8_decoder,
+                     latin1_decoder)
+
+    assert len(cache) == 2
+    assert cache.hits == 1
+    cache.decode(bytearray(b':b PRIVMSG #channel :\xe9'), utf8_decoder, latin1_decoder)
+    assert cache.misses == 4
+
+    cache.clear()
+    assert cache.stats == {'hits': 0, 'misses': 0, 'ascii_lines': 0, 'size': 0}
+
+
+def test_connection():
+    cache = EncodingCache()
+    conn = IRCClientConnection(encoding_cache=cache)
+    events = conn.feed_data(b':foo!bar@blah PRIVMSG #channel :caf\xe9\r\n'
+                            b':foo!bar@blah PRIVMSG #channel :na\xefve\r\n')
+    assert [event.message for event in events] == ['caf\xe9', 'na\xefve']
+    assert cache.hits == 1
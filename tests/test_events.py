@@ -2,14 +2,43 @@ import codecs
 
 import pytest
 
-from ircproto.events import decode_event
+from ircproto.events import Nick, OversizedMessage, decode_event, decode_raw_event
 from ircproto.exceptions import ProtocolError, UnknownCommand
 
 
 def test_decode_event_oversized():
-    buffer = bytearray(b':foo!bar@blah PRIVMSG hey' + b'y' * 600 + b'\r\n')
-    exc = pytest.raises(ProtocolError, decode_event, buffer)
-    assert str(exc.value) == 'IRC protocol violation: received oversized message (627 bytes)'
+    buffer = bytearray(b':foo!bar@blah PRIVMSG hey' + b'y' * 600 + b'\r\nPING foo\r\n')
+    event = decode_event(buffer)
+    assert isinstance(event, OversizedMessage)
+    assert event.length == 627
+    assert not event.tags_exceeded
+    assert buffer == bytearray(b'PING foo\r\n')
+
+
+def test_decode_event_lone_lf():
+    buffer = bytearray(b'PING foo\nPING bar\r\n')
+    assert decode_event(buffer).server1 == 'foo'
+    assert decode_event(buffer).server1 == 'bar'
+    assert buffer == bytearray()
+
+
+@pytest.mark.parametrize('decode', [decode_event, decode_raw_event], ids=['decoded', 'raw'])
+@pytest.mark.parametrize('data', [
+    b'\r\nPING foo\r\n',
+    b'\n\nPING foo\n',
+    b'\r\n\nPING foo\r\n'
+], ids=['crlf', 'lf', 'mixed'])
+def test_decode_event_blank_lines(decode, data):
+    buffer = bytearray(data)
+    assert decode(buffer).command == 'PING'
+    assert buffer == bytearray()
+
+
+@pytest.mark.parametrize('decode', [decode_event, decode_raw_event], ids=['decoded', 'raw'])
+def test_decode_event_only_blank_lines(decode):
+    buffer = bytearray(b'\r\n\n')
+    assert decode(buffer) is None
+    assert buffer == bytearray()
 
 
 def test_decode_event_unknown_command():
@@ -23,3 +52,132 @@ def test_decode_fallback_conversion():
     fallback_decoder = codecs.getdecoder('iso-8859-1')
     buffer = bytearray(b':foo!bar@blah PRIVMSG hey du\xe2\xa9k\r\n')
     assert decode_event(buffer, decoder=decoder, fallback_decoder=fallback_decoder)
+
+
+@pytest.mark.parametrize('line', [
+    b'USER guest 0 * :Real Name',
+    b'SERVICE dict * *.fr 0 * :French dictionary',
+    b'QUIT :Gone to lunch',
+    b'PART #channel :bye now',
+    b'CONNECT tolsun.oulu.fi 6667'
+], ids=['user', 'service', 'quit', 'part', 'connect'])
+def test_decode_encode_roundtrip(line):
+    event = decode_event(bytearray(line + b'\r\n'))
+    assert event.encode() == line.decode('ascii') + '\r\n'
+
+
+@pytest.mark.parametrize('line, command', [
+    (b'USER guest 0', 'USER'),
+    (b'SERVICE dict * *.fr', 'SERVICE')
+], ids=['user', 'service'])
+def test_decode_missing_params(line, command):
+    exc = pytest.raises(ProtocolError, decode_event, bytearray(line + b'\r\n'))
+    assert str(exc.value) == 'IRC protocol violation: wrong number of arguments for ' + command
+
+
+def test_reply_roundtrip():
+    buffer = bytearray(b':irc.example.org 001 foo :Welcome to the network\r\n')
+    event = decode_event(buffer)
+    assert event.code == 1
+    assert event.message == 'foo :Welcome to the network'
+    assert event.encode() == ':irc.example.org 001 foo :Welcome to the network\r\n'
+
+
+@pytest.mark.parametrize('line, fields', [
+    (b'332 foo #channel :the topic here',
+     {'channel': '#channel', 'topic': 'the topic here'}),
+    (b'331 foo #channel :No topic is set', {'channel': '#channel'}),
+    (b'353 foo = #channel :@op +voice nick',
+     {'channel_type': '=', 'channel': '#channel', 'nicks': ['@op', '+voice', 'nick']}),
+    (b'322 foo #channel 12 :topic', {'channel': '#channel', 'visible': 12, 'topic': 'topic'}),
+    (b'352 foo #channel ~user host irc.example.org nick H@ :3 Real Name',
+     {'channel': '#channel', 'user': '~user', 'host': 'host', 'server': 'irc.example.org',
+      'nick': 'nick', 'flags': 'H@', 'hop_count': 3, 'real_name': 'Real Name'}),
+    (b'900 foo nick!user@host account :You are now logged in as account',
+     {'nick': 'nick', 'user': 'user', 'host': 'host', 'account': 'account'}),
+    (b'999 foo bar', {})
+], ids=['topic', 'notopic', 'namreply', 'list', 'whoreply', 'loggedin', 'unknown'])
+def test_reply_fields(line, fields):
+    event = decode_event(bytearray(b':irc.example.org ' + line + b'\r\n'))
+    assert event.fields == fields
+    assert event.fields is event.fields
+
+
+def test_reply_field_shortcuts():
+    event = decode_event(bytearray(b':irc.example.org 353 foo @ #channel :@op nick\r\n'))
+    assert event.channel == '#channel'
+    assert event.nicks == ['@op', 'nick']
+    assert event.topic is None
+
+
+def test_decode_tags():
+    buffer = bytearray(b'@time=2017-01-01T00:00:00.000Z;msgid=a\\sb\\:c;+draft/flag '
+                       b':foo!bar@blah PRIVMSG #channel :hello\r\n')
+    event = decode_event(buffer)
+    assert event.message == 'hello'
+    assert event.get_tag('msgid') == 'a b;c'
+    assert event.get_tag('+draft/flag') == ''
+    assert event.get_tag('missing') is None
+    assert event.tags == {'time': '2017-01-01T00:00:00.000Z', 'msgid': 'a b;c',
+                          '+draft/flag': ''}
+
+
+def test_decode_tags_long():
+    # The tag section does not count towards the 512 byte limit
+    line = b'@msgid=' + b'x' * 4000 + b' PRIVMSG #channel :y' + b' y' * 240 + b'\r\n'
+    event = decode_event(bytearray(line))
+    assert len(event.get_tag('msgid')) == 4000
+    assert event.encode() == line.decode('ascii')
+
+
+def test_decode_tags_oversized():
+    buffer = bytearray(b'@msgid=' + b'x' * 8200 + b' PING foo\r\n')
+    event = decode_event(buffer)
+    assert isinstance(event, OversizedMessage)
+    assert event.length == 8208
+    assert event.tags_exceeded
+
+
+def test_encode_tags():
+    event = decode_event(bytearray(b'PING foo\r\n'))
+    event.tags['label'] = 'semi;colon space\\'
+    assert event.encode() == '@label=semi\\:colon\\sspace\\\\ PING foo\r\n'
+
+
+def test_decode_raw_event():
+    buffer = bytearray(b'@msgid=a\\sb :foo!bar@blah PRIVMSG #channel :hello\xff there\r\nPING')
+    event = decode_raw_event(buffer)
+    assert buffer == bytearray(b'PING')
+    assert event.line == b'@msgid=a\\sb :foo!bar@blah PRIVMSG #channel :hello\xff there'
+    assert event.command == 'PRIVMSG'
+    assert event.params == [b'#channel', b'hello\xff there']
+    assert event.get_tag('msgid') == 'a b'
+    assert event.decode_sender() == 'foo!bar@blah'
+    assert event.decode_param(1) == u'hello\xff there'
+    assert event.decode().message == u'hello\xff there'
+
+
+def test_decode_raw_event_unknown_command():
+    buffer = bytearray(b':foo!bar@blah FROBNICATE\r\n')
+    exc = pytest.raises(UnknownCommand, decode_raw_event, buffer)
+    assert str(exc.value) == 'IRC protocol violation: unknown command: FROBNICATE'
+
+
+@pytest.mark.parametrize('decode', [decode_event, decode_raw_event], ids=['decoded', 'raw'])
+@pytest.mark.parametrize('line', [b'@msgid=foo', b'@msgid=foo '], ids=['nospace', 'space'])
+def test_decode_tags_only(decode, line):
+    buffer = bytearray(line + b'\r\nPING foo\r\n')
+    exc = pytest.raises(ProtocolError, decode, buffer)
+    assert str(exc.value) == 'IRC protocol violation: received a message with only tags'
+    assert buffer == bytearray(b'PING foo\r\n')
+
+
+def test_process_reply():
+    event = Nick(None, 'x')
+    assert event.process_reply(433)
+
+    exc = pytest.raises(ProtocolError, event.process_reply, 332)
+    assert str(exc.value) == 'IRC protocol violation: reply code RPL_TOPIC is not allowed for NICK'
+
+    exc = pytest.raises(ProtocolError, event.process_reply, 999)
+    assert str(exc.value) == 'IRC protocol violation: 999 is not a known reply code'
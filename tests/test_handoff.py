@@ -0,0 +1,166 @@
+from __future__ import unicode_literals
+
+import socket
+
+import pytest
+
+from ircproto.connection import IRCServerConnection
+from ircproto.events import Join, PrivateMessage
+from ircproto.handoff import (
+    max_fds_per_message, receive_handoff, send_handoff, send_message)
+from ircproto.states import IRCServer
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX') or
+                                not hasattr(socket.socket, 'sendmsg'),
+                                reason='file descriptor passing is not supported')
+
+
+@pytest.fixture
+def channel():
+    sockets = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    yield sockets
+    for sock in sockets:
+        sock.close()
+
+
+@pytest.fixture
+def listener():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(5)
+    yield sock
+    sock.close()
+
+
+def connect(listener):
+    client = socket.create_connection(listener.getsockname())
+    server_side = listener.accept()[0]
+    return client, server_side
+
+
+def test_handoff(channel, listener):
+    server = IRCServer('irc.example.org')
+    sockets = []
+    pairs = []
+    for nickname in ('alice', 'bob', None):
+        client, server_side = connect(listener)
+        sockets += [client, server_side]
+        connection = IRCServerConnection('%s.example.org' % nickname, server)
+        if nickname:
+            connection.nickname = nickname
+            connection.username = '~' + nickname
+            server.add_client_connection(connection)
+            server.handle_join(connection, Join(None, '#chan'))
+
+        pairs.append((server_side, connection))
+
+    alice = pairs[0][1]
+    alice.data_to_send()
+    alice.feed_data(b'PRIVMSG #chan :hel')
+    alice.send_event(PrivateMessage('irc.example.org', 'alice', 'pending'))
+
+    restored = IRCServer('irc.example.org')
+    try:
+        send_handoff(channel[0], server, [listener], pairs)
+        listeners, connections = receive_handoff(channel[1], restored)
+        sockets += listeners + [sock for sock, _ in connections]
+
+        assert len(listeners) == 1
+        assert listeners[0].getsockname() == listener.getsockname()
+        assert [conn.nickname for _, conn in connections] == ['alice', 'bob', None]
+        assert sorted(restored.nicknames) == ['alice', 'bob']
+        assert sorted(conn.nickname for conn in restored.channels['#chan'].users) == \
+            ['alice', 'bob']
+
+        # The handed over sockets are connected to the same clients
+        for (old_sock, _), (new_sock, _) in zip(pairs, connections):
+            assert new_sock.getpeername() == old_sock.getpeername()
+
+        sockets[0].sendall(b'hello')
+        assert connections[0][0].recv(5) == b'hello'
+
+        # Buffered input and output survive the handoff
+        new_alice = connections[0][1]
+        assert new_alice.data_to_send() == b':irc.example.org PRIVMSG alice pending\r\n'
+        events = new_alice.feed_data(b'lo\r\n')
+        assert len(events) == 1
+        assert events[0].message == 'hello'
+    finally:
+        for sock in sockets:
+            sock.close()
+
+
+def test_handoff_without_snapshot(channel, listener):
+    server = IRCServer('irc.example.org')
+    client, server_side = connect(listener)
+    connection = IRCServerConnection('alice.example.org', server)
+    connection.nickname = 'alice'
+    connection.username = '~alice'
+    server.add_client_connection(connection)
+    server.handle_join(connection, Join(None, '#chan'))
+
+    restored = IRCServer('irc.example.org')
+    connections = []
+    try:
+        send_handoff(channel[0], server, [], [(server_side, connection)],
+                     include_snapshot=False)
+        listeners, connections = receive_handoff(channel[1], restored)
+        assert listeners == []
+        assert list(restored.nicknames) == ['alice']
+        assert restored.channels == {}
+    finally:
+        for sock in [client, server_side] + [sock for sock, _ in connections]:
+            sock.close()
+
+
+def test_handoff_many_sockets(channel):
+    server = IRCServer('irc.example.org')
+    pairs = []
+    for _ in range(max_fds_per_message + 10):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        pairs.append((sock, IRCServerConnection('localhost', server)))
+
+    try:
+        send_handoff(channel[0], server, [], pairs)
+        listeners, connections = receive_handoff(channel[1], IRCServer('irc.example.org'))
+        assert len(connections) == len(pairs)
+        for sock, _ in connections:
+            sock.close()
+    finally:
+        for sock, _ in pairs:
+            sock.close()
+
+
+@pytest.mark.parametrize('family, address', [
+    (socket.AF_INET, ('127.0.0.1', 0)),
+    (getattr(socket, 'AF_INET6', None), ('::1', 0)),
+    (getattr(socket, 'AF_UNIX', None), '')
+], ids=['ipv4', 'ipv6', 'unix'])
+def test_handoff_socket_family(channel, family, address):
+    if family is None or (family == socket.AF_INET6 and not socket.has_ipv6):
+        pytest.skip('the address family is not supported')
+
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    listeners = []
+    try:
+        sock.bind(address)
+        sock.listen(5)
+        send_handoff(channel[0], IRCServer('irc.example.org'), [sock], [])
+        listeners = receive_handoff(channel[1], IRCServer('irc.example.org'))[0]
+        assert listeners[0].family == family
+        assert listeners[0].type == socket.SOCK_STREAM
+        assert listeners[0].getsockname() == sock.getsockname()
+    finally:
+        for sock in [sock] + listeners:
+            sock.close()
+
+
+def test_handoff_version_mismatch(channel):
+    send_message(channel[0], [99, None, 0, 0])
+    pytest.raises(ValueError, receive_handoff, channel[1], IRCServer('irc.example.org'))
+
+
+def test_handoff_channel_closed(channel):
+    channel[0].sendall(b'\x00\x00')
+    channel[0].close()
+    pytest.raises(EOFError, receive_handoff, channel[1], IRCServer('irc.example.org'))
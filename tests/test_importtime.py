@@ -0,0 +1,50 @@
+from __future__ import unicode_literals
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 8),
+                                reason='requires -X importtime and PYTHONPYCACHEPREFIX')
+
+#: maximum cumulative import time of ircproto.connection, in microseconds
+import_budget = 50000
+
+#: standard library modules that are slow to import and only needed for optional features
+deferred_modules = ('socket', 'hashlib', 'ircproto.sasl')
+
+
+def measure_imports(module, cache_dir):
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=str(cache_dir))
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module], env=env,
+        stderr=subprocess.STDOUT, universal_newlines=True)
+    times = {}
+    for line in output.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line[12:].split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+
+    return times
+
+
+@pytest.fixture(scope='module')
+def import_times(tmpdir_factory):
+    # The first run compiles the modules; the fastest of the following runs is used
+    cache_dir = tmpdir_factory.mktemp('pycache')
+    measure_imports('ircproto.connection', cache_dir)
+    runs = [measure_imports('ircproto.connection', cache_dir) for _ in range(3)]
+    return min(runs, key=lambda times: times['ircproto.connection'])
+
+
+@pytest.mark.parametrize('module', deferred_modules)
+def test_deferred_imports(import_times, module):
+    assert module not in import_times
+
+
+def test_import_budget(import_times):
+    assert import_times['ircproto.connection'] < import_budget
@@ -0,0 +1,100 @@
+from __future__ import unicode_literals
+
+import pytest
+
+from ircproto.connection import IRCClientConnection
+from ircproto.exceptions import ProtocolError
+from ircproto.isupport import ServerSupport
+from ircproto.tracker import StateTracker
+
+
+def test_defaults():
+    isupport = ServerSupport()
+    isupport.validate_nickname('ninechars')
+    pytest.raises(ProtocolError, isupport.validate_nickname, 'tenletters')
+    isupport.validate_channel_name('!channel')
+    assert isupport.prefix_modes == {'@': 'o', '+': 'v'}
+
+
+def test_update():
+    isupport = ServerSupport()
+    isupport.update(['NICKLEN=30', 'CHANTYPES=#', 'CASEMAPPING=ascii', 'PREFIX=(qaohv)~&@%+',
+                     'CHANMODES=beI,k,l,imnpst', 'MODES=4', 'LINELEN=1024',
+                     'NETWORK=Example\\x20Net', 'EXCEPTS'])
+    isupport.validate_nickname('a_rather_long_nickname')
+    pytest.raises(ProtocolError, isupport.validate_channel_name, '&local')
+    assert isupport.is_channel('#channel')
+    assert not isupport.is_channel('&local')
+    assert isupport.casefold('Nick[]') == 'nick[]'
+    assert isupport.prefix_modes['%'] == 'h'
+    assert isupport.modes == 4
+    assert isupport.linelen == 1024
+    assert isupport.tokens['NETWORK'] == 'Example Net'
+    assert isupport.tokens['EXCEPTS'] is True
+
+    isupport.update(['-EXCEPTS', 'MODES'])
+    assert 'EXCEPTS' not in isupport.tokens
+    assert isupport.modes is None
+
+
+def test_update_negated():
+    isupport = ServerSupport()
+    isupport.update(['NICKLEN=30', 'CHANTYPES=#', 'CHANNELLEN=10', 'CASEMAPPING=ascii',
+                     'PREFIX=(qaohv)~&@%+', 'CHANMODES=beI,k,l,imnpst', 'MODES=4',
+                     'LINELEN=1024'])
+    isupport.update(['-NICKLEN', '-CHANTYPES', '-CHANNELLEN', '-CASEMAPPING', '-PREFIX',
+                     '-CHANMODES', '-MODES', '-LINELEN'])
+    assert isupport.tokens == {}
+    assert (isupport.nicklen, isupport.chantypes, isupport.channellen, isupport.casemapping,
+            isupport.prefix, isupport.chanmodes, isupport.modes, isupport.linelen) == \
+        (9, '#&+!', 50, 'rfc1459', '(ov)@+', 'beI,k,l,aimnqpsrt', 3, 512)
+    pytest.raises(ProtocolError, isupport.validate_nickname, 'tenletters')
+    isupport.validate_channel_name('&channel')
+
+
+@pytest.mark.parametrize('token', [
+    'NICKLEN=abc', 'NICKLEN=0', 'NICKLEN', 'CHANNELLEN=1', 'CHANNELLEN=-5', 'MODES=x',
+    'LINELEN=100'
+])
+def test_update_invalid_limit(token):
+    isupport = ServerSupport()
+    isupport.update([token])
+    assert (isupport.nicklen, isupport.channellen, isupport.modes, isupport.linelen) == \
+        (9, 50, 3, 512)
+    isupport.validate_nickname('ninechars')
+    pytest.raises(ProtocolError, isupport.validate_nickname, 'tenletters')
+    isupport.validate_channel_name('#channel')
+
+
+def test_client_connection_invalid_limit():
+    conn = IRCClientConnection()
+    conn.feed_data(b':irc.example.org 005 me NICKLEN=abc CHANNELLEN=1 MODES=x '
+                   b':are supported by this server\r\n')
+    assert conn.isupport.tokens['NICKLEN'] == 'abc'
+    assert conn.isupport.nicklen == 9
+
+
+def test_client_connection():
+    tracker = StateTracker()
+    conn = IRCClientConnection(tracker=tracker)
+    conn.feed_data(b':irc.example.org 005 me CASEMAPPING=ascii PREFIX=(ov)@+ LINELEN=1024 '
+                   b':are supported by this server\r\n')
+    assert conn.isupport.casemapping == 'ascii'
+    assert tracker.casemapping == 'ascii'
+    assert tracker.prefix_modes == {'@': 'o', '+': 'v'}
+
+    # Lines longer than 512 bytes are now accepted
+    events = conn.feed_data(b':foo!bar@blah PRIVMSG #channel :' + b'x' * 900 + b'\r\n')
+    assert len(events[0].message) == 900
+
+
+def test_client_connection_negated():
+    tracker = StateTracker()
+    conn = IRCClientConnection(tracker=tracker)
+    conn.feed_data(b':irc.example.org 005 me CASEMAPPING=ascii PREFIX=(qov)~@+ LINELEN=1024 '
+                   b':are supported by this server\r\n'
+                   b':irc.example.org 005 me -CASEMAPPING -PREFIX -LINELEN '
+                   b':are supported by this server\r\n')
+    assert conn.max_line_length == 512
+    assert tracker.casemapping == 'rfc1459'
+    assert tracker.prefix_modes == {'@': 'o', '+': 'v'}
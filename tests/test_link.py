@@ -0,0 +1,258 @@
+from __future__ import unicode_literals
+
+import pytest
+
+from ircproto.connection import IRCServerConnection
+from ircproto.events import Join, Mode, SJoin, decode_event
+from ircproto.exceptions import ProtocolError
+from ircproto.link import RemoteClient, ServerLink, pack_sjoin
+from ircproto.modes import mode_bits
+from ircproto.states import IRCServer
+
+op_bit = mode_bits['o']
+
+
+def make_client(server, nickname):
+    connection = IRCServerConnection('%s.example.org' % nickname, server)
+    connection.nickname = nickname
+    connection.username = '~' + nickname
+    server.add_client_connection(connection)
+    return connection
+
+
+def make_link(server, name, compress=False):
+    link = ServerLink(server, name, compress)
+    link.attach(IRCServerConnection(name, server))
+    return link
+
+
+def exchange(link1, link2):
+    while True:
+        data1, data2 = link1.data_to_send(), link2.data_to_send()
+        if not data1 and not data2:
+            break
+
+        link2.feed_data(data1)
+        link1.feed_data(data2)
+
+
+@pytest.fixture
+def servers():
+    server1 = IRCServer('irc1.example.org')
+    server2 = IRCServer('irc2.example.org')
+    alice = make_client(server1, 'alice')
+    bob = make_client(server2, 'bob')
+    server1.handle_join(alice, Join(None, '#chan'))
+    server1.handle_mode(alice, Mode(None, '#chan', '+kb', 'secret', '*!*@spam.org'))
+    server2.handle_join(bob, Join(None, '#chan'))
+    server2.handle_mode(bob, Mode(None, '#chan', '+m'))
+    server2.handle_join(bob, Join(None, '#other'))
+    alice.data_to_send()
+    bob.data_to_send()
+    return server1, server2
+
+
+def test_sjoin_encode_decode():
+    event = SJoin('irc.example.org', '1234', '#chan', '+ntk', 'secret', '@alice +bob carol')
+    line = event.encode()
+    assert line == ':irc.example.org SJOIN 1234 #chan +ntk secret :@alice +bob carol\r\n'
+    decoded = decode_event(bytearray(line.encode('utf-8')))
+    assert decoded.modeparams == ('secret',)
+    assert decoded.members == '@alice +bob carol'
+
+
+def test_pack_sjoin():
+    server = IRCServer('irc.example.org')
+    channel = None
+    for i in range(200):
+        connection = make_client(server, 'user%03d' % i)
+        server.handle_join(connection, Join(None, '#big'))
+        channel = server.channels['#big']
+
+    channel.modes |= mode_bits['k']
+    channel.key = 'secret'
+    events = pack_sjoin(server, channel)
+    assert len(events) > 1
+    members = []
+    for event in events:
+        assert len(event.encode().encode('utf-8')) <= 512
+        assert event.modes == '+knt'
+        assert event.modeparams == ('secret',)
+        members.extend(event.members.split())
+
+    assert members[0] == '@user000'
+    assert sorted(members[1:]) == ['user%03d' % i for i in range(1, 200)]
+
+
+@pytest.mark.parametrize('compress', [False, True], ids=['plain', 'zlib'])
+def test_burst(servers, compress):
+    server1, server2 = servers
+    server1.channels['#chan'].ts = 100
+    server2.channels['#chan'].ts = 200
+    link1 = make_link(server1, 'irc2.example.org', compress)
+    link2 = make_link(server2, 'irc1.example.org', compress)
+    link1.burst()
+    link2.burst()
+    data = link1.data_to_send()
+    assert (b'SJOIN' not in data) == compress
+    link2.feed_data(data)
+    exchange(link1, link2)
+
+    # The channel on server1 is older, so bob loses his operator status and +m is removed
+    for server in servers:
+        channel = server.channels['#chan']
+        assert channel.ts == 100
+        assert channel.member_modes == {'alice': op_bit, 'bob': 0}
+        assert channel.key == 'secret'
+        assert not channel.has_mode('m')
+        assert channel.bans == ['*!*@spam.org']
+        assert sorted(conn.nickname for conn in channel.users) == ['alice', 'bob']
+
+    assert isinstance(server1.nicknames['bob'], RemoteClient)
+    assert server1.nicknames['bob'].prefix == 'bob!~bob@bob.example.org'
+    assert server1.channels['#other'].member_modes == {'bob': op_bit}
+
+    # The local clients were told about the merge
+    alice_data = server1.nicknames['alice'].data_to_send()
+    assert b':bob!~bob@bob.example.org JOIN #chan\r\n' in alice_data
+    bob_data = server2.nicknames['bob'].data_to_send()
+    assert b':alice!~alice@alice.example.org JOIN #chan\r\n' in bob_data
+    assert b':irc1.example.org MODE #chan -mo+ko bob secret alice\r\n' in bob_data
+
+
+def test_burst_equal_timestamps(servers):
+    server1, server2 = servers
+    server1.channels['#chan'].ts = server2.channels['#chan'].ts = 100
+    link1 = make_link(server1, 'irc2.example.org')
+    link2 = make_link(server2, 'irc1.example.org')
+    link1.burst()
+    link2.burst()
+    exchange(link1, link2)
+    for server in servers:
+        channel = server.channels['#chan']
+        assert channel.member_modes == {'alice': op_bit, 'bob': op_bit}
+        assert channel.has_mode('m')
+        assert channel.key == 'secret'
+
+
+def test_incremental_resync(servers):
+    server1, server2 = servers
+    link1 = make_link(server1, 'irc2.example.org')
+    link2 = make_link(server2, 'irc1.example.org')
+    link1.burst()
+    link2.burst()
+    exchange(link1, link2)
+
+    # Split the link and make a change on one side
+    link1.detach()
+    link2.detach()
+    assert server1.servers == []
+    carol = make_client(server1, 'carol')
+    server1.handle_join(carol, Join(None, '#new'))
+
+    link1.attach(IRCServerConnection('irc2.example.org', server1))
+    link2.attach(IRCServerConnection('irc1.example.org', server2))
+    assert link1.burst() == 2
+    assert link2.burst() == 0
+    exchange(link1, link2)
+    assert server2.channels['#new'].member_modes == {'carol': op_bit}
+    assert sorted(server2.nicknames) == ['alice', 'bob', 'carol']
+
+    # After a reset, everything is sent again
+    link1.reset()
+    assert link1.burst() == 6
+
+
+def test_live_join(servers):
+    server1, server2 = servers
+    link1 = make_link(server1, 'irc2.example.org')
+    link2 = make_link(server2, 'irc1.example.org')
+    link1.burst()
+    link2.burst()
+    exchange(link1, link2)
+
+    carol = make_client(server1, 'carol')
+    server1.handle_join(carol, Join(None, '#other'))
+    server1.handle_join(carol, Join(None, '#fresh'))
+    exchange(link1, link2)
+    assert sorted(server2.nicknames) == ['alice', 'bob', 'carol']
+    assert server2.channels['#other'].member_modes == {'bob': op_bit, 'carol': 0}
+    assert server2.channels['#fresh'].member_modes == {'carol': op_bit}
+
+    # Carol was introduced as she registered, so she is not introduced again after a split
+    link1.detach()
+    link1.detach()
+    link1.attach(IRCServerConnection('irc2.example.org', server1))
+    assert link1.burst() == 0
+
+
+def test_register_before_burst(servers):
+    server1, server2 = servers
+    link1 = make_link(server1, 'irc2.example.org')
+    make_client(server1, 'carol')
+    assert link1.burst() == 4
+    assert link1.data_to_send().count(b' NICK carol ') == 1
+
+
+def test_nickname_collision(servers):
+    server1, server2 = servers
+    dup1 = make_client(server1, 'dup')
+    make_client(server2, 'dup')
+    server2.handle_join(server2.nicknames['dup'], Join(None, '#secret'))
+    link1 = make_link(server1, 'irc2.example.org')
+    link2 = make_link(server2, 'irc1.example.org')
+    link1.burst()
+    link2.burst()
+    link2.feed_data(link1.data_to_send())
+    data = link2.data_to_send()
+    assert b'KILL dup :Nickname collision' in data
+    link1.feed_data(data)
+    exchange(link1, link2)
+
+    # Both servers keep their own client and the other one's is not made a channel member
+    assert server1.nicknames['dup'] is dup1
+    assert server1.channels['#secret'].member_modes == {}
+    assert dup1.data_to_send() == b''
+    assert not isinstance(server2.nicknames['dup'], RemoteClient)
+
+
+def test_relay(servers):
+    server1, server2 = servers
+    server3 = IRCServer('irc3.example.org')
+    link12 = make_link(server1, 'irc2.example.org')
+    link21 = make_link(server2, 'irc1.example.org')
+    link23 = make_link(server2, 'irc3.example.org')
+    link32 = make_link(server3, 'irc2.example.org')
+    for link in (link12, link21, link23, link32):
+        link.burst()
+
+    exchange(link12, link21)
+    exchange(link23, link32)
+    assert sorted(server3.nicknames) == ['alice', 'bob']
+    assert server3.nicknames['alice'].hopcount == 2
+
+    carol = make_client(server1, 'carol')
+    server1.handle_join(carol, Join(None, '#chan'))
+    server1.handle_join(carol, Join(None, '#fresh'))
+    exchange(link12, link21)
+    exchange(link23, link32)
+    assert server3.nicknames['carol'].hopcount == 2
+    for server in servers:
+        assert server3.channels['#chan'].member_modes == server.channels['#chan'].member_modes
+
+    assert server3.channels['#chan'].member_modes['carol'] == 0
+    assert server3.channels['#fresh'].member_modes == {'carol': op_bit}
+
+
+def test_invalid_sjoin_timestamp(servers):
+    server1, server2 = servers
+    link = make_link(server1, 'irc2.example.org')
+    exc = pytest.raises(ProtocolError, link.feed_data,
+                        b':irc2.example.org SJOIN x #chan + bob\r\n')
+    assert str(exc.value) == 'IRC protocol violation: invalid channel timestamp: x'
+
+
+def test_invalid_compressed_data(servers):
+    server1, server2 = servers
+    link = make_link(server1, 'irc2.example.org', compress=True)
+    pytest.raises(ProtocolError, link.feed_data, b'not compressed')
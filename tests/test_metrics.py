@@ -0,0 +1,72 @@
+import pytest
+
+from ircproto.connection import IRCClientConnection, IRCServerConnection
+from ircproto.events import Join, Reply
+from ircproto.exceptions import ProtocolError
+from ircproto.metrics import Histogram, Metrics, event_label, null_metrics
+from ircproto.states import IRCServer
+
+
+def test_null_metrics_by_default():
+    assert IRCClientConnection().metrics is null_metrics
+    assert not null_metrics.enabled
+
+
+@pytest.mark.parametrize('event, expected', [
+    (Join(None, '#chan'), 'JOIN'),
+    (Reply('server', 1, 'foo :Welcome'), '001')
+], ids=['command', 'reply'])
+def test_event_label(event, expected):
+    assert event_label(event) == expected
+
+
+def test_histogram():
+    histogram = Histogram((1, 10))
+    for value in (0.5, 1, 5, 100):
+        histogram.observe(value)
+
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.count == 4
+    assert histogram.sum == 106.5
+
+
+def test_connection_metrics():
+    metrics = Metrics()
+    conn = IRCClientConnection(metrics=metrics)
+    conn.feed_data(b'PING foo\r\n:server PRIVMSG bar :hello\r\nPING baz\r\n')
+    assert metrics.decoded == {'PING': 2, 'PRIVMSG': 1}
+    assert metrics.encoded == {'PONG': 2}
+    assert metrics.decode_times['PING'].count == 2
+    assert metrics.bytes_in == 48
+    assert metrics.bytes_out == 20
+    assert metrics.output_high_water == 20
+
+    conn.data_to_send()
+    pytest.raises(ProtocolError, conn.feed_data, b'FROBNICATE\r\n')
+    assert metrics.errors == {'UnknownCommand': 1}
+
+
+def test_server_metrics_shared():
+    metrics = Metrics()
+    server = IRCServer('irc.example.org', metrics=metrics)
+    conn = IRCServerConnection('host.example.org', server)
+    conn.nickname, conn.username = 'foo', 'bar'
+    server.add_client_connection(conn)
+    server.handle_join(conn, Join(None, '#chan'))
+    assert conn.metrics is metrics
+    assert metrics.encoded == {'JOIN': 1}
+    assert metrics.gauges == {'channels': 1, 'clients': 1}
+
+
+def test_snapshot():
+    metrics = Metrics(buckets=(0.1,))
+    metrics.event_decoded(Join(None, '#chan'), 0.05)
+    metrics.protocol_error(ProtocolError('foo'))
+    metrics.gauge('channels', 3)
+    snapshot = metrics.snapshot()
+    assert 'ircproto_events_decoded_total{command="JOIN"} 1\n' in snapshot
+    assert 'ircproto_decode_seconds_bucket{command="JOIN",le="0.1"} 1\n' in snapshot
+    assert 'ircproto_decode_seconds_bucket{command="JOIN",le="+Inf"} 1\n' in snapshot
+    assert 'ircproto_decode_seconds_count{command="JOIN"} 1\n' in snapshot
+    assert 'ircproto_protocol_errors_total{type="ProtocolError"} 1\n' in snapshot
+    assert '# TYPE ircproto_channels gauge\nircproto_channels 3\n' in snapshot
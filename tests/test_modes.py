@@ -0,0 +1,131 @@
+from __future__ import unicode_literals
+
+import pytest
+
+from ircproto.connection import IRCServerConnection
+from ircproto.events import Join, Mode
+from ircproto.exceptions import ProtocolError
+from ircproto.modes import ModeChange, ModeTable, flags_to_modes, mode_flags
+from ircproto.states import IRCChannel, IRCServer
+
+
+@pytest.fixture
+def table():
+    return ModeTable('beI,k,l,imnpst', '(ov)@+')
+
+
+def test_parse(table):
+    changes = table.parse('+o-v+bl-k', ['alice', 'bob', '*!*@spam', '10', '*'])
+    assert changes == [ModeChange(True, 'o', 'alice'), ModeChange(False, 'v', 'bob'),
+                       ModeChange(True, 'b', '*!*@spam'), ModeChange(True, 'l', '10'),
+                       ModeChange(False, 'k', '*')]
+
+
+def test_parse_unset_limit(table):
+    assert table.parse('-l+n') == [ModeChange(False, 'l', None), ModeChange(True, 'n', None)]
+
+
+def test_parse_missing_param(table):
+    exc = pytest.raises(ProtocolError, table.parse, '+o')
+    assert str(exc.value) == 'IRC protocol violation: missing parameter for mode +o'
+
+
+def test_parse_lenient(table):
+    changes = table.parse('+o!lk-b', ['alice'], strict=False)
+    assert changes == [ModeChange(True, 'o', 'alice'), ModeChange(False, 'b', None)]
+
+
+def test_apply(table):
+    channel = IRCChannel('#chan', 'nt')
+    channel.member_modes['alice'] = 0
+    changes = table.parse('+oois-tn+bk', ['alice', 'nobody', '*!*@spam', 'secret'])
+    applied = table.apply(channel, changes)
+    assert applied == [ModeChange(True, 'o', 'alice'), ModeChange(True, 'i', None),
+                       ModeChange(True, 's', None), ModeChange(False, 't', None),
+                       ModeChange(False, 'n', None), ModeChange(True, 'b', '*!*@spam'),
+                       ModeChange(True, 'k', 'secret')]
+    assert flags_to_modes(channel.modes) == 'iks'
+    assert channel.key == 'secret'
+    assert channel.bans == ['*!*@spam']
+    assert channel.is_operator('alice')
+
+    # Applying the same changes again changes nothing
+    assert table.apply(channel, changes) == []
+
+
+@pytest.mark.parametrize('param', [None, 'abc'], ids=['missing', 'invalid'])
+def test_apply_invalid_limit(table, param):
+    channel = IRCChannel('#chan', 'nt')
+    assert table.apply(channel, [ModeChange(True, 'l', param)]) == []
+    assert not channel.has_mode('l')
+
+
+def test_coalesce(table):
+    changes = [ModeChange(True, 'o', nick) for nick in ('a', 'b', 'c', 'd')]
+    changes += [ModeChange(True, 'n', None), ModeChange(False, 'b', '*!*@x')]
+    events = table.coalesce('#chan', changes, max_params=3)
+    assert [event.encode() for event in events] == ['MODE #chan +ooo a b c\r\n',
+                                                    'MODE #chan +on-b d *!*@x\r\n']
+
+
+def test_coalesce_line_length(table):
+    changes = [ModeChange(True, 'b', '*!*@' + 'x' * 100 + str(i)) for i in range(10)]
+    events = table.coalesce('#chan', changes, max_params=None, max_line_length=512)
+    assert len(events) == 3
+    assert all(len(event.encode()) <= 512 for event in events)
+
+
+def test_mode_flags():
+    assert flags_to_modes(mode_flags('tnZ')) == 'ntZ'
+
+
+def make_client(server, nickname):
+    connection = IRCServerConnection('%s.example.org' % nickname, server)
+    connection.nickname = nickname
+    connection.username = nickname
+    server.add_client_connection(connection)
+    return connection
+
+
+def test_server_handle_mode():
+    server = IRCServer('irc.example.org')
+    alice = make_client(server, 'alice')
+    bob = make_client(server, 'bob')
+    server.handle_join(alice, Join(None, '#chan'))
+    server.handle_join(bob, Join(None, '#chan'))
+    alice.data_to_send()
+    bob.data_to_send()
+
+    server.handle_mode(bob, Mode(None, '#chan', '+i'))
+    assert bob.data_to_send() == (b':irc.example.org 482 bob #chan '
+                                  b':You\'re not channel operator\r\n')
+
+    server.handle_mode(alice, Mode(None, '#chan', '+ovn', 'bob', 'bob'))
+    assert bob.data_to_send() == b':alice!alice@alice.example.org MODE #chan +ov bob bob\r\n'
+    assert server.channels['#chan'].is_operator('bob')
+
+
+def test_server_limit_without_param():
+    server = IRCServer('irc.example.org')
+    alice = make_client(server, 'alice')
+    server.handle_join(alice, Join(None, '#chan'))
+    alice.data_to_send()
+
+    server.handle_mode(alice, Mode(None, '#chan', '+l'))
+    assert alice.data_to_send() == b''
+    assert not server.channels['#chan'].has_mode('l')
+
+
+def test_server_ban_exception():
+    server = IRCServer('irc.example.org')
+    alice = make_client(server, 'alice')
+    bob = make_client(server, 'bob')
+    server.handle_join(alice, Join(None, '#chan'))
+    server.handle_mode(alice, Mode(None, '#chan', '+b', '*!*@*.example.org'))
+    server.handle_join(bob, Join(None, '#chan'))
+    assert bob.data_to_send() == (b':irc.example.org 474 bob #chan '
+                                  b':Cannot join channel (+b)\r\n')
+
+    server.handle_mode(alice, Mode(None, '#chan', '+e', 'bob!*@*'))
+    server.handle_join(bob, Join(None, '#chan'))
+    assert bob in server.channels['#chan'].users
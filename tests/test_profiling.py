@@ -0,0 +1,105 @@
+import time
+
+from ircproto.connection import IRCClientConnection, IRCServerConnection
+from ircproto.constants import RPL_TOPIC
+from ircproto.events import Join, PrivateMessage, Reply
+from ircproto.profiling import CommandProfiler, event_channel, event_command
+from ircproto.states import IRCServer
+
+
+class SamplingConnection(IRCClientConnection):
+    def handle_event(self, event):
+        self.profiler.sample()
+        super(SamplingConnection, self).handle_event(event)
+
+
+def test_event_command_and_channel():
+    assert event_command(Join(None, '#chan')) == 'JOIN'
+    assert event_command(Reply(None, 332, 'foo #chan :topic')) == 'RPL_TOPIC'
+    assert event_channel(Join(None, '#chan')) == '#chan'
+    assert event_channel(PrivateMessage(None, '#chan', 'hi')) == '#chan'
+    assert event_channel(PrivateMessage(None, 'nick', 'hi')) is None
+
+
+def test_decode_samples_attributed_to_event():
+    profiler = CommandProfiler()
+    conn = IRCClientConnection(profiler=profiler)
+    conn.nickname = 'me'
+    profiler.tag_decoding(conn)
+    profiler.sample()
+    profiler.decoded(conn, PrivateMessage('foo', '#big', 'hello'))
+    profiler.restore(None)
+    assert profiler.by_command() == {'PRIVMSG': 1}
+    assert profiler.by_channel() == {'#big': 1}
+    assert profiler.by_connection() == {'me': 1}
+
+
+def test_connection_tags_events():
+    profiler = CommandProfiler()
+    conn = SamplingConnection(profiler=profiler)
+    conn.feed_data(b':foo PRIVMSG #big :hello\r\nPING server\r\n')
+    assert profiler.by_command() == {'PRIVMSG': 1, 'PING': 1}
+    assert profiler.by_channel() == {'#big': 1, None: 1}
+    assert not profiler._tags
+
+
+def test_send_reply_tagged():
+    profiler = CommandProfiler()
+    server = IRCServer('irc.example.org', profiler=profiler)
+    conn = IRCServerConnection('host.example.org', server)
+    with profiler.profile(conn, command='outer'):
+        conn.send_reply(RPL_TOPIC, channel='#chan', topic='foo')
+        profiler.sample()
+
+    assert profiler.by_command() == {'outer': 1}
+
+
+def test_folded():
+    profiler = CommandProfiler()
+    conn = IRCClientConnection(profiler=profiler)
+    conn.nickname = 'me'
+    with profiler.profile(conn, PrivateMessage(None, '#big', 'hello')):
+        profiler.sample()
+
+    with profiler.profile(conn, command='PING'):
+        profiler.sample()
+
+    lines = profiler.folded()
+    assert len(lines) == 2
+    assert lines[0].startswith('me;PING;')
+    assert lines[1].startswith('me;PRIVMSG;#big;')
+    assert lines[1].endswith('test_folded (test_profiling.py:%d);sample (profiling.py:%d) 1' % (
+        test_folded.__code__.co_firstlineno, CommandProfiler.sample.__code__.co_firstlineno))
+
+
+def test_background_sampling():
+    profiler = CommandProfiler(interval=0.001)
+    conn = IRCClientConnection(profiler=profiler)
+    profiler.start()
+    try:
+        with profiler.profile(conn, command='BUSY'):
+            deadline = time.time() + 0.2
+            while time.time() < deadline and not profiler.samples:
+                pass
+    finally:
+        profiler.stop()
+
+    assert 'BUSY' in profiler.by_command()
+
+
+def test_read_while_sampling():
+    profiler = CommandProfiler(interval=0.0001)
+    conn = IRCClientConnection(profiler=profiler)
+    profiler.start()
+    try:
+        deadline = time.time() + 0.2
+        i = 0
+        while time.time() < deadline:
+            i += 1
+            with profiler.profile(conn, command='BUSY', channel='#chan%d' % i):
+                profiler.folded()
+                profiler.by_channel()
+    finally:
+        profiler.stop()
+
+    assert any(';BUSY;' in line for line in profiler.folded())
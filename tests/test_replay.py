@@ -0,0 +1,70 @@
+import pytest
+
+from ircproto.connection import IRCServerConnection
+from ircproto.replay import (
+    ReplayStats, chunked, main, map_capture, netsplit_burst, privmsg_storm, read_log, replay)
+from ircproto.states import IRCServer
+
+
+@pytest.mark.parametrize('source', [
+    b'abcdefghij',
+    [b'abc', b'defg', b'hij']
+], ids=['bytes', 'iterable'])
+def test_chunked(source):
+    assert list(chunked(source, 4)) == [b'abcd', b'efgh', b'ij']
+
+
+def test_replay_privmsg_storm():
+    stats = replay(chunked(privmsg_storm(1000, senders=10), 1000))
+    assert stats.lines == 1000
+    assert stats.events == 1000
+    assert stats.errors == 0
+    assert stats.bytes == sum(len(line) for line in privmsg_storm(1000, senders=10))
+    assert stats.lines_per_second > 0
+    assert 0 < stats.percentile(50) <= stats.percentile(99)
+
+
+def test_replay_server_connection():
+    connection = IRCServerConnection('client.example.org', IRCServer('irc.example.org'))
+    stats = replay(chunked(netsplit_burst(50), 100), connection)
+    assert stats.events == 50
+
+
+def test_replay_counts_errors():
+    stats = replay([b'FROBNICATE\r\n', b'PING foo\r\n'])
+    assert stats.lines == 2
+    assert stats.events == 1
+    assert stats.errors == 1
+
+
+def test_replay_trace_memory():
+    pytest.importorskip('tracemalloc')
+    stats = replay(chunked(privmsg_storm(100), 512), trace_memory=True)
+    assert stats.memory_peak >= 0
+    assert 'bytes peak' in stats.format()
+
+
+def test_log_and_capture_sources(tmpdir):
+    path = tmpdir.join('capture.log')
+    path.write_binary(b'PING foo\n\n:server PONG foo\r\n')
+    assert list(read_log(str(path))) == [b'PING foo\r\n', b':server PONG foo\r\n']
+
+    capture = map_capture(str(path))
+    assert b''.join(chunked(capture, 3)) == path.read_binary()
+    capture.close()
+
+
+def test_main_capture(tmpdir, capsys):
+    path = tmpdir.join('capture.log')
+    path.write_binary(b'PING foo\r\n' * 10)
+    main(['--capture', str(path), '--chunk-size', '7'])
+    out = capsys.readouterr()[0]
+    assert 'lines:      10 (10 events, 0 errors)' in out
+
+
+def test_percentile():
+    stats = ReplayStats()
+    assert stats.percentile(99) == 0.0
+    stats.latencies = [float(i) for i in range(1, 101)]
+    assert stats.percentile(50) == 50.0
+    assert stats.percentile(99) == 99.0
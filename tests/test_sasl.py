@@ -0,0 +1,173 @@
+from __future__ import unicode_literals
+
+import base64
+
+import pytest
+
+from ircproto.connection import IRCClientConnection
+from ircproto.exceptions import ProtocolError
+from ircproto.sasl import (
+    PlainMechanism, ScramSHA256Mechanism, encode_payload, scram_key_cache)
+
+# Test vector from RFC 7677
+client_nonce = 'rOprNGfwEbeRWgbNEkqO'
+server_first = (b'r=rOprNGfwEbeRWgbNEkqO%hvYDpWUa2RaTCAfuxFIlj)hNlF$k0,'
+                b's=W22ZaJ0SNY7soEsUEjb6gQ==,i=4096')
+client_final = (b'c=biws,r=rOprNGfwEbeRWgbNEkqO%hvYDpWUa2RaTCAfuxFIlj)hNlF$k0,'
+                b'p=dHzbZapWIk4jUhN+Ute9ytag9zjfMHgsqmmiz7AndVQ=')
+server_final = b'v=6rriTRBi23WpRR/wtup+mMhUZUn/dB5nLTJRsjl95G4='
+
+
+@pytest.mark.parametrize('length, expected', [
+    (0, ['+']),
+    (3, ['AAAA']),
+    (300, ['A' * 400, '+']),
+    (303, ['A' * 400, 'AAAA'])
+], ids=['empty', 'short', 'exact', 'long'])
+def test_encode_payload(length, expected):
+    assert encode_payload(b'\0' * length) == expected
+
+
+def test_scram():
+    scram_key_cache.clear()
+    mechanism = ScramSHA256Mechanism('user', 'pencil', client_nonce)
+    assert mechanism.respond(b'') == b'n,,n=user,r=rOprNGfwEbeRWgbNEkqO'
+    assert mechanism.respond(server_first) == client_final
+    assert mechanism.respond(server_final) == b''
+    assert len(scram_key_cache) == 1
+    assert b'pencil' not in next(iter(scram_key_cache))
+
+    # The derived keys are reused for the same credentials
+    mechanism = ScramSHA256Mechanism('user', 'pencil', client_nonce)
+    mechanism.respond(b'')
+    assert mechanism.respond(server_first) == client_final
+    assert len(scram_key_cache) == 1
+
+
+def test_scram_bad_server_signature():
+    mechanism = ScramSHA256Mechanism('user', 'pencil', client_nonce)
+    mechanism.respond(b'')
+    mechanism.respond(server_first)
+    exc = pytest.raises(ProtocolError, mechanism.respond, b'v=AAAA')
+    assert str(exc.value) == 'IRC protocol violation: invalid SCRAM server signature'
+
+
+def test_scram_nonce_mismatch():
+    mechanism = ScramSHA256Mechanism('user', 'pencil', client_nonce)
+    mechanism.respond(b'')
+    pytest.raises(ProtocolError, mechanism.respond, b'r=other,s=W22ZaJ0SNY7soEsUEjb6gQ==,i=4096')
+
+
+def test_scram_fresh_nonce():
+    mechanism = ScramSHA256Mechanism('user', 'pencil')
+    first = mechanism.respond(b'')
+    nonce = mechanism.nonce
+    assert first == ('n,,n=user,r=' + nonce).encode('ascii')
+    assert mechanism.respond(b'') != first
+    assert mechanism.nonce != nonce
+
+
+@pytest.mark.parametrize('challenge', [
+    b'\xff',
+    b'garbage',
+    b'v=A',
+    b's=W22ZaJ0SNY7soEsUEjb6gQ=='
+], ids=['utf8', 'attributes', 'base64', 'missing'])
+def test_scram_invalid_server_final(challenge):
+    mechanism = ScramSHA256Mechanism('user', 'pencil', client_nonce)
+    mechanism.respond(b'')
+    mechanism.respond(server_first)
+    exc = pytest.raises(ProtocolError, mechanism.respond, challenge)
+    assert str(exc.value) == 'IRC protocol violation: invalid SCRAM server-final message'
+
+
+def test_scram_invalid_server_first():
+    mechanism = ScramSHA256Mechanism('user', 'pencil', client_nonce)
+    mechanism.respond(b'')
+    exc = pytest.raises(ProtocolError, mechanism.respond, b'\xff')
+    assert str(exc.value) == 'IRC protocol violation: invalid SCRAM server-first message'
+
+
+def authenticate_scram(mechanism):
+    conn = IRCClientConnection(sasl=mechanism)
+    conn.negotiate_capabilities()
+    conn.feed_data(b':irc.example.org CAP * LS :sasl\r\n:irc.example.org CAP * ACK sasl\r\n'
+                   b'AUTHENTICATE +\r\n')
+    assert conn.data_to_send().endswith(
+        b'AUTHENTICATE ' + base64.b64encode(b'n,,n=user,r=' + client_nonce.encode('ascii')) +
+        b'\r\n')
+    conn.feed_data(b'AUTHENTICATE ' + base64.b64encode(server_first) + b'\r\n')
+    assert conn.data_to_send() == b'AUTHENTICATE ' + base64.b64encode(client_final) + b'\r\n'
+    return conn
+
+
+def test_scram_reconnect():
+    mechanism = ScramSHA256Mechanism('user', 'pencil', client_nonce)
+    for _ in range(2):
+        conn = authenticate_scram(mechanism)
+        conn.feed_data(b'AUTHENTICATE ' + base64.b64encode(server_final) + b'\r\n')
+        assert conn.data_to_send() == b'AUTHENTICATE +\r\n'
+        conn.feed_data(b':irc.example.org 903 * :SASL authentication successful\r\n')
+        assert conn.sasl_state == 'success'
+        assert conn.data_to_send() == b'CAP END\r\n'
+
+
+def test_scram_malformed_server_final():
+    conn = authenticate_scram(ScramSHA256Mechanism('user', 'pencil', client_nonce))
+    pytest.raises(ProtocolError, conn.feed_data, b'AUTHENTICATE //8=\r\n')
+    assert conn.sasl_state == 'failed'
+    assert conn.data_to_send() == b'AUTHENTICATE *\r\nCAP END\r\n'
+
+
+def test_sasl_plain_during_registration():
+    conn = IRCClientConnection(sasl=PlainMechanism('jilles', 'sesame'))
+    conn.negotiate_capabilities()
+    conn.feed_data(b':irc.example.org CAP * LS :sasl=PLAIN,EXTERNAL\r\n')
+    assert conn.data_to_send() == b'CAP LS 302\r\nCAP REQ sasl\r\n'
+
+    conn.feed_data(b':irc.example.org CAP * ACK sasl\r\n')
+    assert conn.data_to_send() == b'AUTHENTICATE PLAIN\r\n'
+
+    conn.feed_data(b'AUTHENTICATE +\r\n')
+    expected = base64.b64encode(b'\0jilles\0sesame')
+    assert conn.data_to_send() == b'AUTHENTICATE ' + expected + b'\r\n'
+
+    conn.feed_data(b':irc.example.org 903 * :SASL authentication successful\r\n')
+    assert conn.sasl_state == 'success'
+    assert conn.data_to_send() == b'CAP END\r\n'
+
+
+def test_sasl_failure():
+    conn = IRCClientConnection(sasl=PlainMechanism('jilles', 'wrong'))
+    conn.negotiate_capabilities()
+    conn.feed_data(b':irc.example.org CAP * LS :sasl\r\n:irc.example.org CAP * ACK sasl\r\n'
+                   b'AUTHENTICATE +\r\n')
+    conn.data_to_send()
+    conn.feed_data(b':irc.example.org 904 * :SASL authentication failed\r\n')
+    assert conn.sasl_state == 'failed'
+    assert conn.data_to_send() == b'CAP END\r\n'
+
+
+def test_sasl_unsupported_mechanism():
+    conn = IRCClientConnection(sasl=ScramSHA256Mechanism('user', 'pencil'))
+    conn.negotiate_capabilities()
+    conn.feed_data(b':irc.example.org CAP * LS :sasl=PLAIN,EXTERNAL\r\n')
+    assert conn.data_to_send() == b'CAP LS 302\r\nCAP END\r\n'
+
+
+def test_sasl_chunked_challenge():
+    class EchoMechanism(PlainMechanism):
+        __slots__ = ()
+
+        def respond(self, challenge):
+            return challenge
+
+    conn = IRCClientConnection(sasl=EchoMechanism('a', 'b'))
+    conn.negotiate_capabilities()
+    conn.feed_data(b':irc.example.org CAP * LS :sasl\r\n:irc.example.org CAP * ACK sasl\r\n')
+    conn.data_to_send()
+    conn.feed_data(b'AUTHENTICATE ' + b'A' * 400 + b'\r\n')
+    assert conn.data_to_send() == b''
+    conn.feed_data(b'AUTHENTICATE +\r\n')
+    assert conn.data_to_send() == (b'AUTHENTICATE ' + b'A' * 400 + b'\r\n'
+                                   b'AUTHENTICATE +\r\n')
@@ -0,0 +1,91 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import pytest
+
+from ircproto.events import CTCPDCC, Join, Mode, PrivateMessage, Reply, decode_event
+from ircproto.serialization import (
+    deserialize_event, deserialize_events, read_value, serialize_event, serialize_events,
+    write_value)
+
+lines = [
+    b':foo!bar@blah PRIVMSG #channel :hello there',
+    b'@time=2017-01-01T00:00:00.000Z :foo!bar@blah NOTICE #channel :caf\xc3\xa9',
+    b':foo!bar@blah PRIVMSG me :\x01DCC SEND file.txt 3232235777 5000 1024\x01',
+    b':foo!bar@blah PRIVMSG #channel :\x01ACTION waves\x01',
+    b':irc.example.org 353 foo = #channel :@op +voice nick',
+    b':irc.example.org MODE #channel +ov-l nick1 nick2',
+    b':irc.example.org CAP * LS * :multi-prefix sasl=PLAIN',
+    b'PING irc.example.org',
+    b'USER guest 0 * :Real Name'
+]
+
+
+@pytest.mark.parametrize('line', lines)
+def test_roundtrip(line):
+    event = decode_event(bytearray(line + b'\r\n'))
+    restored = deserialize_event(serialize_event(event))
+    assert type(restored) is type(event)
+    assert restored.encode() == event.encode()
+
+
+def test_roundtrip_batch():
+    events = [decode_event(bytearray(line + b'\r\n')) for line in lines]
+    restored = deserialize_events(serialize_events(events))
+    assert [event.encode() for event in restored] == [event.encode() for event in events]
+
+
+def test_fields():
+    events = [Mode('irc.example.org', '#channel', '+ov', 'nick1', 'nick2'),
+              CTCPDCC('foo!bar@blah', 'me', 'SEND', 'my file.txt', '192.168.1.1', 5000, 1024),
+              Reply('irc.example.org', 332, 'foo #channel :the topic')]
+    events[2].tags = {'label': 'x y'}
+    assert events[2].topic == 'the topic'
+    mode, dcc, reply = deserialize_events(serialize_events(events))
+    assert mode.modeparams == ('nick1', 'nick2')
+    assert dcc.port == 5000
+    assert dcc.size == 1024
+    assert dcc.address == '192.168.1.1'
+    assert reply.code == 332
+    assert reply.get_tag('label') == 'x y'
+    assert reply.topic == 'the topic'
+
+
+def test_interned_senders():
+    events = [PrivateMessage('foo!bar@blah.example.org', '#channel', 'hi')] * 2
+    data = serialize_events(events)
+    assert data.count(b'foo!bar@blah.example.org') == 1
+    assert deserialize_events(data)[1].sender == 'foo!bar@blah.example.org'
+
+
+def test_empty_batch():
+    assert deserialize_events(serialize_events([])) == []
+
+
+def test_unsupported_event():
+    pytest.raises(TypeError, serialize_event, object())
+
+
+@pytest.mark.parametrize('data', [b'', b'\x63\x01', b'\x01\x01\x00'],
+                         ids=['empty', 'version', 'truncated'])
+def test_invalid_data(data):
+    pytest.raises(ValueError, deserialize_events, data)
+
+
+def test_truncated_final_string():
+    data = serialize_event(Join(None, '#channel'))
+    exc = pytest.raises(ValueError, deserialize_events, data[:-1])
+    assert str(exc.value) == 'truncated serialized data'
+
+
+@pytest.mark.parametrize('value', ['text', b'bytes'], ids=['string', 'bytes'])
+def test_read_value_truncated(value):
+    buffer = bytearray()
+    write_value(buffer, value)
+    exc = pytest.raises(ValueError, read_value, buffer[:-1], 0)
+    assert str(exc.value) == 'truncated serialized data'
+
+
+def test_trailing_data():
+    data = serialize_event(Join(None, '#channel'))
+    pytest.raises(ValueError, deserialize_events, data + b'\x00')
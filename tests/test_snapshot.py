@@ -0,0 +1,132 @@
+from __future__ import unicode_literals
+
+import io
+
+import pytest
+
+from ircproto.connection import IRCServerConnection
+from ircproto.events import Join, Mode
+from ircproto.modes import mode_bits
+from ircproto.snapshot import Journal, Snapshot, read_journal, write_snapshot
+from ircproto.states import IRCServer
+
+
+def make_client(server, nickname):
+    connection = IRCServerConnection('%s.example.org' % nickname, server)
+    connection.nickname = nickname
+    connection.username = '~' + nickname
+    server.add_client_connection(connection)
+    return connection
+
+
+def reconnect(server):
+    def connection_factory(prefix):
+        nickname, _, userhost = prefix.partition('!')
+        username, _, host = userhost.partition('@')
+        if nickname != 'gone':
+            connection = IRCServerConnection(host, server)
+            connection.nickname = nickname
+            connection.username = username
+            return connection
+
+    return connection_factory
+
+
+@pytest.fixture
+def server():
+    server = IRCServer('irc.example.org')
+    alice = make_client(server, 'alice')
+    bob = make_client(server, 'bob')
+    gone = make_client(server, 'gone')
+    server.handle_join(alice, Join(None, '#chan'))
+    server.handle_join(bob, Join(None, '#chan'))
+    server.handle_join(gone, Join(None, '#chan'))
+    server.handle_join(bob, Join(None, '#other'))
+    server.handle_mode(alice, Mode(None, '#chan', '+vkb', 'bob', 'secret', '*!*@spam.org'))
+    server.channels['#chan'].topic = 'hello world'
+    return server
+
+
+def test_snapshot_restore(server):
+    buffer = io.BytesIO()
+    write_snapshot(server, buffer)
+    snapshot = Snapshot(buffer.getvalue())
+    assert snapshot.host == 'irc.example.org'
+    assert sorted(snapshot.channel_names) == ['#chan', '#other']
+    assert sorted(snapshot.clients) == ['alice!~alice@alice.example.org',
+                                        'bob!~bob@bob.example.org', 'gone!~gone@gone.example.org']
+
+    restored = IRCServer('irc.example.org')
+    snapshot.restore(restored, connection_factory=reconnect(restored))
+    channel = restored.channels['#chan']
+    assert [conn.nickname for conn in channel.users] == ['alice', 'bob']
+    assert channel.is_operator('alice')
+    assert channel.member_modes['bob'] == server.channels['#chan'].member_modes['bob']
+    assert 'gone' not in channel.member_modes
+    assert channel.key == 'secret'
+    assert channel.bans == ['*!*@spam.org']
+    assert channel.mode_lists['b'] is channel.bans
+    assert channel.topic == 'hello world'
+    assert channel.modes == server.channels['#chan'].modes
+    assert channel.ts == server.channels['#chan'].ts
+
+
+def test_restore_without_connections(server):
+    buffer = io.BytesIO()
+    write_snapshot(server, buffer)
+    restored = IRCServer('irc.example.org')
+    Snapshot(buffer.getvalue()).restore(restored)
+    assert restored.channels['#chan'].users == []
+    assert restored.channels['#chan'].member_modes == {}
+    assert restored.channels['#chan'].bans == ['*!*@spam.org']
+
+
+def test_open_mmap(server, tmpdir):
+    path = tmpdir.join('state.snapshot')
+    with path.open('wb') as f:
+        write_snapshot(server, f)
+
+    snapshot = Snapshot.open(str(path))
+    assert snapshot.load_channel('#other').member_modes == {'bob': mode_bits['o']}
+
+
+def test_journal(server):
+    snapshot_buffer = io.BytesIO()
+    write_snapshot(server, snapshot_buffer)
+
+    journal_buffer = io.BytesIO()
+    server.journal = Journal(journal_buffer)
+    alice = server.nicknames['alice']
+    carol = make_client(server, 'carol')
+    server.handle_join(carol, Join(None, '#chan'))
+    server.handle_join(carol, Join(None, '#new'))
+    server.handle_mode(alice, Mode(None, '#chan', '+o-k', 'carol', 'secret'))
+    server.handle_mode(carol, Mode(None, '#chan', '+l', '10'))
+    server.journal.topic_changed(server.channels['#chan'])
+    assert len(read_journal(journal_buffer.getvalue())) == 6
+
+    # Simulate a crash in the middle of writing a record
+    journal = journal_buffer.getvalue()[:-1]
+    restored = IRCServer('irc.example.org')
+    Snapshot(snapshot_buffer.getvalue()).restore(restored, journal, reconnect(restored))
+    channel = restored.channels['#chan']
+    assert [conn.nickname for conn in channel.users] == ['alice', 'bob', 'carol']
+    assert channel.is_operator('carol')
+    assert channel.key is None
+    assert channel.limit == 10
+    assert [conn.nickname for conn in restored.channels['#new'].users] == ['carol']
+
+
+def test_journal_reset():
+    journal = Journal(io.BytesIO())
+    server = IRCServer('irc.example.org')
+    server.journal = journal
+    server.handle_join(make_client(server, 'alice'), Join(None, '#chan'))
+    journal.reset()
+    assert journal.fileobj.getvalue() == b''
+
+
+@pytest.mark.parametrize('data', [b'', b'IRCSNAP\x63', b'IRCSNAP\x01\x05'],
+                         ids=['empty', 'version', 'truncated'])
+def test_invalid_snapshot(data):
+    pytest.raises(ValueError, Snapshot, data)
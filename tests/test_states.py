@@ -0,0 +1,57 @@
+import pytest
+
+from ircproto.connection import IRCServerConnection
+from ircproto.constants import ERR_NOSUCHCHANNEL
+from ircproto.events import Join
+from ircproto.states import IRCServer
+
+
+def make_client(server, nickname):
+    connection = IRCServerConnection('%s.example.org' % nickname, server)
+    connection.nickname = nickname
+    connection.username = '~' + nickname
+    server.add_client_connection(connection)
+    return connection
+
+
+def test_send_event():
+    connection = IRCServerConnection('alice.example.org', IRCServer('irc.example.org'))
+    connection.send_event(Join('bob!~bob@bob.example.org', '#chan'))
+    assert connection.data_to_send() == b':bob!~bob@bob.example.org JOIN #chan\r\n'
+
+
+@pytest.mark.parametrize('nickname, target', [('alice', b'alice'), (None, b'*')],
+                         ids=['registered', 'unregistered'])
+def test_send_reply_target(nickname, target):
+    connection = IRCServerConnection('alice.example.org', IRCServer('irc.example.org'))
+    connection.nickname = nickname
+    connection.send_reply(ERR_NOSUCHCHANNEL, channel_name='#chan')
+    assert connection.data_to_send() == (b':irc.example.org 403 ' + target +
+                                         b' #chan :No such channel\r\n')
+
+
+def test_handle_join_announces():
+    server = IRCServer('irc.example.org')
+    alice = make_client(server, 'alice')
+    bob = make_client(server, 'bob')
+    server.handle_join(alice, Join(None, '#chan'))
+    server.channels['#chan'].topic = 'hello world'
+    alice.data_to_send()
+
+    server.handle_join(bob, Join(None, '#chan'))
+    assert server.channels['#chan'].users == [alice, bob]
+    assert alice.data_to_send() == b':bob!~bob@bob.example.org JOIN #chan\r\n'
+    assert bob.data_to_send() == (b':bob!~bob@bob.example.org JOIN #chan\r\n'
+                                  b':irc.example.org 332 bob #chan :hello world\r\n')
+
+
+def test_handle_join_channel_full():
+    server = IRCServer('irc.example.org')
+    alice = make_client(server, 'alice')
+    bob = make_client(server, 'bob')
+    server.handle_join(alice, Join(None, '#chan'))
+    server.channels['#chan'].limit = 1
+
+    server.handle_join(bob, Join(None, '#chan'))
+    assert server.channels['#chan'].users == [alice]
+    assert bob.data_to_send() == b':irc.example.org 471 bob #chan :Cannot join channel (+l)\r\n'
@@ -1,6 +1,8 @@
 import pytest
 
-from ircproto.styles import styled, IRCTextColor, IRCTextStyle, strip_styles
+from ircproto.styles import (
+    styled, compile_style, IRCTextColor, IRCTextStyle, strip_styles, tokenize_styles,
+    styles_to_html, styles_to_ansi, plain_state)
 
 
 @pytest.mark.parametrize('args, expected', [
@@ -15,10 +17,62 @@ def test_styled(args, expected):
     assert styled(*args) == expected
 
 
+def test_styled_canonical_order():
+    assert styled('test', styles=[IRCTextStyle.italic, IRCTextStyle.bold]) == '\x02\x1dtest\x0f'
+
+
+def test_styled_color_numbers():
+    assert styled('test', 11, 4) == '\x0311,4test\x03'
+
+
+def test_compile_style():
+    template = compile_style(IRCTextColor.cyan, styles=[IRCTextStyle.bold])
+    assert compile_style(IRCTextColor.cyan, styles=[IRCTextStyle.bold]) is template
+    assert template('foo') == '\x02\x0311foo\x03\x0f'
+    assert template.prefix == '\x02\x0311'
+    assert template.suffix == '\x03\x0f'
+
+
 @pytest.mark.parametrize('text, expected', [
     ('abc def \x0311test\x03 xyz', 'abc def test xyz'),
     ('\x0311,4blah\x03 text \x02bold', 'blah text bold'),
-    ('\x0311all colors', 'all colors')
+    ('\x0311all colors', 'all colors'),
+    ('\x0304,12two digits', 'two digits'),
+    ('\x03123 digits', '3 digits'),
+    ('\x0312,comma', ',comma'),
+    ('\x04ff0000,00FF00hex colors\x04', 'hex colors'),
+    ('\x1estrike\x11mono', 'strikemono')
 ])
 def test_strip_styles(text, expected):
     assert strip_styles(text) == expected
+
+
+def test_strip_styles_unformatted():
+    text = 'nothing to see here'
+    assert strip_styles(text) is text
+
+
+def test_tokenize_styles():
+    spans = list(tokenize_styles('a\x02b\x0304,12c\x03d\x0fe'))
+    assert [span for span, state in spans] == ['a', 'b', 'c', 'd', 'e']
+    assert spans[0][1] == plain_state
+    assert spans[1][1] == plain_state._replace(bold=True)
+    assert spans[2][1] == plain_state._replace(bold=True, foreground=4, background=12)
+    assert spans[3][1] == plain_state._replace(bold=True)
+    assert spans[4][1].is_plain
+
+
+def test_tokenize_styles_default_color():
+    spans = list(tokenize_styles('\x0304,12a\x0399b'))
+    assert spans[1][1].foreground is None
+    assert spans[1][1].background == 12
+
+
+def test_styles_to_html():
+    assert styles_to_html('<\x02b\x02 \x0304red') == (
+        '&lt;<span style="font-weight: bold">b</span> <span style="color: #ff0000">red</span>')
+
+
+def test_styles_to_ansi():
+    assert styles_to_ansi('\x02b\x02 \x0304,88red\x0f.') == (
+        '\x1b[0;1mb\x1b[0m \x1b[0;38;5;9;48;2;0;0;0mred\x1b[0m.')
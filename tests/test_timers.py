@@ -0,0 +1,228 @@
+from __future__ import unicode_literals
+
+import random
+
+import pytest
+
+from ircproto.connection import IRCClientConnection, IRCServerConnection
+from ircproto.states import IRCServer
+from ircproto.timers import ConnectionMonitor, TimerWheel
+
+
+class FakeClock(object):
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def wheel(clock):
+    return TimerWheel(clock=clock)
+
+
+def advance(wheel, clock, seconds, step=1.0):
+    fired = 0
+    target = clock.now + seconds
+    while clock.now < target:
+        clock.now = min(target, clock.now + step)
+        fired += wheel.advance()
+
+    return fired
+
+
+def test_call_later(wheel, clock):
+    calls = []
+    wheel.call_later(5, calls.append, 'a')
+    wheel.call_later(2.5, calls.append, 'b')
+    assert len(wheel) == 2
+    assert advance(wheel, clock, 2) == 0
+    assert advance(wheel, clock, 1) == 1
+    assert calls == ['b']
+    assert advance(wheel, clock, 2) == 1
+    assert calls == ['b', 'a']
+    assert len(wheel) == 0
+
+
+@pytest.mark.parametrize('delay', [1, 255, 256, 300, 16383, 16384, 70000, 1 << 20, 1 << 27],
+                         ids=lambda delay: str(delay))
+def test_long_delays(wheel, clock, delay):
+    # Timers on the higher levels of the wheel cascade down and run on time
+    calls = []
+    timer = wheel.call_later(delay, calls.append, clock.now + delay)
+    assert timer.deadline == 1000 + delay
+    clock.now += delay - 1
+    assert wheel.advance() == 0
+    clock.now += 1
+    assert wheel.advance() == 1
+    assert calls == [clock.now]
+    assert not timer.active
+
+
+def test_random_timers(wheel, clock):
+    # Every timer runs on the first advance at or after its deadline, never before
+    rng = random.Random(1)
+    previous = [clock.now]
+    fired = []
+    timers = []
+    for _ in range(2000):
+        when = clock.now + rng.choice([rng.uniform(0, 300), rng.uniform(0, 100000)])
+        timer = wheel.call_at(when, lambda when: fired.append((previous[0], when, clock.now)),
+                              when)
+        timers.append(timer)
+
+    for timer in timers[::7]:
+        timer.cancel()
+
+    while len(wheel):
+        previous[0] = clock.now
+        clock.now += rng.choice([1, 1, 1, 37, 500, 3000])
+        wheel.advance()
+
+    assert len(fired) == len(timers) - len(timers[::7])
+    for previous_advance, when, fired_at in fired:
+        assert when <= fired_at
+        assert previous_advance < when + 1  # it did not expire on the previous advance
+
+
+def test_cancel(wheel, clock):
+    calls = []
+    timer = wheel.call_later(10, calls.append, 'a')
+    wheel.call_later(10, calls.append, 'b')
+    timer.cancel()
+    timer.cancel()
+    assert len(wheel) == 1
+    assert advance(wheel, clock, 10) == 1
+    assert calls == ['b']
+
+
+def test_schedule_from_callback(wheel, clock):
+    calls = []
+
+    def callback():
+        calls.append(clock.now)
+        if len(calls) < 3:
+            wheel.call_later(0, callback)
+
+    wheel.call_later(1, callback)
+    advance(wheel, clock, 5)
+    assert calls == [1001.0, 1002.0, 1003.0]
+
+
+def test_callback_exception(wheel, clock):
+    calls = []
+
+    def fail():
+        raise RuntimeError('boom')
+
+    wheel.call_later(1, fail)
+    wheel.call_later(1, calls.append, 'a')
+    clock.now += 1
+    pytest.raises(RuntimeError, wheel.advance)
+    assert wheel.advance() == 1
+    assert calls == ['a']
+
+
+def test_idle_skip(wheel, clock):
+    clock.now += 1e9
+    assert wheel.advance() == 0
+    calls = []
+    wheel.call_later(1, calls.append, 'a')
+    clock.now += 1
+    assert wheel.advance() == 1
+
+
+@pytest.fixture
+def monitor(wheel):
+    events = []
+    monitor = ConnectionMonitor(wheel, lambda conn, reason: events.append((conn, reason)),
+                                ping_interval=60, ping_timeout=30, registration_timeout=20,
+                                max_penalty=10,
+                                on_resume=lambda conn: events.append((conn, 'resume')))
+    return monitor, events
+
+
+def make_connection(nickname='alice'):
+    connection = IRCServerConnection('alice.example.org', IRCServer('irc.example.org'))
+    connection.nickname = nickname
+    connection.username = nickname and '~' + nickname
+    return connection
+
+
+def test_ping_timeout(monitor, wheel, clock):
+    monitor, events = monitor
+    connection = make_connection()
+    monitor.add(connection)
+    advance(wheel, clock, 30)
+    monitor.data_received(connection)
+    advance(wheel, clock, 59)
+    assert connection.data_to_send() == b''
+
+    advance(wheel, clock, 1)
+    assert connection.data_to_send() == b'PING 1090\r\n'
+    advance(wheel, clock, 29)
+    assert events == []
+    advance(wheel, clock, 1)
+    assert events == [(connection, 'ping timeout')]
+    assert len(monitor) == 0
+    assert len(wheel) == 0
+
+
+def test_ping_answered(monitor, wheel, clock):
+    monitor, events = monitor
+    connection = IRCClientConnection()
+    connection.registration_state = 'registered'
+    monitor.add(connection)
+    advance(wheel, clock, 60)
+    assert connection.data_to_send() == b'PING 1060\r\n'
+    advance(wheel, clock, 10)
+    monitor.data_received(connection)
+    advance(wheel, clock, 60)
+    assert events == []
+    assert connection.data_to_send() == b'PING 1130\r\n'
+
+
+def test_registration_timeout(monitor, wheel, clock):
+    monitor, events = monitor
+    registered = make_connection()
+    unregistered = make_connection(None)
+    monitor.add(registered)
+    monitor.add(unregistered)
+    advance(wheel, clock, 20)
+    assert events == [(unregistered, 'registration timeout')]
+    assert len(monitor) == 1
+
+
+def test_penalty(monitor, wheel, clock):
+    monitor, events = monitor
+    connection = make_connection()
+    monitor.add(connection)
+    assert not monitor.add_penalty(connection, 8)
+    assert monitor.add_penalty(connection, 4)
+    assert monitor.is_throttled(connection)
+    advance(wheel, clock, 1)
+    assert monitor.add_penalty(connection, 2)
+    advance(wheel, clock, 2)
+    assert events == []
+    advance(wheel, clock, 1)
+    assert events == [(connection, 'resume')]
+    assert not monitor.is_throttled(connection)
+
+
+def test_remove(monitor, wheel, clock):
+    monitor, events = monitor
+    connection = make_connection(None)
+    monitor.add(connection)
+    monitor.add_penalty(connection, 20)
+    monitor.remove(connection)
+    monitor.remove(connection)
+    monitor.data_received(connection)
+    assert len(wheel) == 0
+    advance(wheel, clock, 100)
+    assert events == []
@@ -0,0 +1,116 @@
+from __future__ import unicode_literals
+
+import pytest
+
+from ircproto.connection import IRCClientConnection
+from ircproto.tracker import StateTracker
+
+
+@pytest.fixture
+def tracker():
+    return StateTracker()
+
+
+@pytest.fixture
+def connection(tracker):
+    conn = IRCClientConnection(tracker=tracker)
+    conn.register('me', 'user', 'Real Name')
+    conn.feed_data(b':irc.example.org 001 me :Welcome to the Internet Relay Network me!u@h\r\n'
+                   b':me!user@host JOIN #Channel\r\n'
+                   b':irc.example.org 332 me #channel :The topic\r\n'
+                   b':irc.example.org 353 me = #channel :me @Op +Voice @+Both\r\n'
+                   b':irc.example.org 366 me #channel :End of NAMES list\r\n')
+    return conn
+
+
+def test_names(connection, tracker):
+    channel = tracker.get_channel('#CHANNEL')
+    assert channel.name == '#Channel'
+    assert channel.topic == 'The topic'
+    assert channel.members == {'me': '', 'op': 'o', 'voice': 'v', 'both': 'ov'}
+    assert tracker.is_op('#channel', 'OP')
+    assert tracker.is_op('#channel', 'both')
+    assert not tracker.is_op('#channel', 'voice')
+    assert tracker.has_mode('#channel', 'voice', 'v')
+    assert not tracker.is_on_channel('nobody', '#channel')
+
+
+def test_join_part(connection, tracker):
+    connection.feed_data(b':new!u@host.example.org JOIN #channel\r\n')
+    user = tracker.get_user('NEW')
+    assert user.host == 'host.example.org'
+    assert tracker.is_on_channel('new', '#channel')
+
+    connection.feed_data(b':new!u@host.example.org PART #channel :bye\r\n')
+    assert not tracker.is_on_channel('new', '#channel')
+    assert tracker.get_user('new') is None
+
+
+def test_quit(connection, tracker):
+    connection.feed_data(b':op!u@h QUIT :gone\r\n')
+    assert tracker.get_user('op') is None
+    assert 'op' not in tracker.get_channel('#channel').members
+
+
+def test_nick(connection, tracker):
+    connection.feed_data(b':op!u@h NICK :op[away]\r\n')
+    assert tracker.is_op('#channel', 'OP{AWAY}')
+    assert tracker.get_user('op{away}').nickname == 'op[away]'
+
+
+def test_own_nick_different_case(connection, tracker):
+    connection.feed_data(b':ME!user@host NICK :Other\r\n')
+    assert connection.nickname == 'Other'
+
+    connection.feed_data(b':Other!user@host PART #channel\r\n')
+    assert tracker.channels == {}
+
+
+def test_kick_self(connection, tracker):
+    connection.feed_data(b':op!u@h KICK #channel me :out\r\n')
+    assert tracker.channels == {}
+    assert tracker.users == {}
+
+
+def test_modes(connection, tracker):
+    connection.feed_data(b':op!u@h MODE #channel +ntk-o+bl key both *!*@spam 10\r\n')
+    channel = tracker.get_channel('#channel')
+    assert channel.modes == {'n', 't'}
+    assert channel.mode_params == {'k': 'key', 'l': '10'}
+    assert not tracker.is_op('#channel', 'both')
+    assert tracker.has_mode('#channel', 'both', 'v')
+
+    connection.feed_data(b':op!u@h MODE #channel -lk+v key me\r\n')
+    assert channel.mode_params == {}
+    assert tracker.has_mode('#channel', 'me', 'v')
+
+
+def test_who(connection, tracker):
+    connection.feed_data(b':irc.example.org 352 me #channel ident some.host irc.example.org '
+                         b'Voice H@ :0 Voice User\r\n')
+    user = tracker.get_user('voice')
+    assert user.username == 'ident'
+    assert user.host == 'some.host'
+    assert user.realname == 'Voice User'
+    assert tracker.is_op('#channel', 'voice')
+    assert not tracker.has_mode('#channel', 'voice', 'v')
+
+
+@pytest.mark.parametrize('line', [
+    b':irc.example.org 352 me #channel\r\n',
+    b':irc.example.org 324 me\r\n',
+    b':irc.example.org 324 me #channel\r\n',
+    b':op!u@h MODE #channel +o\r\n'
+], ids=['who', 'channelmodeis_no_channel', 'channelmodeis_no_modes', 'mode'])
+def test_truncated(connection, tracker, line):
+    connection.feed_data(line)
+    channel = tracker.get_channel('#channel')
+    assert channel.members == {'me': '', 'op': 'o', 'voice': 'v', 'both': 'ov'}
+    assert channel.modes == set()
+
+
+def test_truncated_names(connection, tracker):
+    connection.feed_data(b':irc.example.org 353 me = #channel\r\n'
+                         b':irc.example.org 353 me = #channel :me @Op\r\n'
+                         b':irc.example.org 366 me #channel :End of NAMES list\r\n')
+    assert tracker.get_channel('#channel').members == {'me': '', 'op': 'o'}
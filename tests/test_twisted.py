@@ -0,0 +1,99 @@
+import pytest
+
+pytest.importorskip('twisted')
+
+from twisted.internet.address import IPv4Address  # noqa: E402
+
+try:
+    from twisted.internet.testing import StringTransport
+except ImportError:
+    from twisted.test.proto_helpers import StringTransport
+
+from ircproto.events import Ping  # noqa: E402
+from ircproto.states import IRCServer  # noqa: E402
+from ircproto.twisted import IRCClientProtocol, IRCServerFactory  # noqa: E402
+
+
+class RecordingTransport(StringTransport):
+    def __init__(self):
+        super(RecordingTransport, self).__init__()
+        self.write_calls = []
+
+    def writeSequence(self, data):
+        self.write_calls.append(list(data))
+        super(RecordingTransport, self).writeSequence(data)
+
+
+@pytest.fixture
+def transport():
+    return RecordingTransport()
+
+
+@pytest.fixture
+def client(transport):
+    protocol = IRCClientProtocol()
+    protocol.makeConnection(transport)
+    return protocol
+
+
+def test_registers_as_streaming_producer(client, transport):
+    assert transport.producer is client
+    assert transport.streaming
+
+
+def test_ping_reply(client, transport):
+    events = []
+    client.event_received = events.append
+    client.dataReceived(b'PING foo.example.org\r\n')
+    assert transport.value() == b'PONG foo.example.org\r\n'
+    assert isinstance(events[0], Ping)
+
+
+def test_batched_writes_while_paused(client, transport):
+    client.pauseProducing()
+    client.conn.send_command('NICK', 'foo')
+    client.send_pending()
+    client.conn.send_command('JOIN', '#bar')
+    client.send_pending()
+    assert transport.value() == b''
+
+    client.resumeProducing()
+    assert transport.write_calls == [[b'NICK foo\r\n', b'JOIN #bar\r\n']]
+
+
+def test_reading_paused_on_backlog(client, transport):
+    client.high_water = 20
+    client.low_water = 10
+    client.pauseProducing()
+    client.conn.send_command('PRIVMSG', '#bar', 'this is a long enough message')
+    client.send_pending()
+    assert transport.producerState == 'paused'
+
+    client.resumeProducing()
+    assert transport.producerState == 'producing'
+    assert transport.value() == b'PRIVMSG #bar :this is a long enough message\r\n'
+
+
+def test_protocol_error_aborts(client, transport):
+    client.dataReceived(b'FROBNICATE\r\n')
+    assert transport.disconnecting
+
+
+def test_server_factory_flushes_other_protocols():
+    factory = IRCServerFactory(IRCServer('irc.example.org'))
+    protocols = []
+    for port in (1234, 1235):
+        transport = RecordingTransport()
+        transport.peerAddr = IPv4Address('TCP', '127.0.0.1', port)
+        protocol = factory.buildProtocol(transport.peerAddr)
+        protocol.makeConnection(transport)
+        protocols.append(protocol)
+
+    first, second = protocols
+    second.conn.send_command('NOTICE', 'foo', 'hello')
+    first.dataReceived(b'PING x\r\n')
+    assert first.transport.value() == b'PONG x\r\n'
+    assert second.transport.value() == b'NOTICE foo hello\r\n'
+
+    first.connectionLost()
+    assert factory.protocols == {second}
@@ -1,7 +1,7 @@
 import pytest
 
 from ircproto.exceptions import ProtocolError
-from ircproto.utils import validate_nickname
+from ircproto.utils import casefold, match_hostmask, validate_nickname
 
 
 @pytest.mark.parametrize('name', [
@@ -24,3 +24,27 @@ def test_validate_nickname_invalid(name):
     exc = pytest.raises(ProtocolError, validate_nickname, name)
     assert str(exc.value) == (u'IRC protocol violation: invalid nickname: %s' %
                               name.decode('ascii', errors='backslashreplace'))
+
+
+@pytest.mark.parametrize('casemapping, expected', [
+    ('ascii', 'nick[]\\~'),
+    ('strict-rfc1459', 'nick{}|~'),
+    ('rfc1459', 'nick{}|^')
+])
+def test_casefold(casemapping, expected):
+    assert casefold(u'NiCK[]\\~', casemapping) == expected
+
+
+@pytest.mark.parametrize('prefix, mask, expected', [
+    (b'nick!user@host.example.org', b'*!*@*.example.org', True),
+    (b'nick!user@host.example.org', b'nick!*', True),
+    (b'nick!user@host.example.org', b'n?ck!user@host.example.org', True),
+    (b'nick!user@host.example.org', b'*!*@*.example.com', False),
+    (b'nick!user@host', b'nick!user@host.example.org', False),
+    (b'nick!user@host.example.org', b'*.org*', True),
+    (b'ni*ck!user@host', b'ni\\*ck!*', True),
+    (b'nizck!user@host', b'ni\\*ck!*', False)
+], ids=['wildcards', 'trailing_star', 'question_mark', 'mismatch', 'mask_longer',
+        'backtrack', 'escaped', 'escaped_mismatch'])
+def test_match_hostmask(prefix, mask, expected):
+    assert match_hostmask(prefix, mask) is expected